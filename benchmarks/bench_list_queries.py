@@ -0,0 +1,168 @@
+"""
+Query plans for the ticket list pages, before and after the composite
+indexes added in tickets/migrations/0008_ticket_list_indexes.py.
+
+Migrates a scratch database, drops the indexes added by 0008 (leaving
+the rest of the schema as it is), seeds it with a large number of
+tickets, and prints the EXPLAIN output and the time taken to fetch the
+first page of every list url in tickets/urls.py.  It then adds the
+indexes back and does the same again.
+
+The database in the settings module is migrated and filled with fake
+tickets - only point it at a database you can throw away.  The default
+test settings use an in-memory sqlite database.
+
+usage: python benchmarks/bench_list_queries.py [--tickets 50000]
+           [--settings main.settings.test]
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+INDEXES = "tickets.migrations.0008_ticket_list_indexes"
+
+USERS = 50
+APPLICATIONS = 5
+PAGE_SIZE = 50
+
+
+def seed(n_tickets):
+    """Create the users, applications and n_tickets tickets.  The tickets
+    are inserted with bulk_create - the search index, rendered html and
+    counters are not needed for the query plans."""
+
+    from django.contrib.auth.models import User
+
+    from tickets.models import Application, Ticket
+
+    random.seed(42)
+    User.objects.bulk_create([User(username="user{}".format(i)) for i in range(USERS)])
+    users = list(User.objects.all())
+    Application.objects.bulk_create(
+        [
+            Application(application="App {}".format(i), slug="app-{}".format(i))
+            for i in range(APPLICATIONS)
+        ]
+    )
+    applications = list(Application.objects.all())
+
+    statuses = [x[0] for x in Ticket.TICKET_STATUS_CHOICES]
+    types = ["bug", "feature", "task"]
+    start = datetime(2015, 1, 1)
+
+    # created_on is normally set by auto_now_add - spread the tickets
+    # over several years instead.
+    created_on = Ticket._meta.get_field("created_on")
+    created_on.auto_now_add = False
+    try:
+        batch = []
+        for i in range(n_tickets):
+            batch.append(
+                Ticket(
+                    title="Ticket {}".format(i),
+                    description="Description of ticket {}".format(i),
+                    status=random.choice(statuses),
+                    ticket_type=random.choice(types),
+                    priority=random.randint(1, 5),
+                    active=random.random() > 0.05,
+                    submitted_by=random.choice(users),
+                    assigned_to=random.choice(users + [None] * 10),
+                    application=random.choice(applications),
+                    created_on=start + timedelta(minutes=30 * i),
+                )
+            )
+            if len(batch) == 1000:
+                Ticket.all_tickets.bulk_create(batch)
+                batch = []
+        Ticket.all_tickets.bulk_create(batch)
+    finally:
+        created_on.auto_now_add = True
+
+
+def list_querysets():
+    """Yield the name of each ticket list url and the queryset its view
+    fetches for the first page."""
+
+    from django.test import RequestFactory
+    from django.views.generic import ListView
+
+    from tickets.urls import urlpatterns
+
+    factory = RequestFactory()
+    for pattern in urlpatterns:
+        view_class = getattr(pattern.callback, "view_class", None)
+        if view_class is None or not issubclass(view_class, ListView):
+            continue
+        kwargs = dict(pattern.default_args)
+        if "<str:username>" in str(pattern.pattern):
+            kwargs["username"] = "user7"
+        if "<slug:slug>" in str(pattern.pattern):
+            kwargs["slug"] = "no-such-tag"
+        view = view_class()
+        view.setup(factory.get("/"), **kwargs)
+        yield pattern.name, view.get_queryset()[: PAGE_SIZE + 1]
+
+
+def list_indexes():
+    """Return the indexes added by the 0008 migration."""
+    from importlib import import_module
+
+    from django.db.migrations import AddIndex
+
+    migration = import_module(INDEXES).Migration
+    return [x.index for x in migration.operations if isinstance(x, AddIndex)]
+
+
+def report(label, repeat):
+    print("=" * 72)
+    print(label)
+    print("=" * 72)
+    for name, tickets in list_querysets():
+        seconds = timeit.timeit(lambda: list(tickets.all()), number=repeat) / repeat
+        print("\n{} ({:.2f} ms per page)".format(name, seconds * 1000))
+        print(tickets.explain())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--tickets", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--settings", default="main.settings.test")
+    args = parser.parse_args()
+
+    os.environ["DJANGO_SETTINGS_MODULE"] = args.settings
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    import django
+    from django.core.management import call_command
+    from django.db import connection
+
+    django.setup()
+
+    from tickets.models import Ticket
+
+    # only the list indexes are removed - the later migrations add
+    # columns the models need.
+    call_command("migrate", verbosity=0)
+    indexes = list_indexes()
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.remove_index(Ticket, index)
+    seed(args.tickets)
+
+    report("before: without the 0008 indexes", args.repeat)
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.add_index(Ticket, index)
+    report("after: with the 0008 indexes", args.repeat)
+
+
+if __name__ == "__main__":
+    main()
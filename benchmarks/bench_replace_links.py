@@ -0,0 +1,78 @@
+"""
+A micro-benchmark for tickets.utils.replace_links().
+
+Compares the throughput of the original implementation (which
+compiled every pattern on every call and made one pass over the html
+per pattern) with the precompiled LinkReplacer on increasingly large
+ticket descriptions.
+
+usage: python benchmarks/bench_replace_links.py [--repeat 20]
+
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tickets.utils import replace_links  # noqa: E402
+
+LINK_PATTERNS = [
+    {"pattern": r"ticket:\s?(\d+)", "url": r'<a href="/ticket/\1">ticket \1</a>'},
+    {"pattern": r"issue #(\d+)", "url": r'<a href="/issues/\1">issue #\1</a>'},
+    {"pattern": r"commit ([0-9a-f]{7,40})", "url": r'<a href="/commit/\1">\1</a>'},
+]
+
+PARAGRAPH = (
+    "<p>This looks like the problem reported in ticket: {0} and issue #{0}. "
+    "It was probably introduced by commit 1a2b3c4d, see the traceback "
+    "below for details.</p>\n"
+    "<pre><code>Traceback (most recent call last):\n"
+    '  File "views.py", line {0}, in get_queryset\n'
+    "</code></pre>\n"
+)
+
+
+def original_replace_links(text, link_patterns):
+    """The implementation of replace_links before it was precompiled."""
+    for pattern in link_patterns:
+        regex = re.compile(pattern.get("pattern"), re.IGNORECASE)
+        text = re.sub(regex, pattern["url"], text)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        "{:>10} {:>14} {:>14} {:>8}".format(
+            "size (kB)", "original MB/s", "compiled MB/s", "speedup"
+        )
+    )
+    for paragraphs in [1, 10, 100, 1000, 5000]:
+        html = "".join(PARAGRAPH.format(i) for i in range(paragraphs))
+        megabytes = len(html) / 1e6
+
+        before = timeit.timeit(
+            lambda: original_replace_links(html, LINK_PATTERNS), number=args.repeat
+        )
+        after = timeit.timeit(
+            lambda: replace_links(html, LINK_PATTERNS), number=args.repeat
+        )
+        print(
+            "{:>10.1f} {:>14.1f} {:>14.1f} {:>7.1f}x".format(
+                len(html) / 1e3,
+                megabytes * args.repeat / before,
+                megabytes * args.repeat / after,
+                before / after,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
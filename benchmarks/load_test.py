@@ -0,0 +1,341 @@
+"""
+A load test of every view in tickets/urls.py.
+
+Flushes the benchmark database, seeds it with the test factories
+(tickets with comments and tags), then requests each url repeatedly
+and writes a JSON report of the latency percentiles, query counts and
+response sizes that can be diffed between releases.
+
+The database is selected with the BENCHMARK_DB environment variable
+(see main/settings/benchmark.py):
+
+    python benchmarks/load_test.py --tickets 10000 -o sqlite-10k.json
+    BENCHMARK_DB=postgres python benchmarks/load_test.py --tickets 100000
+
+usage: python benchmarks/load_test.py [--tickets 10000] [--comments 3]
+           [--tags 200] [--requests 20] [--output report.json] [--no-seed]
+
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH_SIZE = 5000
+USERS = 100
+APPLICATIONS = 10
+TAGS_PER_TICKET = 3
+
+STATUSES = ["new", "accepted", "assigned", "re-opened", "closed", "duplicate"]
+TYPES = ["bug", "feature", "task"]
+
+DESCRIPTION = """The {0} page fails when the filter is applied
+
+1. open the page
+2. select a filter
+3. see ticket: {1}
+
+    Traceback (most recent call last):
+      File "views.py", line 42, in get_queryset
+"""
+
+
+def batches(n, size=BATCH_SIZE):
+    """yield the (start, stop) of each batch of size in range(n)"""
+    for start in range(0, n, size):
+        yield start, min(start + size, n)
+
+
+def seed(n_tickets, n_comments, n_tags):
+    """Create the users, applications, tags, tickets and comments with
+    the test factories.  The objects are built (not saved) by the
+    factories and inserted with bulk_create, then the search index and
+    ticket counters are rebuilt in bulk."""
+
+    from django.contrib.auth.models import Group, User
+    from django.contrib.contenttypes.models import ContentType
+    from taggit.models import Tag, TaggedItem
+
+    from tickets.models import (
+        Application,
+        FollowUp,
+        Ticket,
+        render_markdown,
+        text_hash,
+    )
+    from tickets.search import rebuild_index
+    from tickets.tests.factories import (
+        ApplicationFactory,
+        FollowUpFactory,
+        TicketFactory,
+        UserFactory,
+    )
+
+    random.seed(42)
+
+    User.objects.bulk_create(UserFactory.build_batch(USERS))
+    users = list(User.objects.all())
+    admin_group, created = Group.objects.get_or_create(name="admin")
+    users[0].groups.add(admin_group)
+
+    Application.objects.bulk_create(
+        [
+            ApplicationFactory.build(
+                application="Application {}".format(i), slug="application-{}".format(i)
+            )
+            for i in range(APPLICATIONS)
+        ]
+    )
+    applications = list(Application.objects.all())
+
+    Tag.objects.bulk_create(
+        [Tag(name="tag {}".format(i), slug="tag-{}".format(i)) for i in range(n_tags)]
+    )
+    tag_ids = list(Tag.objects.values_list("id", flat=True))
+
+    # the descriptions are all rendered from a handful of templates, so
+    # render each one once rather than once per ticket.
+    rendered = {}
+
+    def describe(i):
+        key = (i % APPLICATIONS, i % 97)
+        if key not in rendered:
+            text = DESCRIPTION.format(*key)
+            rendered[key] = (text, render_markdown(text), text_hash(text))
+        return rendered[key]
+
+    for start, stop in batches(n_tickets):
+        tickets = []
+        for i in range(start, stop):
+            description, html, digest = describe(i)
+            tickets.append(
+                TicketFactory.build(
+                    title="Ticket {}".format(i),
+                    description=description,
+                    description_html=html,
+                    description_hash=digest,
+                    status=random.choice(STATUSES),
+                    ticket_type=random.choice(TYPES),
+                    priority=random.randint(1, 5),
+                    active=random.random() > 0.02,
+                    submitted_by=random.choice(users),
+                    assigned_to=random.choice(users + [None] * USERS),
+                    application=random.choice(applications),
+                )
+            )
+        Ticket.all_tickets.bulk_create(tickets)
+        print("  tickets {:>9,} / {:,}".format(stop, n_tickets), end="\r")
+    print()
+
+    content_type = ContentType.objects.get_for_model(Ticket)
+    ticket_ids = list(Ticket.all_tickets.order_by("id").values_list("id", flat=True))
+    comment = "Ok - we will take a look at it"
+    comment_html = render_markdown(comment)
+
+    for start, stop in batches(n_tickets):
+        ids = ticket_ids[start:stop]
+        followups = []
+        tagged = []
+        for ticket_id in ids:
+            ticket = Ticket(pk=ticket_id)
+            for j in range(n_comments):
+                followups.append(
+                    FollowUpFactory.build(
+                        ticket=ticket,
+                        submitted_by=random.choice(users),
+                        comment=comment,
+                        comment_html=comment_html,
+                        comment_hash=text_hash(comment),
+                        private=random.random() < 0.1,
+                    )
+                )
+            for tag_id in random.sample(tag_ids, min(TAGS_PER_TICKET, len(tag_ids))):
+                tagged.append(
+                    TaggedItem(
+                        content_type=content_type, object_id=ticket_id, tag_id=tag_id
+                    )
+                )
+        FollowUp.all_comments.bulk_create(followups)
+        TaggedItem.objects.bulk_create(tagged)
+        print("  comments and tags {:>9,} / {:,}".format(stop, n_tickets), end="\r")
+    print()
+
+    Ticket.all_tickets.update_counters()
+    rebuild_index()
+
+
+def view_urls():
+    """Return the name, method and url of every view in tickets/urls.py,
+    using objects from the seeded database for the url kwargs.  The bulk
+    change urls are left out - they only accept POSTs, and each one
+    would change every ticket in its list."""
+
+    from django.contrib.auth.models import User
+    from django.db.models import Count
+    from django.urls import reverse
+    from taggit.models import Tag
+
+    from tickets.export import STREAMS
+    from tickets.models import Ticket
+    from tickets.urls import urlpatterns
+
+    ticket = Ticket.objects.order_by("-comment_count", "id").first()
+    username = User.objects.order_by("id").values_list("username", flat=True)[1]
+    tag = Tag.objects.annotate(n=Count("taggit_taggeditem_items")).order_by("-n")[0]
+
+    urls = []
+    for pattern in urlpatterns:
+        if pattern.name.startswith("bulk_"):
+            continue
+        kwargs = {}
+        route = str(pattern.pattern)
+        if "<int:pk>" in route:
+            kwargs["pk"] = ticket.pk
+        if "<str:username>" in route:
+            kwargs["username"] = username
+        if "<slug:slug>" in route:
+            kwargs["slug"] = tag.slug
+        method = "post" if pattern.name == "vote_ticket" else "get"
+        if "<str:fmt>" in route:
+            # the exports - one run per format
+            for fmt in STREAMS:
+                kwargs["fmt"] = fmt
+                url = reverse("tickets:{}".format(pattern.name), kwargs=kwargs)
+                urls.append(("{}.{}".format(pattern.name, fmt), method, url))
+            continue
+        url = reverse("tickets:{}".format(pattern.name), kwargs=kwargs)
+        urls.append((pattern.name, method, url))
+    return urls
+
+
+def percentile(values, pct):
+    """the pct percentile of values (nearest rank)"""
+    values = sorted(values)
+    index = max(0, int(round(pct / 100.0 * len(values))) - 1)
+    return values[index]
+
+
+def fetch(client, method, url):
+    """Request url and return the response and its body.  Streamed
+    responses (the exports) are read to the end so the queries and
+    rendering they do are counted and timed."""
+    response = getattr(client, method)(url)
+    if response.streaming:
+        return response, b"".join(response.streaming_content)
+    return response, response.content
+
+
+def time_view(client, method, url, n_requests):
+    """Request url once to count its queries (timed as cold_ms), then
+    n_requests more times, and return a dictionary of the timings in
+    milliseconds, the number of queries and the size of the response."""
+
+    from django.db import connection
+
+    # CaptureQueriesContext can't be used - the query log is reset at
+    # the start of every request.
+    queries = []
+
+    def count_queries(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    with connection.execute_wrapper(count_queries):
+        response, body = fetch(client, method, url)
+    cold = time.perf_counter() - start
+
+    timings = []
+    for i in range(n_requests):
+        start = time.perf_counter()
+        fetch(client, method, url)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "url": url,
+        "method": method.upper(),
+        "status": response.status_code,
+        "bytes": len(body),
+        "queries": len(queries),
+        "cold_ms": round(cold * 1000, 2),
+        "mean_ms": round(sum(timings) / len(timings), 2),
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p90_ms": round(percentile(timings, 90), 2),
+        "p99_ms": round(percentile(timings, 99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--tickets", type=int, default=10000)
+    parser.add_argument("--comments", type=int, default=3, help="per ticket")
+    parser.add_argument("--tags", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20, help="per url")
+    parser.add_argument("--output", "-o", default="load_test.json")
+    parser.add_argument(
+        "--no-seed", action="store_true", help="reuse the existing database"
+    )
+    parser.add_argument("--settings", default="main.settings.benchmark")
+    args = parser.parse_args()
+
+    os.environ["DJANGO_SETTINGS_MODULE"] = args.settings
+
+    import django
+
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client
+
+    if not args.no_seed:
+        print("seeding {:,} tickets on {}".format(args.tickets, connection.vendor))
+        call_command("migrate", verbosity=0)
+        call_command("flush", interactive=False, verbosity=0)
+        seed(args.tickets, args.comments, args.tags)
+
+    client = Client()
+    client.force_login(User.objects.order_by("id").first())
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "tickets": args.tickets,
+        "comments_per_ticket": args.comments,
+        "requests_per_url": args.requests,
+        "views": {},
+    }
+    print(
+        "{:<32} {:>6} {:>8} {:>8} {:>8} {:>8}".format(
+            "view", "status", "queries", "p50 ms", "p99 ms", "kB"
+        )
+    )
+    for name, method, url in view_urls():
+        result = time_view(client, method, url, args.requests)
+        report["views"][name] = result
+        print(
+            "{:<32} {:>6} {:>8} {:>8.1f} {:>8.1f} {:>8.1f}".format(
+                name,
+                result["status"],
+                result["queries"],
+                result["p50_ms"],
+                result["p99_ms"],
+                result["bytes"] / 1e3,
+            )
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("report written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
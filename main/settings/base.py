@@ -89,6 +89,7 @@ STATICFILES_FINDERS = (
 )
 
 MIDDLEWARE = [
+    "tickets.middleware.TimingMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -108,7 +109,8 @@ WSGI_APPLICATION = "main.wsgi.application"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # the django backend, timed for tickets.middleware.TimingMiddleware
+        "BACKEND": "tickets.timing.TimedDjangoTemplates",
         "DIRS": [
             # insert your TEMPLATE_DIRS here
             root("templates"),
@@ -169,14 +171,20 @@ LOGGING = {
             "level": "ERROR",
             "filters": ["require_debug_false"],
             "class": "django.utils.log.AdminEmailHandler",
-        }
+        },
+        "console": {"level": "INFO", "class": "logging.StreamHandler"},
     },
     "loggers": {
         "django.request": {
             "handlers": ["mail_admins"],
             "level": "ERROR",
             "propagate": True,
-        }
+        },
+        "tickets.timing": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
 
@@ -186,3 +194,58 @@ LOGIN_REDIRECT_URL = "/tickets"
 LINK_PATTERNS = [
     {"pattern": r"ticket:\s?(\d+)", "url": r'<a href="/ticket/\1">ticket \1</a>'}
 ]
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# the cache used by the ticket tracker and how long (in seconds) the
+# values used in the ticket list filters are kept.
+TICKETS_CACHE_ALIAS = "default"
+TICKETS_FILTERS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# the text search configuration used by the PostgreSQL search index
+TICKETS_SEARCH_CONFIG = "english"
+
+# optional limits on the cost of the tag counts shown on the ticket
+# list pages - count only the most recent N tickets, and/or cache the
+# counts for N seconds (None to disable).
+TICKETS_TAG_FACET_SAMPLE_SIZE = None
+TICKETS_TAG_FACET_CACHE_TIMEOUT = None
+
+# how long (in seconds) to cache the choices of the user and
+# application fields on the ticket forms.  With thousands of users, set
+# TICKETS_USER_AUTOCOMPLETE to look the users up as they are typed
+# instead of listing them all.
+TICKETS_CHOICES_CACHE_TIMEOUT = 60 * 60 * 24
+TICKETS_USER_AUTOCOMPLETE = False
+
+# how long (in seconds) to cache the navigation bar and the tag sidebar
+# of the ticket lists (the tag sidebar is replaced as soon as a ticket
+# or tag changes).
+TICKETS_NAV_CACHE_TIMEOUT = 60 * 60 * 24
+TICKETS_TAG_SIDEBAR_CACHE_TIMEOUT = 60 * 60 * 24
+
+# how long (in seconds) to cache the rendered parts of the ticket
+# detail page (they are replaced as soon as the ticket changes).
+TICKETS_DETAIL_CACHE_TIMEOUT = 60 * 60 * 24
+
+# descriptions and comments longer than this many characters are shown
+# as plain text and rendered by a pool of TICKETS_RENDER_WORKERS
+# threads after they are saved (None to always render them while the
+# request waits).
+TICKETS_ASYNC_RENDER_THRESHOLD = None
+TICKETS_RENDER_WORKERS = 2
+
+# how long (in seconds) to cache admin group membership.
+TICKETS_ADMIN_CACHE_TIMEOUT = 60 * 60
+
+# the fraction of requests timed by tickets.middleware.TimingMiddleware
+# (0 to disable), and whether the timings are returned to the browser
+# in a Server-Timing header as well as logged.  The header shows every
+# client the query counts and timings of the page, so it is only turned
+# on in the local settings.
+TICKETS_TIMING_SAMPLE_RATE = 0.05
+TICKETS_TIMING_HEADER = False
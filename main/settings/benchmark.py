@@ -0,0 +1,41 @@
+# usage: python benchmarks/load_test.py --settings main.settings.benchmark
+# flake8: noqa
+
+"""Settings used by the scripts in benchmarks/.  The database is
+selected with the BENCHMARK_DB environment variable ('sqlite' or
+'postgres') and is flushed and re-seeded by the benchmarks - never
+point these settings at a database you care about."""
+
+import os
+import tempfile
+
+from main.settings.base import *
+
+DEBUG = False
+ALLOWED_HOSTS = ["testserver", "localhost"]
+
+SECRET_KEY = os.environ.get("SECRET_KEY", "benchmark")
+
+if os.environ.get("BENCHMARK_DB", "sqlite") == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("BENCHMARK_DB_NAME", "ticket_tracker_benchmark"),
+            "USER": os.environ.get("BENCHMARK_DB_USER", ""),
+            "PASSWORD": os.environ.get("BENCHMARK_DB_PASSWORD", ""),
+            "HOST": os.environ.get("BENCHMARK_DB_HOST", "localhost"),
+            "PORT": os.environ.get("BENCHMARK_DB_PORT", ""),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get(
+                "BENCHMARK_DB_NAME",
+                os.path.join(tempfile.gettempdir(), "ticket_tracker_benchmark.db"),
+            ),
+        }
+    }
+
+PASSWORD_HASHERS = ("django.contrib.auth.hashers.MD5PasswordHasher",)
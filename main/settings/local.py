@@ -23,3 +23,6 @@ INTERNAL_IPS = ("127.0.0.1",)  # added for debug toolbar
 DEBUG_TOOLBAR_CONFIG = {
     "INTERCEPT_REDIRECTS": False,
 }
+
+# show the sampled request timings in the browser's developer tools
+TICKETS_TIMING_HEADER = True
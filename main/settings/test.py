@@ -18,6 +18,8 @@ DATABASES = {
     }
 }
 
+TICKETS_TIMING_SAMPLE_RATE = 0
+
 PASSWORD_HASHERS = ("django.contrib.auth.hashers.MD5PasswordHasher",)
 
 
@@ -0,0 +1,228 @@
+"""
+A read-only JSON API for tickets.
+
+Both views support conditional GETs.  The ETag and Last-Modified
+headers are calculated from a single small query (plus a couple of
+cache lookups, see tickets.conditional) before the view runs, so a
+client polling for changes gets a 304 Not Modified without the
+tickets being fetched or serialized.
+
+Some changes (votes, new duplicates, tag renames) don't change the
+modification time of a ticket, so clients should poll with the ETag
+(If-None-Match) rather than If-Modified-Since.
+
+"""
+
+from django.db.models import Count, Max, Sum
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+from django.views.generic.list import ListView
+
+from .cache import TAGS_VERSION_KEY, get_version
+from .conditional import can_see_private, etag, latest, ticket_state
+from .filters import filter_tickets
+from .models import FollowUp, Ticket, TicketDuplicate
+from .pagination import KEYSET_ORDERING, KeysetPaginationMixin
+
+MAX_PAGE_SIZE = 200
+
+
+def ticket_data(ticket):
+    """The fields of ticket returned by both the list and detail views."""
+    return {
+        "id": ticket.id,
+        "url": ticket.get_absolute_url(),
+        "title": ticket.title,
+        "status": ticket.status,
+        "ticket_type": ticket.ticket_type,
+        "priority": ticket.priority,
+        "application": ticket.application.application,
+        "submitted_by": ticket.submitted_by.username if ticket.submitted_by else None,
+        "assigned_to": ticket.assigned_to.username if ticket.assigned_to else None,
+        "created_on": ticket.created_on,
+        "updated_on": ticket.updated_on,
+        "last_activity": ticket.last_activity,
+        "votes": ticket.votes,
+        "comment_count": ticket.comment_count,
+        "tags": sorted(x.name for x in ticket.tags.all()),
+    }
+
+
+# ==========
+# Ticket list
+
+
+def list_queryset(request):
+    tickets = Ticket.objects.order_by(*KEYSET_ORDERING)
+    return filter_tickets(tickets, {}, request.GET)
+
+
+def list_state(request, *args, **kwargs):
+    """Summarize the tickets matched by the request with one aggregate
+    query.  Any change to the tickets in the list changes at least one
+    of the values (tag changes are picked up by the tags version)."""
+    if not hasattr(request, "_tickets_list_state"):
+        state = list_queryset(request).order_by().aggregate(
+            n=Count("id"),
+            votes=Sum("votes"),
+            comments=Sum("comment_count"),
+            updated_on=Max("updated_on"),
+            last_activity=Max("last_activity"),
+        )
+        state["tags"] = get_version(TAGS_VERSION_KEY)
+        request._tickets_list_state = state
+    return request._tickets_list_state
+
+
+def list_etag(request, *args, **kwargs):
+    state = list_state(request)
+    return etag(
+        request.GET.urlencode(),
+        state["n"],
+        state["votes"],
+        state["comments"],
+        state["updated_on"],
+        state["last_activity"],
+        state["tags"],
+    )
+
+
+def list_last_modified(request, *args, **kwargs):
+    state = list_state(request)
+    return latest(state["updated_on"], state["last_activity"])
+
+
+class TicketListAPIView(KeysetPaginationMixin, ListView):
+    """
+    A page of the tickets that match the TicketFilter (and 'q' search)
+    GET parameters, as JSON.  Pages are linked by cursor like the html
+    ticket lists - 'next' and 'previous' are the urls of the adjacent
+    pages, or null.  'limit' sets the page size (up to 200).
+    """
+
+    paginate_by = 50
+
+    def get_queryset(self):
+        tickets = list_queryset(self.request)
+        return tickets.select_related(
+            "application", "submitted_by", "assigned_to"
+        ).prefetch_related("tags")
+
+    def get_paginate_by(self, queryset):
+        try:
+            limit = int(self.request.GET.get("limit", self.paginate_by))
+        except ValueError:
+            limit = self.paginate_by
+        return max(1, min(limit, MAX_PAGE_SIZE))
+
+    def page_url(self, **kwargs):
+        query = self.request.GET.copy()
+        query.pop("page", None)
+        query.pop("cursor", None)
+        for key, value in kwargs.items():
+            query[key] = value
+        return "{}?{}".format(self.request.path, query.urlencode())
+
+    def render_to_response(self, context, **response_kwargs):
+        page = context["page_obj"]
+        links = {"next": None, "previous": None}
+        if page.has_next():
+            cursor = getattr(page, "next_cursor", None)
+            links["next"] = (
+                self.page_url(cursor=cursor)
+                if cursor
+                else self.page_url(page=page.next_page_number())
+            )
+        if page.has_previous():
+            cursor = getattr(page, "previous_cursor", None)
+            links["previous"] = (
+                self.page_url(cursor=cursor)
+                if cursor
+                else self.page_url(page=page.previous_page_number())
+            )
+
+        data = dict(links, results=[ticket_data(x) for x in context["object_list"]])
+        return JsonResponse(data, **response_kwargs)
+
+
+ticket_list = condition(etag_func=list_etag, last_modified_func=list_last_modified)(
+    TicketListAPIView.as_view()
+)
+
+
+# ==========
+# Ticket detail
+
+
+def detail_etag(request, pk):
+    state = ticket_state(request, pk)
+    return state["key"] if state else None
+
+
+def detail_last_modified(request, pk):
+    state = ticket_state(request, pk)
+    return state["last_modified"] if state else None
+
+
+@condition(etag_func=detail_etag, last_modified_func=detail_last_modified)
+def ticket_detail(request, pk):
+    """
+    A ticket as JSON, with its comments (private comments are only
+    included for admins and the submitter), tags, the tickets it
+    duplicates or is duplicated by, and the tickets it was split from
+    or into.
+    """
+    ticket = get_object_or_404(
+        Ticket.all_tickets.select_related(
+            "application", "submitted_by", "assigned_to"
+        ).prefetch_related("tags"),
+        pk=pk,
+    )
+
+    if can_see_private(request.user, ticket.submitted_by_id):
+        comments = FollowUp.all_comments.filter(ticket=ticket)
+    else:
+        comments = FollowUp.objects.filter(ticket=ticket)
+    comments = comments.select_related("submitted_by").order_by("created_on")
+
+    data = ticket_data(ticket)
+    data.update(
+        {
+            "description": ticket.description,
+            "description_html": ticket.description_html,
+            "description_pending": ticket.description_pending,
+            "comments": [
+                {
+                    "id": x.id,
+                    "submitted_by": x.submitted_by.username,
+                    "created_on": x.created_on,
+                    "action": x.action,
+                    "private": x.private,
+                    "comment": x.comment,
+                    "comment_html": x.comment_html,
+                    "comment_pending": x.comment_pending,
+                }
+                for x in comments
+            ],
+            "duplicate_of": list(
+                TicketDuplicate.objects.filter(ticket=ticket).values_list(
+                    "original_id", flat=True
+                )
+            ),
+            "duplicates": list(
+                TicketDuplicate.objects.filter(original=ticket).values_list(
+                    "ticket_id", flat=True
+                )
+            ),
+            "parent": ticket.parent_id,
+            "children": list(
+                Ticket.objects.filter(parent=ticket).values_list("id", flat=True)
+            ),
+        }
+    )
+    response = JsonResponse(data)
+    # the private comments depend on who is asking
+    patch_vary_headers(response, ["Cookie"])
+    return response
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class TicketsConfig(AppConfig):
+    name = "tickets"
+    verbose_name = "Ticket Tracker"
+
+    def ready(self):
+        # connect the signal handlers that keep our caches fresh.
+        from . import signals  # noqa: F401
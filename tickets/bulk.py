@@ -0,0 +1,122 @@
+"""
+Changes made to many tickets at once from the ticket lists (see
+BulkTicketForm and the bulk_update_tickets view).
+
+Each change is made with a handful of set-based queries however many
+tickets are selected - the tickets are updated with one UPDATE per
+batch of ids, the comment recording the change is added to every
+ticket with bulk_create(), and the tags are added with a single
+bulk_create() of the missing TaggedItems.  Everything happens in one
+transaction.
+
+None of these send the model signals, so the search index, cached
+filters and cached versions of the tickets are updated here instead.
+
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+from taggit.models import Tag, TaggedItem
+
+from .cache import (
+    TAGS_VERSION_KEY,
+    TICKET_LIST_VERSION_KEY,
+    bump_ticket_versions,
+    bump_version,
+    invalidate_ticket_filters,
+)
+from .models import FollowUp, Ticket, render_markdown, text_hash
+from .search import index_tickets
+
+# the number of tickets in each UPDATE (keeps the number of query
+# parameters within the limits of every backend)
+BATCH_SIZE = 500
+
+
+def batches(ids, size=BATCH_SIZE):
+    for i in range(0, len(ids), size):
+        yield ids[i : i + size]
+
+
+def get_tag_ids(names):
+    """Return the ids of the named tags, creating any that don't exist
+    one at a time so taggit generates unique slugs."""
+    tags = dict(Tag.objects.filter(name__in=names).values_list("name", "pk"))
+    for name in names:
+        if name not in tags:
+            tags[name] = Tag.objects.create(name=name).pk
+    return [tags[x] for x in names]
+
+
+def add_tags(ids, names):
+    """Add the named tags to each of the tickets in ids that doesn't
+    already have them."""
+    content_type = ContentType.objects.get_for_model(Ticket)
+    tag_ids = get_tag_ids(names)
+    for batch in batches(ids):
+        existing = set(
+            TaggedItem.objects.filter(
+                content_type=content_type, object_id__in=batch, tag_id__in=tag_ids
+            ).values_list("object_id", "tag_id")
+        )
+        TaggedItem.objects.bulk_create(
+            [
+                TaggedItem(content_type=content_type, object_id=pk, tag_id=tag_id)
+                for pk in batch
+                for tag_id in tag_ids
+                if (pk, tag_id) not in existing
+            ]
+        )
+
+
+def update_tickets(tickets, user, comment, action="no_action", tags=None, **changes):
+    """Apply changes (a dictionary of ticket fields and their new values)
+    and tags to the tickets in the queryset tickets, and add comment
+    (by user, with action) to each of them.  Returns the ids of the
+    tickets that were changed."""
+
+    html = render_markdown(comment)
+    digest = text_hash(comment)
+
+    with transaction.atomic():
+        ids = list(tickets.order_by("pk").values_list("pk", flat=True))
+        if not ids:
+            return ids
+
+        followups = [
+            FollowUp(
+                ticket_id=pk,
+                submitted_by=user,
+                comment=comment,
+                comment_html=html,
+                comment_hash=digest,
+                action=action,
+            )
+            for pk in ids
+        ]
+        FollowUp.all_comments.bulk_create(followups, batch_size=BATCH_SIZE)
+        # created_on is set by auto_now_add as the rows are inserted
+        created_on = followups[-1].created_on
+
+        values = dict(
+            changes,
+            comment_count=F("comment_count") + 1,
+            last_activity=created_on,
+        )
+        if changes:
+            values["updated_on"] = created_on
+        for batch in batches(ids):
+            Ticket.all_tickets.filter(pk__in=batch).update(**values)
+
+        if tags:
+            add_tags(ids, tags)
+        index_tickets(ids)
+
+    bump_ticket_versions(ids)
+    bump_version(TICKET_LIST_VERSION_KEY)
+    if tags:
+        bump_version(TAGS_VERSION_KEY)
+    if "assigned_to" in changes:
+        invalidate_ticket_filters()
+    return ids
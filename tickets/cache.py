@@ -0,0 +1,115 @@
+"""
+Helper functions for the values cached by the ticket tracker.
+
+All of the cached values are stored in the django cache identified by
+the TICKETS_CACHE_ALIAS setting (the 'default' cache if it is not
+provided), so projects can point the tracker at memcached, redis or a
+database cache without any changes to the application.
+
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+TICKET_FILTERS_KEY = "tickets:ticket_filters"
+TAGS_VERSION_KEY = "tickets:version:tags"
+ADMIN_KEY = "tickets:is_admin:{}"
+TICKET_VERSION_KEY = "tickets:version:ticket:{}"
+TICKET_LIST_VERSION_KEY = "tickets:version:ticket_list"
+CHOICES_KEY = "tickets:choices:{}:{}"
+CHOICES_VERSION_KEY = "tickets:version:choices"
+
+# the cached template fragments - the version keys included in the
+# fragment keys, and the setting with the timeout of each fragment.
+FRAGMENTS = {
+    "nav": ([], "TICKETS_NAV_CACHE_TIMEOUT"),
+    "tag_sidebar": (
+        [TAGS_VERSION_KEY, TICKET_LIST_VERSION_KEY],
+        "TICKETS_TAG_SIDEBAR_CACHE_TIMEOUT",
+    ),
+}
+
+
+def get_cache_alias():
+    """Return the alias of the django cache used by the ticket tracker."""
+    return getattr(settings, "TICKETS_CACHE_ALIAS", "default")
+
+
+def get_cache():
+    """Return the django cache used by the ticket tracker."""
+    return caches[get_cache_alias()]
+
+
+def get_timeout(setting_name, default=None):
+    """Return the cache timeout (in seconds) stored in setting_name, or
+    default if the setting has not been provided."""
+    return getattr(settings, setting_name, default)
+
+
+def invalidate_ticket_filters():
+    """Remove the cached filter values used on the ticket list pages."""
+    get_cache().delete(TICKET_FILTERS_KEY)
+
+
+def invalidate_choices():
+    """Replace the cached choices of the user and application fields on
+    the ticket forms (see tickets.choices)."""
+    bump_version(CHOICES_VERSION_KEY)
+
+
+def invalidate_admin(user_ids):
+    """Remove the cached admin group membership of each of user_ids."""
+    get_cache().delete_many([ADMIN_KEY.format(x) for x in user_ids])
+
+
+def new_version():
+    """Return the starting value of a version number.  Versions start
+    from the current time (rather than 1) so a version that is evicted
+    from the cache and recreated never repeats an earlier value."""
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    """Return the current version number stored under key.  Version
+    numbers are included in the keys of cached values that depend on
+    data that changes too often, or in too many ways, to delete the
+    cached values directly - incrementing the version makes all of the
+    old values unreachable."""
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Increment the version number stored under key."""
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # the key doesn't exist yet (or was evicted)
+        cache.add(key, new_version(), None)
+
+
+def get_fragment_cache(name):
+    """Return the cache alias, timeout and current version of the
+    template fragment name (see FRAGMENTS and the fragment_cache
+    template tag)."""
+    keys, setting_name = FRAGMENTS[name]
+    return {
+        "alias": get_cache_alias(),
+        "timeout": get_timeout(setting_name, 60 * 60 * 24),
+        "version": ":".join(str(get_version(x)) for x in keys),
+    }
+
+
+def bump_ticket_versions(ticket_ids):
+    """Increment the version numbers of each of ticket_ids (see
+    tickets.api)."""
+    for pk in set(ticket_ids):
+        if pk is not None:
+            bump_version(TICKET_VERSION_KEY.format(pk))
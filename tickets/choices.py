@@ -0,0 +1,86 @@
+"""
+The choices of the user and application fields on the ticket forms.
+
+Building the options of a user dropdown requires every user to be
+fetched, so the choices (primary keys and labels) of each kind of
+field are built once and then served from the cache until a user or
+application is changed (see tickets/signals.py).
+
+The user fields can also be rendered without any options at all, and
+the users looked up as the user types, by setting
+TICKETS_USER_AUTOCOMPLETE = True - see user_autocomplete() in
+tickets/views.py.
+
+"""
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from .cache import (
+    CHOICES_KEY,
+    CHOICES_VERSION_KEY,
+    get_cache,
+    get_timeout,
+    get_version,
+)
+from .models import Application
+
+User = get_user_model()
+
+# the users offered by each kind of user field
+USER_CHOICES = {
+    "users": lambda: User.objects.all(),
+    "staff": lambda: User.objects.filter(is_staff=True),
+}
+
+# the columns needed to build the labels of users (see user_label())
+USER_FIELDS = ["pk", "username", "first_name", "last_name"]
+
+AUTOCOMPLETE_LIMIT = 20
+
+
+def user_queryset(name):
+    """Return the users offered by the user fields called name, ordered
+    by username."""
+    return USER_CHOICES[name]().only(*USER_FIELDS).order_by("username")
+
+
+def application_queryset():
+    return Application.objects.order_by("application")
+
+
+def user_label(user):
+    """Users are shown by first and last name (rather than their user
+    name) if they have one."""
+    if user.first_name:
+        return "{0} {1}".format(user.first_name, user.last_name)
+    return str(user)
+
+
+def get_choices(name, queryset, label):
+    """Return a list of (primary key, label) tuples for the objects in
+    queryset, built with the function label.  The list is cached under
+    name for TICKETS_CHOICES_CACHE_TIMEOUT seconds (one day by default)
+    and replaced whenever a user or application changes."""
+
+    cache = get_cache()
+    key = CHOICES_KEY.format(name, get_version(CHOICES_VERSION_KEY))
+    choices = cache.get(key)
+    if choices is None:
+        choices = [(x.pk, label(x)) for x in queryset]
+        timeout = get_timeout("TICKETS_CHOICES_CACHE_TIMEOUT", 60 * 60 * 24)
+        cache.set(key, choices, timeout)
+    return choices
+
+
+def find_users(name, q, limit=AUTOCOMPLETE_LIMIT):
+    """Return up to limit of the users offered by the user fields
+    called name whose username, first or last name starts with q."""
+    users = user_queryset(name)
+    for term in q.split():
+        users = users.filter(
+            Q(username__istartswith=term)
+            | Q(first_name__istartswith=term)
+            | Q(last_name__istartswith=term)
+        )
+    return users[:limit]
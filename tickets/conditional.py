@@ -0,0 +1,77 @@
+"""
+The state of a ticket used for conditional GETs (ETag/Last-Modified)
+and to key the cached fragments of the ticket detail page.
+
+Everything shown for a ticket is covered by its row (updated_on,
+last_activity, votes and the comment counts), the per-ticket version
+incremented by tickets.signals when its comments, tags, duplicates,
+children or votes change, the version of the tags, and whether the
+viewer can see the private comments.  All of it is read with one small
+query and a couple of cache lookups.
+
+"""
+
+import hashlib
+
+from .cache import TAGS_VERSION_KEY, TICKET_VERSION_KEY, get_version
+from .models import Ticket
+from .utils import is_admin
+
+
+def etag(*values):
+    """Return a short digest of values."""
+    return hashlib.md5(":".join(str(x) for x in values).encode()).hexdigest()
+
+
+def latest(*values):
+    """Return the latest of the datetimes in values, ignoring None."""
+    values = [x for x in values if x is not None]
+    return max(values) if values else None
+
+
+def can_see_private(user, submitted_by_id):
+    """Private comments are only shown to admins and the submitter."""
+    return user.is_authenticated and (user.pk == submitted_by_id or is_admin(user))
+
+
+def ticket_state(request, pk):
+    """Return a dictionary describing the current state of ticket pk as
+    seen by request.user, or None if the ticket doesn't exist.  'key'
+    changes whenever anything about the ticket changes.  The state is
+    remembered on the request, so the ETag and Last-Modified functions
+    and the view can all use it."""
+
+    cache = getattr(request, "_tickets_ticket_state", {})
+    if pk in cache:
+        return cache[pk]
+
+    state = (
+        Ticket.all_tickets.filter(pk=pk)
+        .values(
+            "submitted_by_id",
+            "updated_on",
+            "last_activity",
+            "votes",
+            "comment_count",
+            "private_comment_count",
+        )
+        .first()
+    )
+    if state is not None:
+        state["private"] = can_see_private(request.user, state["submitted_by_id"])
+        state["key"] = etag(
+            pk,
+            get_version(TICKET_VERSION_KEY.format(pk)),
+            get_version(TAGS_VERSION_KEY),
+            state["private"],
+            state["updated_on"],
+            state["last_activity"],
+            state["votes"],
+            state["comment_count"],
+            state["private_comment_count"],
+        )
+        state["last_modified"] = latest(state["updated_on"], state["last_activity"])
+
+    cache[pk] = state
+    request._tickets_ticket_state = cache
+    return state
@@ -0,0 +1,72 @@
+"""
+Streaming csv and json exports of the ticket lists.
+
+The tickets are fetched as dictionaries with values() and iterated in
+chunks, and each row is encoded and sent as soon as it is read, so the
+memory used by an export doesn't depend on the number of tickets.
+
+"""
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# the column name of each exported value, and the field it comes from
+EXPORT_FIELDS = [
+    ("id", "id"),
+    ("title", "title"),
+    ("status", "status"),
+    ("ticket_type", "ticket_type"),
+    ("priority", "priority"),
+    ("application", "application__application"),
+    ("submitted_by", "submitted_by__username"),
+    ("assigned_to", "assigned_to__username"),
+    ("created_on", "created_on"),
+    ("updated_on", "updated_on"),
+    ("votes", "votes"),
+    ("comment_count", "comment_count"),
+    ("description", "description"),
+]
+
+CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {"csv": "text/csv", "json": "application/json"}
+
+
+class Echo(object):
+    """A file-like object that returns what is written to it, so the
+    csv writer can be used to encode one row at a time."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(tickets):
+    """Iterate over the exported values of each ticket in the queryset
+    without creating any model instances."""
+    columns = [column for column, field in EXPORT_FIELDS]
+    values = tickets.values_list(*[field for column, field in EXPORT_FIELDS])
+    for row in values.iterator(chunk_size=CHUNK_SIZE):
+        yield dict(zip(columns, row))
+
+
+def stream_csv(tickets):
+    """Yield the tickets as lines of csv, starting with a header."""
+    writer = csv.writer(Echo())
+    yield writer.writerow([column for column, field in EXPORT_FIELDS])
+    for row in export_rows(tickets):
+        yield writer.writerow(row.values())
+
+
+def stream_json(tickets):
+    """Yield the tickets as a json array of objects."""
+    yield "["
+    separator = "\n"
+    for row in export_rows(tickets):
+        yield separator + json.dumps(row, cls=DjangoJSONEncoder)
+        separator = ",\n"
+    yield "\n]\n"
+
+
+STREAMS = {"csv": stream_csv, "json": stream_json}
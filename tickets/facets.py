@@ -0,0 +1,151 @@
+"""
+Functions that return the values used to build the filter widgets on
+the ticket list pages.
+
+The distinct applications, submitters and assignees require a scan of
+the whole ticket table, so they are computed once and then served from
+the cache until a ticket, application or user is changed (see
+tickets/signals.py).
+
+The tags used by the tickets in a list (and the number of tickets
+with each tag) are counted with a single GROUP BY over the taggit
+through table.  For very large result sets, the counts can be based on
+a sample of the most recent tickets and/or cached for a short time.
+
+"""
+
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Count, F
+from taggit.models import TaggedItem
+
+from .cache import (
+    TAGS_VERSION_KEY,
+    TICKET_FILTERS_KEY,
+    get_cache,
+    get_timeout,
+    get_version,
+)
+from .models import Ticket
+
+
+def get_ticket_filters():
+    """Return a dictionary that will be used to create the dynamic filters
+    on the fitler lists.  There will be one element for each filter
+    (status, application, ticket type, priority, submitted by, and
+    assigned to).
+
+    The values are cached for TICKETS_FILTERS_CACHE_TIMEOUT seconds
+    (one day by default) and invalidated whenever the underlying data
+    changes.
+
+    """
+
+    cache = get_cache()
+    ticket_filters = cache.get(TICKET_FILTERS_KEY)
+    if ticket_filters is None:
+        ticket_filters = build_ticket_filters()
+        timeout = get_timeout("TICKETS_FILTERS_CACHE_TIMEOUT", 60 * 60 * 24)
+        cache.set(TICKET_FILTERS_KEY, ticket_filters, timeout)
+    return ticket_filters
+
+
+def build_ticket_filters():
+    """Query the database for the values used in the ticket list
+    filters. Use get_ticket_filters() instead, which caches the result
+    of this function."""
+
+    values = Ticket.TICKET_STATUS_CHOICES
+    status = [x[0] for x in values]
+
+    values = sorted(Ticket.TICKET_PRIORITY_CHOICES, key=lambda x: x[0])
+    priority = [x[1] for x in values]
+
+    values = Ticket.TICKET_TYPE_CHOICES
+    ticket_types = [x[1] for x in values]
+
+    values = Ticket.objects.values_list("application__application").distinct()
+    applications = [x[0] for x in values]
+
+    values = Ticket.objects.values_list("submitted_by__username").distinct()
+    submitted_by = [x[0] for x in values]
+
+    values = Ticket.objects.values_list("assigned_to__username").distinct()
+    assigned_to = [x[0] for x in values]
+
+    ticket_filters = OrderedDict()
+
+    ticket_filters["status"] = status
+    ticket_filters["application"] = list(set(applications))
+    ticket_filters["priority"] = priority
+    ticket_filters["type"] = ticket_types
+    ticket_filters["submitted_by"] = list(set(submitted_by))
+    ticket_filters["assigned_to"] = list(set(assigned_to))
+
+    return ticket_filters
+
+
+def get_tag_facets(tickets):
+    """Return a list of dictionaries with the name, slug and count of
+    each tag used by the tickets in the queryset tickets, ordered by
+    count (most common first).
+
+    Two settings control the cost for very large result sets:
+
+    - TICKETS_TAG_FACET_SAMPLE_SIZE - if provided, only the most
+      recent tickets in the queryset (up to this number) are counted,
+      so the counts are approximate.
+
+    - TICKETS_TAG_FACET_CACHE_TIMEOUT - if provided, the counts for each
+      distinct queryset are cached for this many seconds.  The cached
+      values are discarded when tags are added to or removed from any
+      ticket, but not when other changes move tickets in or out of
+      the queryset.
+
+    """
+
+    sample_size = getattr(settings, "TICKETS_TAG_FACET_SAMPLE_SIZE", None)
+    timeout = get_timeout("TICKETS_TAG_FACET_CACHE_TIMEOUT")
+
+    if not timeout:
+        return build_tag_facets(tickets, sample_size)
+
+    try:
+        sql = str(tickets.query)
+    except EmptyResultSet:
+        return []
+    digest = hashlib.md5(
+        "{}:{}:{}".format(get_version(TAGS_VERSION_KEY), sample_size, sql).encode()
+    ).hexdigest()
+    key = "tickets:tag_facets:{}".format(digest)
+
+    cache = get_cache()
+    facets = cache.get(key)
+    if facets is None:
+        facets = build_tag_facets(tickets, sample_size)
+        cache.set(key, facets, timeout)
+    return facets
+
+
+def build_tag_facets(tickets, sample_size=None):
+    """Count the tags used by the tickets in the queryset tickets with a
+    single query.  Use get_tag_facets() instead, which respects the
+    tag facet settings."""
+
+    if sample_size:
+        ticket_ids = tickets.values("pk")[:sample_size]
+    else:
+        ticket_ids = tickets.order_by().values("pk")
+
+    content_type = ContentType.objects.get_for_model(Ticket)
+    facets = (
+        TaggedItem.objects.filter(content_type=content_type, object_id__in=ticket_ids)
+        .values(name=F("tag__name"), slug=F("tag__slug"))
+        .annotate(count=Count("id"))
+        .order_by("-count", "name")
+    )
+    return list(facets)
@@ -1,6 +1,8 @@
 import django_filters
+from django.db.models import Q
 
 from .models import Ticket
+from .search import search_tickets
 
 
 class TicketFilter(django_filters.FilterSet):
@@ -46,3 +48,88 @@ class TicketFilter(django_filters.FilterSet):
             "submitted_by__username",
             "tags__name",
         ]
+
+
+# The functions below narrow a ticket queryset using the url kwargs
+# and GET parameters of the ticket list views.  Each takes the
+# queryset, the url kwargs and the GET parameters and returns the
+# narrowed queryset, so they can be chained together in any order
+# without losing the filters (or select_related/prefetch_related)
+# applied by the others.
+
+
+def filter_by_tag(tickets, kwargs, params):
+    """Tickets tagged with the 'slug' url kwarg."""
+    slug = kwargs.get("slug")
+    if slug:
+        tickets = tickets.filter(tags__slug=slug)
+    return tickets
+
+
+def filter_by_user(tickets, kwargs, params):
+    """Tickets submitted by and/or assigned to the 'username' url kwarg,
+    depending on the value of the 'what' kwarg."""
+    username = kwargs.get("username")
+    what = kwargs.get("what")
+    if username:
+        if what == "submitted_by":
+            tickets = tickets.filter(submitted_by__username=username)
+        elif what == "assigned_to":
+            tickets = tickets.filter(assigned_to__username=username)
+        else:
+            tickets = tickets.filter(
+                Q(submitted_by__username=username) | Q(assigned_to__username=username)
+            )
+    return tickets
+
+
+def filter_by_type(tickets, kwargs, params):
+    """Tickets of the ticket type in the 'type' url kwarg."""
+    ticket_type = kwargs.get("type")
+    if ticket_type:
+        tickets = tickets.filter(ticket_type=ticket_type)
+    return tickets
+
+
+def filter_by_status(tickets, kwargs, params):
+    """Open or closed tickets depending on the 'status' url kwarg."""
+    ticket_status = kwargs.get("status")
+    if ticket_status == "closed":
+        tickets = tickets.filter(status__in=Ticket.CLOSED_STATUSES)
+    elif ticket_status:
+        tickets = tickets.exclude(status__in=Ticket.CLOSED_STATUSES)
+    return tickets
+
+
+def filter_by_query(tickets, kwargs, params):
+    """Tickets that match the search string in the 'q' GET parameter,
+    ordered by relevance."""
+    q = params.get("q")
+    if q:
+        tickets = search_tickets(tickets, q)
+    return tickets
+
+
+def filter_by_params(tickets, kwargs, params):
+    """Apply the TicketFilter to the GET parameters."""
+    return TicketFilter(params, queryset=tickets).qs
+
+
+TICKET_LIST_FILTERS = [
+    filter_by_tag,
+    filter_by_user,
+    filter_by_type,
+    filter_by_status,
+    filter_by_params,
+    filter_by_query,
+]
+
+
+def filter_tickets(tickets, kwargs, params, filters=TICKET_LIST_FILTERS):
+    """Narrow the ticket queryset using the url kwargs and GET parameters
+    of a ticket list view by passing it through each of the functions
+    in filters.  The search is applied last so its relevance ordering
+    is kept."""
+    for ticket_filter in filters:
+        tickets = ticket_filter(tickets, kwargs, params)
+    return tickets
@@ -1,38 +1,140 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.utils.safestring import mark_safe
 from django.forms import (
     BooleanField,
     CharField,
+    ChoiceField,
     Form,
     IntegerField,
     ModelChoiceField,
     ModelForm,
     Textarea,
     TextInput,
+    TypedChoiceField,
     ValidationError,
 )
+from django.forms.models import ModelChoiceIterator
 from django.forms.widgets import CheckboxInput, Select
-from taggit.forms import TagWidget
+from django.urls import reverse
+from taggit.forms import TagField, TagWidget
 
-from .models import Application, FollowUp, Ticket, TicketDuplicate
-from .utils import is_admin
+from .bulk import update_tickets
+from .cache import invalidate_ticket_filters
+from .choices import application_queryset, get_choices, user_label, user_queryset
+from .models import FollowUp, RenderTask, Ticket, TicketDuplicate, text_hash
+from .search import index_tickets
+from .utils import insert_all, is_admin
 
 User = get_user_model()
 
 
-class UserModelChoiceField(ModelChoiceField):
+class CachedChoiceIterator(ModelChoiceIterator):
+    """Iterate over the cached choices of a CachedModelChoiceField
+    rather than the objects in its queryset."""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        yield from self.field.cached_choices()
+
+    def __len__(self):
+        return len(self.field.cached_choices()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.cached_choices())
+
+
+class CachedModelChoiceField(ModelChoiceField):
+    """A model choice field whose choices are cached under choices_name
+    (see tickets.choices) so that rendering the form doesn't fetch every
+    object in the queryset.  Submitted values are still validated
+    against the queryset."""
+
+    iterator = CachedChoiceIterator
+    choices_name = None
+
+    def __init__(self, *args, **kwargs):
+        self.choices_name = kwargs.pop("choices_name", self.choices_name)
+        super().__init__(*args, **kwargs)
+
+    def cached_choices(self):
+        return get_choices(self.choices_name, self.queryset, self.label_from_instance)
+
+
+class ApplicationChoiceField(CachedModelChoiceField):
+    choices_name = "applications"
+
+    def __init__(self, *args, **kwargs):
+        kwargs["queryset"] = application_queryset()
+        super().__init__(*args, **kwargs)
+
+
+class UserSelect(Select):
+    """The select used for users.  If TICKETS_USER_AUTOCOMPLETE is True,
+    it only contains the current user (if any) and the other users are
+    fetched from the user_autocomplete view as a name is typed into the
+    search box rendered with it."""
+
+    def __init__(self, users="users", attrs=None):
+        self.users = users
+        super().__init__(attrs)
+
+    @property
+    def autocomplete(self):
+        return getattr(settings, "TICKETS_USER_AUTOCOMPLETE", False)
+
+    @property
+    def template_name(self):
+        if self.autocomplete:
+            return "tickets/widgets/user_autocomplete.html"
+        return "django/forms/widgets/select.html"
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        if self.autocomplete:
+            url = reverse("tickets:user_autocomplete")
+            context["widget"]["url"] = "{}?users={}".format(url, self.users)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        if not self.autocomplete:
+            return super().optgroups(name, value, attrs)
+        # only the selected users are looked up and rendered
+        pks = [x for x in value if x]
+        users = self.choices.queryset.filter(pk__in=pks) if pks else []
+        choices = [("", self.choices.field.empty_label or "")]
+        choices += [(x.pk, user_label(x)) for x in users]
+        groups = []
+        for index, (option_value, label) in enumerate(choices):
+            selected = str(option_value) in value
+            option = self.create_option(name, option_value, label, selected, index)
+            groups.append((None, [option], index))
+        return groups
+
+
+class UserModelChoiceField(CachedModelChoiceField):
     """a custom model choice widget for user objects.  It will
     display user first and last name in list of available choices
     (rather than their official user name). modified from
     https://docs.djangoproject.com/en/dev/ref/forms/fields/#modelchoicefield.
+
+    users is the kind of user offered (see tickets.choices.USER_CHOICES).
+    If TICKETS_USER_AUTOCOMPLETE is True, the users are looked up as
+    they are typed instead of being listed (see UserSelect).
     """
 
+    def __init__(self, users="users", **kwargs):
+        kwargs["queryset"] = user_queryset(users)
+        kwargs["choices_name"] = users
+        widget = kwargs.get("widget")
+        attrs = widget.attrs if widget is not None else None
+        kwargs["widget"] = UserSelect(users=users, attrs=attrs)
+        super().__init__(**kwargs)
+
     def label_from_instance(self, obj):
-        if obj.first_name:
-            label = "{0} {1}".format(obj.first_name, obj.last_name)
-        else:
-            label = obj.__str__()
-        return label
+        return user_label(obj)
 
 
 class TicketForm(ModelForm):
@@ -66,6 +168,8 @@ class TicketForm(ModelForm):
             "tags",
         ]
 
+        field_classes = {"application": ApplicationChoiceField}
+
         widgets = {
             "title": TextInput(attrs={"class": "form-control"}),
             "ticket_type": Select(attrs={"class": "form-control"}),
@@ -119,7 +223,6 @@ class SplitTicketForm(Form):
 
     assigned_to1 = UserModelChoiceField(
         # queryset=User.objects.filter(groups__name="admin"),
-        queryset=User.objects.all(),
         label="Assigned To",
         required=False,
     )
@@ -128,9 +231,7 @@ class SplitTicketForm(Form):
         label="Description", widget=Textarea(attrs={"class": "input-xxlarge"})
     )
 
-    application1 = ModelChoiceField(
-        queryset=Application.objects.all(), label="Application"
-    )
+    application1 = ApplicationChoiceField(label="Application")
 
     status2 = CharField(
         max_length=20,
@@ -153,14 +254,11 @@ class SplitTicketForm(Form):
 
     assigned_to2 = UserModelChoiceField(
         # queryset=User.objects.filter(groups__name="admin"),
-        queryset=User.objects.all(),
         label="Assigned To",
         required=False,
     )
 
-    application2 = ModelChoiceField(
-        queryset=Application.objects.all(), label="Application"
-    )
+    application2 = ApplicationChoiceField(label="Application")
 
     description2 = CharField(
         label="Description", widget=Textarea(attrs={"class": "input-xxlarge"})
@@ -175,46 +273,68 @@ class SplitTicketForm(Form):
         for visible in self.visible_fields():
             visible.field.widget.attrs["class"] = "form-control"
 
-    def save(self):
-
+    def build_child(self, n):
+        """Return the unsaved ticket described by the fields ending in n."""
         original = self.original_ticket
-
-        ticket1 = Ticket(
-            status=self.cleaned_data["status1"],
-            title=self.cleaned_data["title1"],
-            assigned_to=self.cleaned_data.get("assigned_to1"),
-            priority=self.cleaned_data.get("priority1"),
-            application=self.cleaned_data.get("application1"),
-            ticket_type=self.cleaned_data.get("ticket_type1"),
-            description=self.cleaned_data.get("description1"),
+        return Ticket(
+            status=self.cleaned_data["status{}".format(n)],
+            title=self.cleaned_data["title{}".format(n)],
+            assigned_to=self.cleaned_data.get("assigned_to{}".format(n)),
+            priority=self.cleaned_data.get("priority{}".format(n)),
+            application=self.cleaned_data.get("application{}".format(n)),
+            ticket_type=self.cleaned_data.get("ticket_type{}".format(n)),
+            description=self.cleaned_data.get("description{}".format(n)),
             submitted_by=original.submitted_by,
             parent=original,
         )
-        ticket1.save()
-
-        ticket2 = Ticket(
-            status=self.cleaned_data.get("status2"),
-            title=self.cleaned_data["title2"],
-            assigned_to=self.cleaned_data.get("assigned_to2"),
-            priority=self.cleaned_data.get("priority2"),
-            application=self.cleaned_data.get("application2"),
-            ticket_type=self.cleaned_data.get("ticket_type2"),
-            description=self.cleaned_data.get("description2"),
-            submitted_by=original.submitted_by,
-            parent=original,
-        )
-        ticket2.save()
 
-        followup = FollowUp(
-            ticket=original,
-            submitted_by=self.user,
-            comment=self.cleaned_data.get("comment"),
-            action="closed",
-        )
-        followup.save()
+    def save(self):
+        """Create the two new tickets and close the original in a single
+        transaction.  The new tickets are inserted together (see
+        insert_all()), and descriptions copied unchanged from the
+        original re-use its rendered html rather than rendering the
+        markdown again.  Only the status of the original is updated.
+        Returns the new tickets."""
+
+        original = self.original_ticket
+        children = [self.build_child(1), self.build_child(2)]
+
+        # html (and whether it is still waiting to be rendered) by digest
+        rendered = {}
+        if not original.description_pending:
+            rendered[original.description_hash] = (original.description_html, False)
+        for child in children:
+            digest = text_hash(child.description)
+            if digest in rendered:
+                child.description_html, child.description_pending = rendered[digest]
+                child.description_hash = digest
+            else:
+                child.render_description()
+                rendered[digest] = (child.description_html, child.description_pending)
+
+        with transaction.atomic():
+            # insert_all() doesn't send post_save, so the search index
+            # and cached filters are updated below.  The original's
+            # cached versions are bumped when it is saved.
+            insert_all(Ticket, children)
+            index_tickets([x.pk for x in children])
+            pending = [x for x in children if x.description_pending]
+            if pending:
+                RenderTask.objects.enqueue("ticket", pending)
+
+            followup = FollowUp(
+                ticket=original,
+                submitted_by=self.user,
+                comment=self.cleaned_data.get("comment"),
+                action="closed",
+            )
+            followup.save()
 
-        original.status = "split"
-        original.save()
+            original.status = "split"
+            original.save(update_fields=["status", "updated_on"])
+
+        invalidate_ticket_filters()
+        return children
 
 
 class CloseTicketForm(ModelForm):
@@ -284,39 +404,40 @@ class CloseTicketForm(ModelForm):
             original_pk = self.cleaned_data.get("same_as_ticket")
 
         if self.cleaned_data.get("duplicate") and original_pk:
-            try:
-                original = Ticket.objects.get(id=original_pk)
-            except Ticket.DoesNotExist:
-                original = None
+            # only the key is needed - the ticket is kept for save()
+            original = Ticket.objects.filter(pk=original_pk).only("pk").first()
             if not original:
                 raise ValidationError(mark_safe("Invalid ticket number. <a href={0} class={1}>Please enter a valid ticket number.</a>".format("#id_same_as_ticket", "alert-link")))
+            self.cleaned_data["original"] = original
         return self.cleaned_data
 
     def save(self, *args, **kwargs):
+        """Add the comment and update the status of the ticket (and
+        record the duplicate) in a single transaction.  The ticket
+        passed to the form and the original found by clean() are used
+        as they are, rather than being fetched again."""
+        ticket = self.ticket
         followUp = FollowUp(
-            ticket=self.ticket,
+            ticket=ticket,
             submitted_by=self.user,
             private=self.cleaned_data.get("private", False),
             comment=self.cleaned_data["comment"],
         )
 
-        ticket = Ticket.objects.get(id=self.ticket.id)
-
         if self.action == "closed" or self.action == "re-opened":
             ticket.status = self.action
             followUp.action = self.action
 
-        if self.cleaned_data.get("duplicate"):
-            original_pk = self.cleaned_data["same_as_ticket"]
-            original = Ticket.objects.get(pk=original_pk)
-            dup_ticket = TicketDuplicate(ticket=ticket, original=original)
-            dup_ticket.save()
-
+        original = self.cleaned_data.get("original")
+        if self.cleaned_data.get("duplicate") and original:
             ticket.status = "duplicate"
             followUp.action = "closed"
 
-        followUp.save()
-        ticket.save()
+        with transaction.atomic():
+            if self.cleaned_data.get("duplicate") and original:
+                TicketDuplicate.objects.create(ticket=ticket, original=original)
+            followUp.save()
+            ticket.save(update_fields=["status", "updated_on"])
 
     class Meta:
         model = FollowUp
@@ -392,7 +513,7 @@ class AcceptTicketForm(ModelForm):
         if not is_admin(self.user):
             self.ticket.assigned_to = self.user
         self.ticket.status = "accepted"
-        self.ticket.save()
+        self.ticket.save(update_fields=["assigned_to", "status", "updated_on"])
         followUp.save()
 
     class Meta:
@@ -411,7 +532,7 @@ class AssignTicketForm(ModelForm):
 
     assigned_to = UserModelChoiceField(
         # queryset=User.objects.filter(groups__name='admin'),
-        queryset=User.objects.filter(is_staff=True),
+        users="staff",
         label="Assign To",
         required=True,
         widget=Select(attrs={"class": "form-select"}),
@@ -435,9 +556,81 @@ class AssignTicketForm(ModelForm):
         assigned_to = self.cleaned_data.get("assigned_to")
         self.ticket.assigned_to = assigned_to
         self.ticket.status = "assigned"
-        self.ticket.save()
+        self.ticket.save(update_fields=["assigned_to", "status", "updated_on"])
         followUp.save()
 
     class Meta:
         model = FollowUp
         fields = ["comment"]
+
+
+class BulkTicketForm(Form):
+    """
+    Close, assign, re-prioritize or tag all of the tickets in a ticket
+    list at once.  The comment is added to each of the tickets.  Closing
+    and assigning only change the tickets that are still open.  This
+    form is only accessible to admin users.
+    """
+
+    ACTION_CHOICES = [
+        ("close", "Close"),
+        ("assign", "Assign"),
+        ("priority", "Change Priority"),
+        ("tag", "Add Tags"),
+    ]
+
+    # the field required by each action
+    ACTION_FIELDS = {"assign": "assigned_to", "priority": "priority", "tag": "tags"}
+
+    action = ChoiceField(choices=ACTION_CHOICES, widget=Select)
+
+    assigned_to = UserModelChoiceField(users="staff", label="Assign To", required=False)
+
+    priority = TypedChoiceField(
+        choices=[("", "---------")] + Ticket.TICKET_PRIORITY_CHOICES,
+        coerce=int,
+        empty_value=None,
+        required=False,
+    )
+
+    tags = TagField(required=False, help_text="A comma separated list of tags.")
+
+    comment = CharField(
+        widget=Textarea(attrs={"class": "input-xxlarge", "rows": 3}),
+        help_text="Text in markdown will be rendered as html.",
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop("user")
+        super(BulkTicketForm, self).__init__(*args, **kwargs)
+        for visible in self.visible_fields():
+            visible.field.widget.attrs["class"] = "form-control"
+
+    def clean(self):
+        action = self.cleaned_data.get("action")
+        field = self.ACTION_FIELDS.get(action)
+        if field and not self.cleaned_data.get(field):
+            self.add_error(field, "This field is required to {}.".format(action))
+        return self.cleaned_data
+
+    def save(self, tickets):
+        """Apply the action to the tickets in the queryset tickets.
+        Returns the ids of the tickets that were changed."""
+        action = self.cleaned_data["action"]
+        kwargs = {}
+        if action == "close":
+            tickets = tickets.exclude(status__in=Ticket.CLOSED_STATUSES)
+            kwargs = {"status": "closed", "action": "closed"}
+        elif action == "assign":
+            tickets = tickets.exclude(status__in=Ticket.CLOSED_STATUSES)
+            kwargs = {
+                "status": "assigned",
+                "assigned_to": self.cleaned_data["assigned_to"],
+            }
+        elif action == "priority":
+            kwargs = {"priority": self.cleaned_data["priority"]}
+        elif action == "tag":
+            kwargs = {"tags": self.cleaned_data["tags"]}
+
+        comment = self.cleaned_data["comment"]
+        return update_tickets(tickets, self.user, comment, **kwargs)
@@ -0,0 +1,309 @@
+"""
+Import tickets (and their comments and tags) exported from another
+system.
+
+The input is either a CSV file with one ticket per row, or a JSON lines
+file with one ticket per line.  Each ticket has the keys:
+
+    title, description, application, submitted_by  (required)
+    status, ticket_type, priority, assigned_to, created_on, tags
+
+application is the name of the application and is created if it does
+not exist.  submitted_by and assigned_to are usernames.  tags is a list
+of tag names (a comma separated string in a CSV file).  Tickets in a
+JSON lines file may also have a list of 'comments', each with the keys
+comment, submitted_by, private and created_on.  Titles longer than 80
+characters are truncated.
+
+The tickets are inserted in batches with bulk_create (see insert_all()
+in tickets/utils.py), and the markdown is rendered in a pool of worker
+processes.  The number of input records imported is recorded in a state
+file after each batch is committed, so an interrupted import can be run
+again and will pick up where it left off.
+
+"""
+
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template.defaultfilters import slugify
+from django.utils.dateparse import parse_datetime
+from taggit.models import Tag, TaggedItem
+
+from tickets.cache import (
+    TAGS_VERSION_KEY,
+    TICKET_LIST_VERSION_KEY,
+    bump_version,
+    invalidate_ticket_filters,
+)
+from tickets.models import Application, FollowUp, Ticket, render_markdown, text_hash
+from tickets.search import index_tickets
+from tickets.utils import insert_all
+
+User = get_user_model()
+
+REQUIRED = ["title", "description", "application", "submitted_by"]
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            tags = row.get("tags") or ""
+            row["tags"] = [x.strip() for x in tags.split(",") if x.strip()]
+            yield row
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+class Command(BaseCommand):
+    help = "Import tickets from a CSV or JSON lines file in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="the CSV or JSON lines file to import")
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="the format of the input (default: from the file extension)",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="processes used to render markdown (0 to render in this process)",
+        )
+        parser.add_argument(
+            "--default-user",
+            help="username used for records whose submitter doesn't exist",
+        )
+        parser.add_argument(
+            "--state",
+            help="file that records the progress of the import "
+            "(default: <path>.import-state)",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="ignore the state file and import from the first record",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt not in READERS:
+            raise CommandError("Unknown input format '{}'.".format(fmt))
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        self.state_path = options["state"] or path + ".import-state"
+        done = 0 if options["restart"] else self.read_state()
+        if done:
+            self.stdout.write("Resuming after the first {:,} records.".format(done))
+
+        self.users = {}
+        self.applications = {x.slug: x for x in Application.objects.all()}
+        self.tags = {}
+        self.default_user = None
+        if options["default_user"]:
+            self.default_user = self.get_user(options["default_user"])
+            if self.default_user is None:
+                raise CommandError(
+                    "User '{}' does not exist.".format(options["default_user"])
+                )
+
+        records = islice(READERS[fmt](path), done, None)
+        executor = None
+        if options["workers"]:
+            executor = ProcessPoolExecutor(options["workers"], initializer=django.setup)
+
+        start = time.time()
+        imported = 0
+        try:
+            while True:
+                batch = list(islice(records, options["batch_size"]))
+                if not batch:
+                    break
+                self.import_batch(batch, done + 1, executor)
+                done += len(batch)
+                imported += len(batch)
+                self.write_state(done)
+                self.stdout.write(
+                    "Imported {:,} tickets ({:,.0f} per second).".format(
+                        imported, imported / max(time.time() - start, 1e-6)
+                    )
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        invalidate_ticket_filters()
+        bump_version(TAGS_VERSION_KEY)
+        bump_version(TICKET_LIST_VERSION_KEY)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        self.stdout.write(
+            self.style.SUCCESS("Finished importing {:,} tickets.".format(imported))
+        )
+
+    def read_state(self):
+        try:
+            with open(self.state_path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def write_state(self, done):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(done))
+        os.replace(tmp, self.state_path)
+
+    def get_user(self, username):
+        if username not in self.users:
+            self.users[username] = User.objects.filter(username=username).first()
+        return self.users[username]
+
+    def get_submitter(self, username, line):
+        user = self.get_user(username) if username else None
+        user = user or self.default_user
+        if user is None:
+            raise CommandError(
+                "Record {}: user '{}' does not exist "
+                "(use --default-user).".format(line, username)
+            )
+        return user
+
+    def get_application(self, name):
+        slug = slugify(name)
+        if slug not in self.applications:
+            application = Application(application=name)
+            application.save()
+            self.applications[slug] = application
+        return self.applications[slug]
+
+    def get_tag_ids(self, names):
+        """Return the ids of the named tags, creating any that don't
+        exist.  New tags are rare, so they are created one at a time to
+        let taggit generate unique slugs."""
+        missing = [x for x in set(names) if x not in self.tags]
+        if missing:
+            for tag in Tag.objects.filter(name__in=missing):
+                self.tags[tag.name] = tag.pk
+            for name in missing:
+                if name not in self.tags:
+                    self.tags[name] = Tag.objects.create(name=name).pk
+        return [self.tags[x] for x in names]
+
+    def build_ticket(self, record, line):
+        missing = [x for x in REQUIRED if not record.get(x)]
+        if missing:
+            raise CommandError(
+                "Record {} is missing {}.".format(line, ", ".join(missing))
+            )
+
+        ticket = Ticket(
+            title=record["title"][:80],
+            description=record["description"],
+            status=record.get("status") or "new",
+            ticket_type=record.get("ticket_type") or "bug",
+            priority=int(record.get("priority") or 3),
+            application=self.get_application(record["application"]),
+            submitted_by=self.get_submitter(record["submitted_by"], line),
+        )
+        if record.get("assigned_to"):
+            ticket.assigned_to = self.get_user(record["assigned_to"])
+        for field in ["status", "ticket_type", "priority"]:
+            value = getattr(ticket, field)
+            if value not in dict(Ticket._meta.get_field(field).choices):
+                raise CommandError(
+                    "Record {}: '{}' is not a valid {}.".format(line, value, field)
+                )
+        return ticket
+
+    def import_batch(self, records, first_line, executor):
+        """Insert the tickets, comments and tags in records in a single
+        transaction."""
+
+        tickets = []
+        comments = []
+        for i, record in enumerate(records):
+            line = first_line + i
+            ticket = self.build_ticket(record, line)
+            ticket._created_on = parse_datetime(record.get("created_on") or "")
+            tickets.append(ticket)
+            for comment in record.get("comments") or []:
+                followup = FollowUp(
+                    comment=comment["comment"],
+                    private=bool(comment.get("private", False)),
+                    submitted_by=self.get_submitter(comment.get("submitted_by"), line),
+                )
+                followup._created_on = parse_datetime(comment.get("created_on") or "")
+                comments.append((ticket, followup))
+
+        # render all of the markdown in the batch at once
+        texts = [x.description for x in tickets]
+        texts += [followup.comment for ticket, followup in comments]
+        if executor is not None:
+            html = list(executor.map(render_markdown, texts, chunksize=50))
+        else:
+            html = [render_markdown(x) for x in texts]
+        for ticket, rendered in zip(tickets, html):
+            ticket.description_html = rendered
+            ticket.description_hash = text_hash(ticket.description)
+        for (ticket, followup), rendered in zip(comments, html[len(tickets) :]):
+            followup.comment_html = rendered
+            followup.comment_hash = text_hash(followup.comment)
+
+        with transaction.atomic():
+            insert_all(Ticket, tickets)
+
+            # created_on is set by auto_now_add when the rows are inserted
+            dated = [x for x in tickets if x._created_on]
+            for ticket in dated:
+                ticket.created_on = ticket._created_on
+            Ticket.all_tickets.bulk_update(dated, ["created_on"])
+
+            followups = []
+            for ticket, followup in comments:
+                followup.ticket = ticket
+                followups.append(followup)
+            insert_all(FollowUp, followups)
+            dated = [x for x in followups if x._created_on]
+            for followup in dated:
+                followup.created_on = followup._created_on
+            FollowUp.all_comments.bulk_update(dated, ["created_on"])
+
+            content_type = ContentType.objects.get_for_model(Ticket)
+            tagged = []
+            for ticket, record in zip(tickets, records):
+                names = list(dict.fromkeys(record.get("tags") or []))
+                for tag_id in self.get_tag_ids(names):
+                    tagged.append(
+                        TaggedItem(
+                            content_type=content_type,
+                            object_id=ticket.pk,
+                            tag_id=tag_id,
+                        )
+                    )
+            TaggedItem.objects.bulk_create(tagged)
+
+            ids = [x.pk for x in tickets]
+            Ticket.all_tickets.filter(pk__in=ids).update_counters()
+            index_tickets(ids)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from tickets.search import rebuild_index, search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full text search index used by the ticket search box."
+
+    def handle(self, *args, **options):
+        backend = search_backend()
+        if backend is None:
+            self.stdout.write(
+                "No search index for this database - searches use icontains."
+            )
+            return
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the {} search index.".format(backend)))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from tickets.models import Ticket
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate the comment counts and last activity of every ticket "
+        "from its followups."
+    )
+
+    def handle(self, *args, **options):
+        updated = Ticket.all_tickets.update_counters()
+        self.stdout.write(
+            self.style.SUCCESS("Updated the counters of {} tickets.".format(updated))
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from tickets.models import RenderTask
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the descriptions and comments still waiting to be rendered "
+        "in the background (e.g. after a restart)."
+    )
+
+    def handle(self, *args, **options):
+        done = RenderTask.objects.run_pending()
+        self.stdout.write(
+            self.style.SUCCESS("Rendered {} descriptions and comments.".format(done))
+        )
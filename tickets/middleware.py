@@ -0,0 +1,135 @@
+"""
+Middleware used by the ticket tracker.
+
+"""
+
+import logging
+import random
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from .timing import RequestTimer, reset_timer, set_timer
+
+logger = logging.getLogger("tickets.timing")
+
+# the Server-Timing metric name of each part of a request
+SERVER_TIMING_METRICS = [
+    ("db", "Database"),
+    ("template", "Templates"),
+    ("markdown", "Markdown"),
+]
+
+
+class TimingMiddleware(object):
+    """
+    Record the number of queries, and the time spent in the database,
+    rendering templates and rendering markdown, for a sample of the
+    requests.
+
+    TICKETS_TIMING_SAMPLE_RATE is the fraction of the requests that are
+    timed (0 to disable, 1 for every request).  The timings of each
+    sampled request are logged to the 'tickets.timing' logger and, if
+    TICKETS_TIMING_HEADER is True, returned in a Server-Timing header so
+    they appear in the browser's developer tools.
+
+    Streamed responses (the exports) are timed until their content has
+    been read, and only logged.
+
+    Note - the template time includes any queries run by the template,
+    so the metrics overlap.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = getattr(settings, "TICKETS_TIMING_SAMPLE_RATE", 0)
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+
+        timer = RequestTimer()
+        with recording(timer):
+            response = self.get_response(request)
+
+        if response.streaming:
+            # the queries and rendering happen as the content is read
+            response.streaming_content = timed_stream(
+                request, response, timer, response.streaming_content
+            )
+            return response
+
+        total = timer.elapsed()
+        if getattr(settings, "TICKETS_TIMING_HEADER", False):
+            response["Server-Timing"] = server_timing(timer, total)
+        log_timing(request, response, timer, total)
+        return response
+
+
+@contextmanager
+def recording(timer):
+    """Record the queries on every connection, and the timed() blocks,
+    in timer for the duration of the block."""
+    token = set_timer(timer)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer.execute_wrapper))
+            yield
+    finally:
+        reset_timer(token)
+
+
+def timed_stream(request, response, timer, content):
+    """Yield the chunks of a streamed response, recording the work done
+    to produce each of them in timer, and log the timings once the
+    response has been read (there is no Server-Timing header - the
+    headers have been sent by then)."""
+    content = iter(content)
+    try:
+        while True:
+            with recording(timer):
+                chunk = next(content, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        log_timing(request, response, timer, timer.elapsed())
+
+
+def server_timing(timer, total):
+    """Return the value of the Server-Timing header for timer."""
+    metrics = []
+    for name, description in SERVER_TIMING_METRICS:
+        if name == "db":
+            description = "{} ({} queries)".format(description, timer.queries)
+        metrics.append(
+            '{};desc="{}";dur={:.1f}'.format(
+                name, description, timer.durations.get(name, 0.0) * 1000
+            )
+        )
+    metrics.append('total;desc="Total";dur={:.1f}'.format(total * 1000))
+    return ", ".join(metrics)
+
+
+def log_timing(request, response, timer, total):
+    """Log the timings of a request as a single key=value line.  The
+    values are also attached to the record as 'timing' for structured
+    log handlers."""
+    match = getattr(request, "resolver_match", None)
+    timing = {
+        "method": request.method,
+        "path": request.path,
+        "view": match.view_name if match else None,
+        "status": response.status_code,
+        "queries": timer.queries,
+        "total_ms": round(total * 1000, 1),
+    }
+    for name, description in SERVER_TIMING_METRICS:
+        timing[name + "_ms"] = round(timer.durations.get(name, 0.0) * 1000, 1)
+
+    logger.info(
+        " ".join("{}={}".format(key, value) for key, value in timing.items()),
+        extra={"timing": timing},
+    )
@@ -0,0 +1,82 @@
+"""
+Create the full text search index used by the quick search box (see
+tickets/search.py) and populate it from the existing tickets and
+public comments.  The index is only created on SQLite (as an FTS5
+virtual table) and PostgreSQL (as a table of tsvectors with a GIN
+index) - other backends continue to use icontains lookups.  The
+PostgreSQL documents are built with the TICKETS_SEARCH_CONFIG text
+search configuration (run rebuild_search_index after changing it).
+
+"""
+
+from django.conf import settings
+from django.db import migrations
+
+SQLITE_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tickets_ticket_fts
+       USING fts5(title, description, comments, tokenize = 'porter unicode61')""",
+    """INSERT INTO tickets_ticket_fts (rowid, title, description, comments)
+       SELECT t.id, t.title, t.description,
+              COALESCE((SELECT group_concat(f.comment, ' ')
+                        FROM tickets_followup f
+                        WHERE f.ticket_id = t.id AND f.private = 0), '')
+       FROM tickets_ticket t""",
+]
+
+POSTGRES_SQL = [
+    """CREATE TABLE IF NOT EXISTS tickets_ticket_search (
+           ticket_id integer PRIMARY KEY
+               REFERENCES tickets_ticket (id) ON DELETE CASCADE
+               DEFERRABLE INITIALLY DEFERRED,
+           document tsvector NOT NULL)""",
+    """CREATE INDEX IF NOT EXISTS tickets_ticket_search_document_idx
+       ON tickets_ticket_search USING GIN (document)""",
+    """INSERT INTO tickets_ticket_search (ticket_id, document)
+       SELECT t.id,
+              setweight(to_tsvector(%s::regconfig, t.title), 'A') ||
+              setweight(to_tsvector(%s::regconfig, t.description), 'B') ||
+              setweight(to_tsvector(%s::regconfig, COALESCE(
+                  (SELECT string_agg(f.comment, ' ')
+                   FROM tickets_followup f
+                   WHERE f.ticket_id = t.id AND NOT f.private), '')), 'C')
+       FROM tickets_ticket t""",
+]
+
+
+def fts5_available(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        options = [row[0] for row in cursor.fetchall()]
+    return "ENABLE_FTS5" in options
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite" and fts5_available(connection):
+        statements = [(sql, None) for sql in SQLITE_SQL]
+    elif connection.vendor == "postgresql":
+        config = getattr(settings, "TICKETS_SEARCH_CONFIG", "english")
+        statements = [(sql, [config] * sql.count("%s")) for sql in POSTGRES_SQL]
+    else:
+        return
+    for sql, params in statements:
+        schema_editor.execute(sql, params)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS tickets_ticket_fts")
+    elif connection.vendor == "postgresql":
+        schema_editor.execute("DROP TABLE IF EXISTS tickets_ticket_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tickets", "0003_add_id_autofield"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
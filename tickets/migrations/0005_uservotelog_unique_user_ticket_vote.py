@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """Before the unique constraint can be added, remove any extra
+    votes a user may have cast for the same ticket and correct the
+    ticket's vote count."""
+
+    UserVoteLog = apps.get_model("tickets", "UserVoteLog")
+    Ticket = apps.get_model("tickets", "Ticket")
+
+    duplicates = (
+        UserVoteLog.objects.values("user_id", "ticket_id")
+        .annotate(n=models.Count("id"), keep=models.Min("id"))
+        .filter(n__gt=1)
+    )
+    for dup in duplicates:
+        UserVoteLog.objects.filter(
+            user_id=dup["user_id"], ticket_id=dup["ticket_id"]
+        ).exclude(id=dup["keep"]).delete()
+        tickets = Ticket.all_tickets.filter(
+            id=dup["ticket_id"], votes__gte=dup["n"] - 1
+        )
+        tickets.update(votes=models.F("votes") - (dup["n"] - 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tickets", "0004_ticket_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="uservotelog",
+            constraint=models.UniqueConstraint(
+                fields=("user", "ticket"), name="unique_user_ticket_vote"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.12 on 2026-10-18 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0005_uservotelog_unique_user_ticket_vote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='followup',
+            name='comment_hash',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='description_hash',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
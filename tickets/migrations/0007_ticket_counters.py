@@ -0,0 +1,62 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    """Fill in the comment counts and last activity of the existing
+    tickets (see TicketQuerySet.update_counters())."""
+
+    Ticket = apps.get_model("tickets", "Ticket")
+    FollowUp = apps.get_model("tickets", "FollowUp")
+
+    followups = FollowUp.objects.filter(ticket=models.OuterRef("pk")).order_by()
+
+    def count(private):
+        subquery = (
+            followups.filter(private=private)
+            .values("ticket")
+            .annotate(n=models.Count("id"))
+            .values("n")
+        )
+        return Coalesce(models.Subquery(subquery), 0)
+
+    latest = (
+        followups.values("ticket").annotate(x=models.Max("created_on")).values("x")
+    )
+    Ticket.all_tickets.update(
+        comment_count=count(False),
+        private_comment_count=count(True),
+        last_activity=Coalesce(models.Subquery(latest), models.F("created_on")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tickets", "0006_rendered_source_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="comment_count",
+            field=models.IntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="last_activity",
+            field=models.DateTimeField(
+                db_index=True,
+                default=django.utils.timezone.now,
+                editable=False,
+                verbose_name="last activity",
+            ),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="private_comment_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.12 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0007_ticket_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('active', True)), fields=['-created_on', '-id'], name='ticket_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('active', True)), fields=['status', '-created_on', '-id'], name='ticket_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('active', True)), fields=['ticket_type', '-created_on', '-id'], name='ticket_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('active', True)), fields=['assigned_to', '-created_on', '-id'], name='ticket_assigned_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('active', True)), fields=['submitted_by', '-created_on', '-id'], name='ticket_submitted_created_idx'),
+        ),
+    ]
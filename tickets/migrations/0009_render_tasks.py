@@ -0,0 +1,39 @@
+# Generated by Django 3.2.12 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0008_ticket_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderTask',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('ticket', 'Ticket'), ('followup', 'FollowUp')], max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('source_hash', models.CharField(max_length=32)),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('claimed_on', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='followup',
+            name='comment_pending',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='description_pending',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='rendertask',
+            index=models.Index(fields=['kind', 'object_id'], name='rendertask_object_idx'),
+        ),
+    ]
@@ -1,22 +1,150 @@
+import hashlib
+from contextlib import contextmanager
+from datetime import timedelta
+from threading import local
+
 from django.conf import settings
 from django.contrib import admin
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.template.defaultfilters import slugify
 
 # from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import linebreaks
 from markdown2 import markdown
 from taggit.managers import TaggableManager
 
+from .cache import bump_ticket_versions
+from .search import index_tickets
+from .tasks import submit
+from .timing import timed
 from .utils import replace_links
 
-LINK_PATTERNS = getattr(settings, "LINK_PATTERNS", None)
-
 # for markdown2 (<h1> becomes <h3>)
 DEMOTE_HEADERS = 2
 
+# ticket fields included in the search index
+SEARCH_FIELDS = {"title", "description"}
+
+
+def render_markdown(text):
+    """Convert markdown text to html and replace any references to
+    other tickets with hyperlinks."""
+    with timed("markdown"):
+        html = markdown(text, extras={"demote-headers": DEMOTE_HEADERS})
+        link_patterns = getattr(settings, "LINK_PATTERNS", None)
+        return replace_links(html, link_patterns=link_patterns)
+
+
+def render_later(text):
+    """Return True if text is long enough to be rendered in the background
+    (more than TICKETS_ASYNC_RENDER_THRESHOLD characters) rather than
+    while the request waits.  Background rendering is off if the
+    setting is None."""
+    threshold = getattr(settings, "TICKETS_ASYNC_RENDER_THRESHOLD", None)
+    return threshold is not None and len(text) > threshold
+
+
+def plain_text_html(text):
+    """The html shown until text has been rendered - the escaped text
+    with its paragraphs and line breaks kept."""
+    return linebreaks(text, autoescape=True)
+
+
+def text_hash(text):
+    """Return a short digest of text. Used to tell if the markdown source
+    of a ticket or comment has changed since it was last rendered."""
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def render_update_fields(update_fields, source, rendered):
+    """Given the update_fields passed to save(), return the fields that
+    should actually be saved.  The rendered html fields are added if
+    the markdown source is being saved.  update_fields is None for a
+    full save."""
+    if update_fields is None or source not in update_fields:
+        return update_fields
+    return set(update_fields) | set(rendered)
+
+
+# the ids of the tickets being deleted by this thread
+_deleting = local()
+
+
+def deleting_ticket_ids():
+    """Return the ids of the tickets being deleted by this thread."""
+    if not hasattr(_deleting, "ids"):
+        _deleting.ids = set()
+    return _deleting.ids
+
 
-class TicketManager(models.Manager):
+@contextmanager
+def deleting_tickets(ids):
+    """Record ids as being deleted for the duration of the block.
+    Django deletes a ticket's followups before the ticket itself, and
+    the followup post_delete receiver (see tickets.signals) doesn't
+    update the counters of tickets that are being deleted.  The ids are
+    forgotten however the block exits."""
+    deleting = deleting_ticket_ids()
+    added = set(ids) - deleting
+    deleting |= added
+    try:
+        yield
+    finally:
+        deleting -= added
+
+
+class TicketQuerySet(models.QuerySet):
+    """
+    A custom queryset for tickets.
+    """
+
+    def for_list(self):
+        """Return the tickets optimized for list pages - the application
+        and users are fetched in the same query, the tags are
+        prefetched, and the description columns (which are never shown
+        in lists) are not fetched at all."""
+        return (
+            self.select_related("application", "submitted_by", "assigned_to")
+            .defer("description", "description_html", "description_hash")
+            .prefetch_related("tags")
+        )
+
+    def delete(self):
+        with deleting_tickets(self.values_list("pk", flat=True)):
+            return super(TicketQuerySet, self).delete()
+
+    def update_counters(self):
+        """Recalculate the comment counts and last_activity of the
+        tickets in this queryset from their followups in a single
+        UPDATE.  The counters are normally maintained incrementally by
+        FollowUp.save() - this is used when that isn't possible (e.g.
+        after a followup is deleted) and by the rebuild_ticket_counters
+        command."""
+
+        followups = FollowUp.all_comments.filter(ticket=OuterRef("pk")).order_by()
+
+        def count(private):
+            subquery = (
+                followups.filter(private=private)
+                .values("ticket")
+                .annotate(n=Count("id"))
+                .values("n")
+            )
+            return Coalesce(Subquery(subquery), 0)
+
+        latest = followups.values("ticket").annotate(x=Max("created_on")).values("x")
+        return self.update(
+            comment_count=count(False),
+            private_comment_count=count(True),
+            last_activity=Coalesce(Subquery(latest), F("created_on")),
+        )
+
+
+class TicketManager(models.Manager.from_queryset(TicketQuerySet)):
     """
     A custom model manager for tickets.
 
@@ -95,6 +223,9 @@ class Ticket(models.Model):
         ("split", "Closed - Split"),
     ]
 
+    # the statuses of tickets that are no longer open
+    CLOSED_STATUSES = ["closed", "duplicate", "split"]
+
     TICKET_TYPE_CHOICES = [
         ("feature", "Feature Request"),
         ("bug", "Bug Report"),
@@ -135,20 +266,59 @@ class Ticket(models.Model):
     title = models.CharField(max_length=80)
     description = models.TextField()
     description_html = models.TextField(editable=False, blank=True)
+    description_hash = models.CharField(max_length=32, editable=False, blank=True)
+    # True while description_html is plain text waiting to be rendered
+    description_pending = models.BooleanField(default=False, editable=False)
     priority = models.IntegerField(choices=TICKET_PRIORITY_CHOICES, db_index=True)
     created_on = models.DateTimeField("date created", auto_now_add=True)
     updated_on = models.DateTimeField("date updated", auto_now=True)
     votes = models.IntegerField(default=0)
+    # denormalized from the followups - see FollowUp.save()
+    comment_count = models.IntegerField(default=0, editable=False, db_index=True)
+    private_comment_count = models.IntegerField(default=0, editable=False)
+    last_activity = models.DateTimeField(
+        "last activity", default=timezone.now, editable=False, db_index=True
+    )
     parent = models.ForeignKey("self", blank=True, null=True, on_delete=models.CASCADE)
     application = models.ForeignKey(Application, on_delete=models.CASCADE)
 
     tags = TaggableManager(blank=True)
 
-    all_tickets = models.Manager()
+    all_tickets = TicketQuerySet.as_manager()
     objects = TicketManager()
 
     class Meta:
         ordering = ["-created_on"]
+        # the list views only show active tickets, newest first (see
+        # tickets.pagination.KEYSET_ORDERING), optionally narrowed by
+        # status, type or user.
+        indexes = [
+            models.Index(
+                fields=["-created_on", "-id"],
+                condition=models.Q(active=True),
+                name="ticket_active_created_idx",
+            ),
+            models.Index(
+                fields=["status", "-created_on", "-id"],
+                condition=models.Q(active=True),
+                name="ticket_status_created_idx",
+            ),
+            models.Index(
+                fields=["ticket_type", "-created_on", "-id"],
+                condition=models.Q(active=True),
+                name="ticket_type_created_idx",
+            ),
+            models.Index(
+                fields=["assigned_to", "-created_on", "-id"],
+                condition=models.Q(active=True),
+                name="ticket_assigned_created_idx",
+            ),
+            models.Index(
+                fields=["submitted_by", "-created_on", "-id"],
+                condition=models.Q(active=True),
+                name="ticket_submitted_created_idx",
+            ),
+        ]
 
     def __str__(self):
         name = self.description.split("\n", 1)[0]
@@ -164,28 +334,84 @@ class Ticket(models.Model):
         url = reverse("tickets:ticket_detail", kwargs={"pk": self.id})
         return url
 
-    def save(self, *args, **kwargs):
-        self.description_html = markdown(
-            self.description, extras={"demote-headers": DEMOTE_HEADERS}
-        )
-        self.description_html = replace_links(
-            self.description_html, link_patterns=LINK_PATTERNS
-        )
+    def delete(self, *args, **kwargs):
+        with deleting_tickets([self.pk]):
+            return super(Ticket, self).delete(*args, **kwargs)
 
-        super(Ticket, self).save(*args, **kwargs)
+    def save(self, *args, **kwargs):
+        """Render the description to html (only if it has changed) and
+        update the search index.  Saves that pass update_fields only
+        render and re-index if the description or title are included,
+        so status changes just write the columns they touch.  Very large
+        descriptions are queued to be rendered in the background, in the
+        same transaction as the ticket."""
+
+        update_fields = kwargs.get("update_fields")
+        rendered = False
+        if update_fields is None or "description" in update_fields:
+            rendered = self.render_description()
+            kwargs["update_fields"] = render_update_fields(
+                update_fields,
+                "description",
+                ["description_html", "description_hash", "description_pending"],
+            )
+
+        if rendered and self.description_pending:
+            with transaction.atomic():
+                super(Ticket, self).save(*args, **kwargs)
+                RenderTask.objects.enqueue("ticket", [self])
+        else:
+            super(Ticket, self).save(*args, **kwargs)
+
+        if update_fields is None or SEARCH_FIELDS & set(update_fields):
+            index_tickets([self.pk])
+
+    def render_description(self):
+        """Convert the description to html, unless it has not changed
+        since it was last rendered.  Returns True if the html was
+        re-rendered.  Very large descriptions are shown as plain text
+        and flagged as pending until they are rendered in the
+        background (see RenderTask)."""
+        digest = text_hash(self.description)
+        if digest == self.description_hash:
+            return False
+        self.description_pending = render_later(self.description)
+        if self.description_pending:
+            self.description_html = plain_text_html(self.description)
+        else:
+            self.description_html = render_markdown(self.description)
+        self.description_hash = digest
+        return True
 
     def up_vote(self):
         """A method to increment the number of votes associated with a
-        ticket."""
-        self.votes += 1
-        self.save()
+        ticket.  The increment is done by the database in a single
+        UPDATE so concurrent votes are never lost."""
+        Ticket.all_tickets.filter(pk=self.pk).update(votes=F("votes") + 1)
+        self.refresh_from_db(fields=["votes"])
 
     def down_vote(self):
         """A method to decrement the number of votes associated with a
         ticket."""
-        if self.votes > 0:
-            self.votes -= 1
-            self.save()
+        Ticket.all_tickets.filter(pk=self.pk, votes__gt=0).update(
+            votes=F("votes") - 1
+        )
+        self.refresh_from_db(fields=["votes"])
+
+    def add_vote(self, user):
+        """Record a vote for this ticket by user.  Returns True if the
+        vote was counted, or False if the user had already voted for
+        this ticket (enforced by the unique constraint on UserVoteLog,
+        so it is safe under concurrent requests).
+        """
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    UserVoteLog.objects.create(ticket=self, user=user)
+            except IntegrityError:
+                return False
+            self.up_vote()
+        return True
 
     def duplicate_of(self, original_pk):
         """a method to flag this ticket as a duplicate of another.
@@ -240,7 +466,7 @@ class Ticket(models.Model):
         """a boolean method to indicate if this ticket is open or
         closed.  Makes templating much simpler.
         """
-        if self.status in ("closed", "duplicate", "split"):
+        if self.status in self.CLOSED_STATUSES:
             return True
         else:
             return False
@@ -281,6 +507,13 @@ class UserVoteLog(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ticket"], name="unique_user_ticket_vote"
+            )
+        ]
+
 
 class FollowUp(models.Model):
     """
@@ -308,6 +541,9 @@ class FollowUp(models.Model):
     comment = models.TextField()
 
     comment_html = models.TextField(editable=False, blank=True)
+    comment_hash = models.CharField(max_length=32, editable=False, blank=True)
+    # True while comment_html is plain text waiting to be rendered
+    comment_pending = models.BooleanField(default=False, editable=False)
     # closed = models.BooleanField(default=False)
 
     action = models.CharField(
@@ -319,18 +555,171 @@ class FollowUp(models.Model):
     all_comments = models.Manager()
 
     def save(self, *args, **kwargs):
-        self.comment_html = markdown(
-            self.comment, extras={"demote-headers": DEMOTE_HEADERS}
-        )
-        self.comment_html = replace_links(
-            self.comment_html, link_patterns=LINK_PATTERNS
+        """Render the comment to html (only if it has changed), update the
+        comment counts and last_activity of the associated ticket, and
+        update its search document."""
+
+        update_fields = kwargs.get("update_fields")
+        rendered = False
+        if update_fields is None or "comment" in update_fields:
+            rendered = self.render_comment()
+            kwargs["update_fields"] = render_update_fields(
+                update_fields,
+                "comment",
+                ["comment_html", "comment_hash", "comment_pending"],
+            )
+
+        adding = self._state.adding
+        with transaction.atomic():
+            super(FollowUp, self).save(*args, **kwargs)
+            tickets = Ticket.all_tickets.filter(pk=self.ticket_id)
+            if adding:
+                counter = "private_comment_count" if self.private else "comment_count"
+                tickets.update(
+                    **{counter: F(counter) + 1, "last_activity": self.created_on}
+                )
+            elif update_fields is None or "private" in update_fields:
+                # the comment may have been made public or private
+                tickets.update_counters()
+            if rendered and self.comment_pending:
+                RenderTask.objects.enqueue("followup", [self])
+
+        if update_fields is None or {"comment", "private"} & set(update_fields):
+            index_tickets([self.ticket_id])
+
+    def render_comment(self):
+        """Convert the comment to html, unless it has not changed since it
+        was last rendered.  Returns True if the html was re-rendered."""
+        digest = text_hash(self.comment)
+        if digest == self.comment_hash:
+            return False
+        self.comment_pending = render_later(self.comment)
+        if self.comment_pending:
+            self.comment_html = plain_text_html(self.comment)
+        else:
+            self.comment_html = render_markdown(self.comment)
+        self.comment_hash = digest
+        return True
+
+
+class RenderTaskManager(models.Manager):
+    """
+    The queue of descriptions and comments waiting to be rendered.
+    """
+
+    def enqueue(self, kind, objects):
+        """Queue the markdown of each of objects (tickets or followups,
+        given by kind) to be rendered by the worker pool once the
+        current transaction commits.  Any task already queued for an
+        object is replaced."""
+        source_hash = RenderTask.SOURCES[kind][1]
+        ids = [x.pk for x in objects]
+        self.filter(kind=kind, object_id__in=ids).delete()
+        self.bulk_create(
+            [
+                RenderTask(
+                    kind=kind,
+                    object_id=x.pk,
+                    source_hash=getattr(x, source_hash),
+                )
+                for x in objects
+            ]
         )
+        submit(self.run_pending)
+
+    def run_pending(self):
+        """Render the queued tasks one at a time until there are none
+        left.  Each task is claimed with a conditional UPDATE, so several
+        workers (or processes) can share the queue.  Tasks claimed more
+        than STALE_AFTER ago (e.g. by a process that exited) are run
+        again, up to MAX_ATTEMPTS times.  Returns the number of tasks
+        run."""
+        done = 0
+        while True:
+            stale = timezone.now() - RenderTask.STALE_AFTER
+            unclaimed = models.Q(claimed_on__isnull=True) | models.Q(
+                claimed_on__lt=stale
+            )
+            task = (
+                self.filter(unclaimed, attempts__lt=RenderTask.MAX_ATTEMPTS)
+                .order_by("pk")
+                .first()
+            )
+            if task is None:
+                return done
+            claimed = self.filter(pk=task.pk, attempts=task.attempts).update(
+                claimed_on=timezone.now(), attempts=F("attempts") + 1
+            )
+            if claimed:
+                task.run()
+                done += 1
+
+
+class RenderTask(models.Model):
+    """
+    A description or comment that is shown as plain text until its
+    markdown has been rendered by the worker pool (see tickets.tasks).
+    Created for sources longer than TICKETS_ASYNC_RENDER_THRESHOLD so
+    saving them doesn't wait for markdown2.
+
+    The queue is kept in the database, so tasks survive a restart -
+    the render_pending command runs anything left behind.
+
+    """
+
+    # the source, hash, html and pending fields of each kind of object
+    SOURCES = {
+        "ticket": (
+            "description",
+            "description_hash",
+            "description_html",
+            "description_pending",
+        ),
+        "followup": ("comment", "comment_hash", "comment_html", "comment_pending"),
+    }
+
+    KIND_CHOICES = [("ticket", "Ticket"), ("followup", "FollowUp")]
+
+    STALE_AFTER = timedelta(minutes=10)
+    MAX_ATTEMPTS = 3
 
-        super(FollowUp, self).save(*args, **kwargs)
+    id = models.AutoField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    # the hash of the source when the task was queued - the html isn't
+    # saved if the source has changed since
+    source_hash = models.CharField(max_length=32)
+    created_on = models.DateTimeField("date created", auto_now_add=True)
+    claimed_on = models.DateTimeField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+
+    objects = RenderTaskManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["kind", "object_id"], name="rendertask_object_idx")
+        ]
+
+    def __str__(self):
+        return "{} {}".format(self.kind, self.object_id)
 
+    def get_model(self):
+        return Ticket if self.kind == "ticket" else FollowUp
 
-class TicketAdmin(admin.ModelAdmin):
-    date_heirarchy = "created_on"
-    list_filter = ("status",)
-    list_display = ("id", "name", "status", "assigned_to")
-    search_field = ["description"]
+    def run(self):
+        """Render the source and save the html, unless the source has
+        changed since the task was queued."""
+        source, source_hash, html, pending = self.SOURCES[self.kind]
+        rows = self.get_model()._base_manager.filter(
+            pk=self.object_id, **{source_hash: self.source_hash}
+        )
+        text = rows.values_list(source, flat=True).first()
+        if text is not None:
+            rows.update(**{html: render_markdown(text), pending: False})
+            if self.kind == "ticket":
+                ticket_id = self.object_id
+            else:
+                ticket_id = rows.values_list("ticket_id", flat=True).first()
+            # update() doesn't send post_save - replace the cached pages
+            bump_ticket_versions([ticket_id])
+        self.delete()
@@ -0,0 +1,152 @@
+"""
+Keyset (cursor) pagination for the ticket lists.
+
+Offset pagination requires a COUNT(*) of the filtered tickets and an
+OFFSET that makes the database walk past every ticket on the previous
+pages, so deep pages get slower and slower.  Keyset pagination instead
+remembers the (created_on, id) of the last ticket on the page and asks
+for the tickets that come after it, which can be answered from an index
+on created_on no matter how deep the page is.
+
+The position is passed between pages as an opaque 'cursor' GET
+parameter.
+
+"""
+
+import base64
+
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+# the ordering required for keyset pagination - newest first, ties
+# broken by id so every ticket has a unique position.
+KEYSET_ORDERING = ("-created_on", "-id")
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(direction, ticket):
+    """Return a url-safe token for the position of ticket.  direction
+    is 'n' for the page after the ticket or 'p' for the page before."""
+    value = "{}|{}|{}".format(direction, ticket.created_on.isoformat(), ticket.pk)
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return the direction, created_on and id encoded in cursor.  Raises
+    InvalidCursor if the token has been mangled."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, created_on, pk = value.split("|")
+        created_on = parse_datetime(created_on)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if direction not in ("n", "p") or created_on is None:
+        raise InvalidCursor(cursor)
+    return direction, created_on, pk
+
+
+class KeysetPage(object):
+    """A page of tickets returned by KeysetPaginator.  Provides the
+    parts of the django Page interface that the templates use, plus
+    the cursors for the next and previous pages."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return "<KeysetPage of {} tickets>".format(len(self.object_list))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor("n", self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor("p", self.object_list[0])
+
+
+class KeysetPaginator(object):
+    """Paginate a ticket queryset ordered by KEYSET_ORDERING without
+    counting it or using OFFSET."""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+
+    def page(self, cursor=None):
+        """Return the KeysetPage following (or preceding) the position in
+        cursor, or the first page if cursor is empty."""
+
+        tickets = self.queryset
+        direction = None
+        if cursor:
+            direction, created_on, pk = decode_cursor(cursor)
+            if direction == "n":
+                tickets = tickets.filter(created_on__lte=created_on).exclude(
+                    created_on=created_on, id__gte=pk
+                )
+            else:
+                tickets = (
+                    tickets.filter(created_on__gte=created_on)
+                    .exclude(created_on=created_on, id__lte=pk)
+                    .order_by("created_on", "id")
+                )
+
+        # fetch one extra ticket to find out if there is another page
+        object_list = list(tickets[: self.per_page + 1])
+        more = len(object_list) > self.per_page
+        object_list = object_list[: self.per_page]
+
+        if direction == "p":
+            object_list.reverse()
+            return KeysetPage(object_list, self, has_next=True, has_previous=more)
+        return KeysetPage(
+            object_list, self, has_next=more, has_previous=direction == "n"
+        )
+
+
+class KeysetPaginationMixin(object):
+    """
+    A mixin for ListViews of tickets.  Querysets in KEYSET_ORDERING are
+    paginated with a KeysetPaginator using the 'cursor' GET parameter.
+    Any other queryset (e.g. search results ordered by relevance) falls
+    back to django's Paginator and the 'page' GET parameter.
+    """
+
+    def paginate_queryset(self, queryset, page_size):
+        if tuple(queryset.query.order_by) != KEYSET_ORDERING:
+            return super(KeysetPaginationMixin, self).paginate_queryset(
+                queryset, page_size
+            )
+
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get("cursor"))
+        except InvalidCursor:
+            raise Http404("Invalid cursor.")
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,221 @@
+"""
+Full text search for tickets.
+
+The quick search box used to filter tickets with icontains lookups on
+the title and description, which requires a sequential scan of every
+ticket.  Instead, a search index is kept alongside the ticket table:
+
+- on SQLite, an FTS5 virtual table (tickets_ticket_fts) whose rowid is
+  the ticket id,
+
+- on PostgreSQL, a table of tsvectors (tickets_ticket_search) with a
+  GIN index.
+
+Each index document contains the ticket title, its description and the
+text of all of its public comments.  The index is created by the
+0004_ticket_search_index migration and is updated by Ticket.save(),
+FollowUp.save() and the delete signals in tickets/signals.py.  Other
+database backends (or SQLite builds without FTS5) fall back to the
+original icontains filter.
+
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SQLITE_TABLE = "tickets_ticket_fts"
+POSTGRES_TABLE = "tickets_ticket_search"
+
+# the number of ticket ids included in each index update statement
+BATCH_SIZE = 500
+
+_available = {}
+
+
+def get_search_config():
+    """The text search configuration used by PostgreSQL."""
+    return getattr(settings, "TICKETS_SEARCH_CONFIG", "english")
+
+
+def search_backend():
+    """Return 'sqlite' or 'postgresql' if the search index exists for the
+    current database, or None if searches should use icontains."""
+
+    vendor = connection.vendor
+    if vendor not in ("sqlite", "postgresql"):
+        return None
+    if connection.alias not in _available:
+        table = SQLITE_TABLE if vendor == "sqlite" else POSTGRES_TABLE
+        tables = connection.introspection.table_names()
+        _available[connection.alias] = table in tables
+    return vendor if _available[connection.alias] else None
+
+
+def fts_query(q):
+    """Convert the text entered in the search box into an FTS5 query.
+    Each word is quoted (so punctuation can't produce a syntax error)
+    and treated as a prefix.  All of the words must match."""
+    words = re.findall(r"\w+", q)
+    return " ".join('"{}"*'.format(word) for word in words)
+
+
+def search_tickets(tickets, q):
+    """Filter the ticket queryset to those tickets that match the
+    search string q, and order them by relevance (best match first,
+    then newest first).  The relevance is available as the
+    search_rank attribute of each ticket."""
+
+    backend = search_backend()
+
+    if backend == "sqlite":
+        match = fts_query(q)
+        if match:
+            ids = "SELECT rowid FROM {0} WHERE {0} MATCH %s".format(SQLITE_TABLE)
+            # bm25() is smaller for better matches - title matches
+            # outweigh description matches which outweigh comments.
+            rank = (
+                "SELECT -bm25({0}, 10.0, 4.0, 1.0) FROM {0} "
+                'WHERE {0} MATCH %s AND rowid = "tickets_ticket"."id"'
+            ).format(SQLITE_TABLE)
+            return (
+                tickets.filter(id__in=RawSQL(ids, [match]))
+                .annotate(search_rank=RawSQL(rank, [match], output_field=FloatField()))
+                .order_by("-search_rank", "-created_on")
+            )
+
+    elif backend == "postgresql":
+        config = get_search_config()
+        ids = (
+            "SELECT ticket_id FROM {0} "
+            "WHERE document @@ plainto_tsquery(%s::regconfig, %s)"
+        ).format(POSTGRES_TABLE)
+        rank = (
+            "SELECT ts_rank(document, plainto_tsquery(%s::regconfig, %s)) "
+            'FROM {0} WHERE ticket_id = "tickets_ticket"."id"'
+        ).format(POSTGRES_TABLE)
+        return (
+            tickets.filter(id__in=RawSQL(ids, [config, q]))
+            .annotate(
+                search_rank=RawSQL(rank, [config, q], output_field=FloatField())
+            )
+            .order_by("-search_rank", "-created_on")
+        )
+
+    return tickets.filter(Q(description__icontains=q) | Q(title__icontains=q))
+
+
+def _batches(ticket_ids):
+    ticket_ids = sorted(set(ticket_ids))
+    for i in range(0, len(ticket_ids), BATCH_SIZE):
+        yield ticket_ids[i : i + BATCH_SIZE]
+
+
+def index_tickets(ticket_ids):
+    """(Re)build the search documents for the tickets in ticket_ids.
+    The documents are built in the database from the ticket and
+    comment tables, so only ids are needed."""
+
+    backend = search_backend()
+    if backend is None:
+        return
+
+    with connection.cursor() as cursor:
+        for batch in _batches(ticket_ids):
+            placeholders = ", ".join(["%s"] * len(batch))
+            if backend == "sqlite":
+                cursor.execute(
+                    "DELETE FROM {} WHERE rowid IN ({})".format(
+                        SQLITE_TABLE, placeholders
+                    ),
+                    batch,
+                )
+                cursor.execute(
+                    SQLITE_INDEX_SQL.format(
+                        table=SQLITE_TABLE, where="t.id IN ({})".format(placeholders)
+                    ),
+                    [False] + batch,
+                )
+            else:
+                cursor.execute(
+                    "DELETE FROM {} WHERE ticket_id IN ({})".format(
+                        POSTGRES_TABLE, placeholders
+                    ),
+                    batch,
+                )
+                config = get_search_config()
+                cursor.execute(
+                    POSTGRES_INDEX_SQL.format(
+                        table=POSTGRES_TABLE,
+                        where="t.id IN ({})".format(placeholders),
+                    ),
+                    [config, config, config, False] + batch,
+                )
+
+
+def remove_tickets(ticket_ids):
+    """Remove the search documents for the tickets in ticket_ids."""
+
+    backend = search_backend()
+    if backend is None:
+        return
+
+    table, column = (
+        (SQLITE_TABLE, "rowid") if backend == "sqlite" else (POSTGRES_TABLE, "ticket_id")
+    )
+    with connection.cursor() as cursor:
+        for batch in _batches(ticket_ids):
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                "DELETE FROM {} WHERE {} IN ({})".format(table, column, placeholders),
+                batch,
+            )
+
+
+def rebuild_index():
+    """Rebuild the search document for every ticket."""
+
+    backend = search_backend()
+    if backend is None:
+        return
+
+    with connection.cursor() as cursor:
+        if backend == "sqlite":
+            cursor.execute("DELETE FROM {}".format(SQLITE_TABLE))
+            cursor.execute(
+                SQLITE_INDEX_SQL.format(table=SQLITE_TABLE, where="1 = 1"), [False]
+            )
+        else:
+            config = get_search_config()
+            cursor.execute("DELETE FROM {}".format(POSTGRES_TABLE))
+            cursor.execute(
+                POSTGRES_INDEX_SQL.format(table=POSTGRES_TABLE, where="1 = 1"),
+                [config, config, config, False],
+            )
+
+
+SQLITE_INDEX_SQL = """
+INSERT INTO {table} (rowid, title, description, comments)
+SELECT t.id, t.title, t.description,
+       COALESCE((SELECT group_concat(f.comment, ' ')
+                 FROM tickets_followup f
+                 WHERE f.ticket_id = t.id AND f.private = %s), '')
+FROM tickets_ticket t
+WHERE {where}
+"""
+
+POSTGRES_INDEX_SQL = """
+INSERT INTO {table} (ticket_id, document)
+SELECT t.id,
+       setweight(to_tsvector(%s::regconfig, t.title), 'A') ||
+       setweight(to_tsvector(%s::regconfig, t.description), 'B') ||
+       setweight(to_tsvector(%s::regconfig, COALESCE(
+           (SELECT string_agg(f.comment, ' ')
+            FROM tickets_followup f
+            WHERE f.ticket_id = t.id AND f.private = %s), '')), 'C')
+FROM tickets_ticket t
+WHERE {where}
+"""
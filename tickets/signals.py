@@ -0,0 +1,208 @@
+"""
+Signal handlers that keep the cached values used by the ticket tracker
+in sync with the database.
+
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from taggit.models import Tag, TaggedItem
+
+from .cache import (
+    TAGS_VERSION_KEY,
+    TICKET_LIST_VERSION_KEY,
+    bump_ticket_versions,
+    bump_version,
+    invalidate_admin,
+    invalidate_choices,
+    invalidate_ticket_filters,
+)
+from .models import (
+    Application,
+    FollowUp,
+    Ticket,
+    TicketDuplicate,
+    UserVoteLog,
+    deleting_ticket_ids,
+)
+from .search import index_tickets, remove_tickets
+
+User = get_user_model()
+
+# ticket fields that appear in the filters on the ticket list pages
+TICKET_FILTER_FIELDS = {"active", "application", "assigned_to", "submitted_by"}
+
+# user fields that appear in the user choices on the ticket forms
+USER_CHOICE_FIELDS = {"username", "first_name", "last_name", "is_staff"}
+
+
+def related_ticket_ids(pk):
+    """Return the ids of the tickets whose pages show ticket pk - its
+    children, the tickets it duplicates and its duplicates."""
+    ids = list(Ticket.all_tickets.filter(parent=pk).values_list("pk", flat=True))
+    for ticket_id, original_id in TicketDuplicate.objects.filter(
+        Q(ticket=pk) | Q(original=pk)
+    ).values_list("ticket_id", "original_id"):
+        ids += [ticket_id, original_id]
+    return ids
+
+
+def user_ticket_ids(user):
+    """Return the ids of the tickets whose pages show user - the tickets
+    they submitted, are assigned to, or commented on."""
+    tickets = Ticket.all_tickets.filter(Q(submitted_by=user) | Q(assigned_to=user))
+    comments = FollowUp.all_comments.filter(submitted_by=user)
+    return set(tickets.values_list("pk", flat=True)) | set(
+        comments.values_list("ticket_id", flat=True)
+    )
+
+
+def affects(update_fields, fields):
+    """Return True if a save with update_fields could have changed
+    any of fields.  update_fields is None for a regular save()."""
+    return update_fields is None or bool(set(update_fields) & set(fields))
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or affects(update_fields, TICKET_FILTER_FIELDS):
+        invalidate_ticket_filters()
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+@receiver(post_delete, sender=Ticket)
+def ticket_filters_changed(sender, instance, **kwargs):
+    invalidate_ticket_filters()
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+def application_choices_changed(sender, instance, **kwargs):
+    invalidate_choices()
+
+
+@receiver(post_save, sender=Application)
+def application_saved(sender, instance, created, **kwargs):
+    # the detail pages show the name of the ticket's application.  When
+    # an application is deleted, its tickets are deleted too.
+    if not created:
+        ids = Ticket.all_tickets.filter(application=instance)
+        bump_ticket_versions(ids.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Ticket)
+def remove_ticket_from_search_index(sender, instance, **kwargs):
+    remove_tickets([instance.pk])
+
+
+@receiver(post_delete, sender=FollowUp)
+def followup_deleted(sender, instance, **kwargs):
+    # update the ticket's counters and search document, unless the
+    # ticket itself is being deleted (see Ticket.delete()).
+    if instance.ticket_id in deleting_ticket_ids():
+        return
+    tickets = Ticket.all_tickets.filter(pk=instance.ticket_id)
+    if tickets.update_counters():
+        index_tickets([instance.ticket_id])
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, instance, **kwargs):
+    bump_version(TAGS_VERSION_KEY)
+
+
+# every change to what is shown for a ticket (by the API or the detail
+# page) increments its version, so its ETag and cached fragments
+# change even when updated_on doesn't - see tickets.conditional.
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def ticket_version_changed(sender, instance, **kwargs):
+    # the parent lists this ticket as one of its children
+    bump_ticket_versions([instance.pk, instance.parent_id])
+    # the ticket may have moved in or out of any of the ticket lists
+    bump_version(TICKET_LIST_VERSION_KEY)
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_description_changed(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    # the children and duplicates of a ticket (and the tickets it
+    # duplicates) show the start of its description.  When a ticket is
+    # deleted, they are deleted too or send their own signals.
+    if not created and affects(update_fields, {"description"}):
+        bump_ticket_versions(related_ticket_ids(instance.pk))
+
+
+@receiver(post_save, sender=FollowUp)
+@receiver(post_delete, sender=FollowUp)
+@receiver(post_save, sender=UserVoteLog)
+@receiver(post_delete, sender=UserVoteLog)
+def ticket_related_version_changed(sender, instance, **kwargs):
+    bump_ticket_versions([instance.ticket_id])
+
+
+@receiver(post_save, sender=TicketDuplicate)
+@receiver(post_delete, sender=TicketDuplicate)
+def duplicate_version_changed(sender, instance, **kwargs):
+    bump_ticket_versions([instance.ticket_id, instance.original_id])
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def ticket_tags_changed(sender, instance, **kwargs):
+    if instance.content_type_id == ContentType.objects.get_for_model(Ticket).id:
+        bump_ticket_versions([instance.object_id])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # users are saved every time they log in - only the username matters.
+    if created or affects(update_fields, {"username"}):
+        invalidate_ticket_filters()
+    if not created and affects(update_fields, {"username"}):
+        # the detail pages show the user's name with each comment
+        bump_ticket_versions(user_ticket_ids(instance))
+    if created or affects(update_fields, USER_CHOICE_FIELDS):
+        invalidate_choices()
+    if created:
+        # ids can be reused (e.g. after a rollback)
+        invalidate_admin([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_ticket_filters()
+    invalidate_choices()
+    invalidate_admin([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+    if not reverse:
+        # user.groups.add(...) etc.
+        invalidate_admin([instance.pk])
+        instance.__dict__.pop("_tickets_is_admin", None)
+    elif action == "pre_clear":
+        # group.user_set.clear() - pk_set is not provided
+        invalidate_admin(instance.user_set.values_list("pk", flat=True))
+    elif pk_set:
+        invalidate_admin(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # the group may have been renamed to or from 'admin', or deleted
+    # without sending m2m_changed for its members.
+    invalidate_admin(instance.user_set.values_list("pk", flat=True))
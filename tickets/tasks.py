@@ -0,0 +1,66 @@
+"""
+A small in-process worker pool for work that shouldn't hold up a
+request - currently rendering very large descriptions and comments
+(see RenderTask in tickets/models.py).
+
+The work itself is recorded in the database, so nothing is lost if the
+process exits before the pool gets to it (run the render_pending
+command to finish it) and no message broker is needed.  submit() only
+wakes the pool up once the transaction that queued the work commits.
+
+TICKETS_RENDER_WORKERS sets the number of threads in the pool.  With 0,
+the work is done in the requesting thread as soon as the transaction
+commits (used by the tests).
+
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = Lock()
+
+
+def get_workers():
+    return getattr(settings, "TICKETS_RENDER_WORKERS", 2)
+
+
+def get_executor():
+    """Return the worker pool, creating it on first use."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_workers(), thread_name_prefix="tickets"
+            )
+        return _executor
+
+
+def _run_in_worker(func):
+    # each worker thread has its own database connection
+    close_old_connections()
+    try:
+        func()
+    except Exception:
+        logger.exception("Background task failed.")
+    finally:
+        connection.close()
+
+
+def submit(func):
+    """Call func in the worker pool once the current transaction (if
+    any) commits."""
+
+    def dispatch():
+        if get_workers():
+            get_executor().submit(_run_in_worker, func)
+        else:
+            func()
+
+    transaction.on_commit(dispatch)
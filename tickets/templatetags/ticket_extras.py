@@ -2,6 +2,8 @@ from django import template
 from django.template.defaultfilters import stringfilter
 from django.utils.safestring import mark_safe
 
+from ..cache import get_fragment_cache
+
 register = template.Library()
 
 
@@ -224,14 +226,19 @@ def query_transform(context, include_page=False, **kwargs):
     'refinement' widgets.  Without, refinement widgets may point to a
     page that doesn't exist after the new filter has been applied.
 
+    The same applies to the 'cursor' parameter used by the keyset
+    paginated ticket lists.  A cursor and a page number are never
+    included together - setting one removes the other.
+
     """
 
     query = context["request"].GET.copy()
     for k, v in kwargs.items():
         query[k] = v
 
-    if query.get("page") and not include_page:
-        query.pop("page")
+    for param, other in (("page", "cursor"), ("cursor", "page")):
+        if param in query and (not include_page or other in kwargs):
+            query.pop(param)
     return query.urlencode()
 
 @register.filter
@@ -248,4 +255,18 @@ def required_field_asterisk(field):
     else:
          html = '<label class="form-label" for="id_{0}">{1}:</label>'
     html = html.format(field.name, field.label)
-    return mark_safe(html)
\ No newline at end of file
+    return mark_safe(html)
+
+
+@register.simple_tag
+def fragment_cache(name):
+    """
+    Return the cache alias, timeout and version of one of the cached
+    template fragments listed in tickets.cache.FRAGMENTS, for use with
+    the cache tag:
+
+    {% fragment_cache "nav" as nav_cache %}
+    {% cache nav_cache.timeout tickets_nav nav_cache.version using=nav_cache.alias %}
+
+    """
+    return get_fragment_cache(name)
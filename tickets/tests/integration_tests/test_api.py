@@ -0,0 +1,140 @@
+"""
+Tests for the read-only JSON API, including conditional GETs.
+"""
+
+from django.contrib.auth.models import Group
+from django.test import TestCase
+from django.urls import reverse
+
+from tickets.cache import get_cache
+from tickets.models import Ticket
+from tickets.tests.factories import FollowUpFactory, TicketFactory, UserFactory
+
+
+class TicketListAPITestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = UserFactory(username="hsimpson")
+        self.tickets = [
+            TicketFactory(submitted_by=self.user, ticket_type="bug") for i in range(3)
+        ]
+        self.feature = TicketFactory(ticket_type="feature")
+        self.url = reverse("tickets:api_ticket_list")
+
+    def test_ticket_list(self):
+        response = self.client.get(self.url, {"ticket_type": "bug", "limit": 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            [x["id"] for x in data["results"]],
+            [self.tickets[2].id, self.tickets[1].id],
+        )
+        self.assertEqual(data["results"][0]["submitted_by"], "hsimpson")
+        self.assertIsNone(data["previous"])
+
+        data = self.client.get(data["next"]).json()
+        self.assertEqual([x["id"] for x in data["results"]], [self.tickets[0].id])
+        self.assertIsNone(data["next"])
+
+    def test_not_modified(self):
+        """a request with the current ETag gets a 304, until one of the
+        tickets in the list changes."""
+
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # votes don't change updated_on, but should change the etag
+        self.tickets[0].up_vote()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        # changes outside of the filtered list don't
+        url = self.url + "?ticket_type=bug"
+        etag = self.client.get(url)["ETag"]
+        Ticket.all_tickets.filter(pk=self.feature.pk).update(votes=10)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_comment_made_private(self):
+        """making a comment private changes the comment_count of its
+        ticket, but not its updated_on or last_activity."""
+        comment = FollowUpFactory(ticket=self.tickets[0])
+        FollowUpFactory(ticket=self.tickets[0])
+        etag = self.client.get(self.url)["ETag"]
+
+        comment.private = True
+        comment.save(update_fields=["private"])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        counts = {x["id"]: x["comment_count"] for x in response.json()["results"]}
+        self.assertEqual(counts[self.tickets[0].id], 1)
+
+
+class TicketDetailAPITestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = UserFactory(username="hsimpson")
+        self.other = UserFactory(username="bgumble")
+        self.ticket = TicketFactory(submitted_by=self.user)
+        self.comment = FollowUpFactory(ticket=self.ticket, comment="public")
+        self.private = FollowUpFactory(
+            ticket=self.ticket, comment="private", private=True
+        )
+        self.url = reverse("tickets:api_ticket_detail", args=(self.ticket.pk,))
+
+    def test_ticket_detail(self):
+        child = TicketFactory(parent=self.ticket)
+        self.ticket.tags.add("red")
+        data = self.client.get(self.url).json()
+        self.assertEqual(data["id"], self.ticket.id)
+        self.assertEqual(data["tags"], ["red"])
+        self.assertEqual(data["children"], [child.id])
+        self.assertEqual([x["comment"] for x in data["comments"]], ["public"])
+
+    def test_private_comments(self):
+        """the submitter and admins see the private comments, and their
+        ETag differs from everyone else's."""
+
+        anonymous = self.client.get(self.url)
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=anonymous["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [x["comment"] for x in response.json()["comments"]], ["public", "private"]
+        )
+        self.assertIn("Cookie", response["Vary"])
+
+        self.client.force_login(self.other)
+        self.assertEqual(len(self.client.get(self.url).json()["comments"]), 1)
+        admin_group, created = Group.objects.get_or_create(name="admin")
+        self.other.groups.add(admin_group)
+        self.assertEqual(len(self.client.get(self.url).json()["comments"]), 2)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # each of these changes the response without touching updated_on
+        changes = [
+            lambda: FollowUpFactory(ticket=self.ticket),
+            lambda: self.ticket.tags.add("blue"),
+            lambda: TicketFactory().duplicate_of(self.ticket.pk),
+            lambda: TicketFactory(parent=self.ticket),
+            lambda: self.ticket.up_vote(),
+        ]
+        for change in changes:
+            change()
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+
+    def test_missing_ticket(self):
+        url = reverse("tickets:api_ticket_detail", args=(self.ticket.pk + 100,))
+        self.assertEqual(self.client.get(url).status_code, 404)
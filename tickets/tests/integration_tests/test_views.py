@@ -1,12 +1,21 @@
 # from django.conf import settings
 # from django.contrib.auth.models import User, Group
 # from django.core.urlresolvers import reverse
+import csv
+import io
+import json
+from unittest import mock
+
 from django.contrib.auth.models import Group
 
 # from django.test.client import Client
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from tickets.models import Ticket
+from tickets.cache import get_cache
+from tickets.models import FollowUp, Ticket
+from tickets.views import TicketListView
 from tickets.tests.factories import FollowUpFactory, TicketFactory, UserFactory
 
 
@@ -238,6 +247,198 @@ class TicketTestCase(TestCase):
         self.assertContains(response, linktext, html=True)
 
 
+class TicketDetailQueryCountTestCase(TestCase):
+    """The number of queries required to render the ticket detail page
+    should not depend on the number of comments, tags or related
+    tickets."""
+
+    def setUp(self):
+        self.user = UserFactory(username="hsimpson")
+        self.parent = TicketFactory()
+        self.ticket = TicketFactory(submitted_by=self.user, parent=self.parent)
+        self.ticket.tags.add("red", "green")
+        TicketFactory(parent=self.ticket)
+        TicketFactory().duplicate_of(self.ticket.id)
+        self.ticket.duplicate_of(TicketFactory().id)
+        self.url = reverse("tickets:ticket_detail", kwargs={"pk": self.ticket.id})
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def add_comments(self, n):
+        for i in range(n):
+            FollowUpFactory(ticket=self.ticket, comment="comment {}".format(i))
+            FollowUpFactory(ticket=self.ticket, private=True)
+
+    def test_query_count_anonymous(self):
+        self.add_comments(1)
+        expected = self.count_queries()
+        self.add_comments(10)
+        self.assertEqual(self.count_queries(), expected)
+
+    def test_query_count_submitter(self):
+        login = self.client.login(username=self.user.username, password="Abcdef12")
+        self.assertTrue(login)
+        self.add_comments(1)
+        expected = self.count_queries()
+        self.add_comments(10)
+        self.assertEqual(self.count_queries(), expected)
+
+    def test_related_tickets_rendered(self):
+        """the parent, child, duplicate and original tickets should all
+        be linked from the page."""
+        response = self.client.get(self.url)
+        self.assertContains(response, "Parent Ticket:")
+        self.assertContains(response, "Child Ticket(s):")
+        self.assertContains(response, "This ticket duplicates ticket(s):")
+        self.assertContains(response, "This ticket has been duplicated by")
+
+
+class TicketDetailConditionalTestCase(TestCase):
+    """The ticket detail page is served with an ETag, and the
+    description and comments are cached.  Verify that a request with the
+    current ETag gets a 304 and that any change to the ticket is shown
+    straight away."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = UserFactory(username="hsimpson")
+        self.ticket = TicketFactory(submitted_by=self.user)
+        self.ticket.tags.add("red")
+        FollowUpFactory(ticket=self.ticket, comment="a public comment")
+        FollowUpFactory(ticket=self.ticket, comment="a private comment", private=True)
+        self.url = reverse("tickets:ticket_detail", kwargs={"pk": self.ticket.id})
+
+    def assertChanged(self, etag):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        return response
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_ticket(self):
+        url = reverse("tickets:ticket_detail", kwargs={"pk": self.ticket.id + 100})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_render_uses_fewer_queries(self):
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(self.url)
+        self.assertLess(len(second), len(first))
+        self.assertContains(response, "a public comment")
+        self.assertContains(response, "red")
+
+    def test_changes_are_shown(self):
+        """comments, votes, tags and duplicates each change the etag and
+        are rendered on the next request."""
+
+        etag = self.client.get(self.url)["ETag"]
+        FollowUpFactory(ticket=self.ticket, comment="a new comment")
+        response = self.assertChanged(etag)
+        self.assertContains(response, "a new comment")
+
+        etag = response["ETag"]
+        self.ticket.up_vote()
+        response = self.assertChanged(etag)
+        self.assertContains(response, '<span id="vote-count">1</span>', html=True)
+
+        etag = response["ETag"]
+        self.ticket.tags.add("blue")
+        response = self.assertChanged(etag)
+        self.assertContains(response, "blue")
+
+        etag = response["ETag"]
+        TicketFactory(title="The original ticket").duplicate_of(self.ticket.id)
+        response = self.assertChanged(etag)
+        self.assertContains(response, "This ticket has been duplicated by")
+
+    def test_parent_description_change_is_shown(self):
+        """a child's page shows the start of its parent's description."""
+        child = TicketFactory(parent=self.ticket)
+        url = reverse("tickets:ticket_detail", kwargs={"pk": child.id})
+        etag = self.client.get(url)["ETag"]
+
+        self.ticket.description = "A rewritten parent"
+        self.ticket.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "A rewritten parent")
+
+    def test_original_description_change_is_shown(self):
+        """a duplicate's page shows the start of the original's
+        description."""
+        duplicate = TicketFactory()
+        duplicate.duplicate_of(self.ticket.id)
+        url = reverse("tickets:ticket_detail", kwargs={"pk": duplicate.id})
+        etag = self.client.get(url)["ETag"]
+
+        self.ticket.description = "A rewritten original"
+        self.ticket.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "A rewritten original")
+
+    def test_username_change_is_shown(self):
+        commenter = UserFactory(username="bsimpson", first_name="")
+        FollowUpFactory(ticket=self.ticket, submitted_by=commenter)
+        etag = self.client.get(self.url)["ETag"]
+
+        commenter.username = "bartman"
+        commenter.save()
+        response = self.assertChanged(etag)
+        self.assertContains(response, "bartman wrote:")
+
+    def test_application_rename_is_shown(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        application = self.ticket.application
+        application.application = "Renamed App"
+        application.save()
+        response = self.assertChanged(etag)
+        self.assertContains(response, "Renamed App")
+
+    def test_etag_depends_on_user(self):
+        """the private comments are only rendered for the submitter, so
+        they should not share an etag (or cached comments) with
+        anonymous users."""
+
+        response = self.client.get(self.url)
+        self.assertNotContains(response, "a private comment")
+        etag = response["ETag"]
+
+        login = self.client.login(username=self.user.username, password="Abcdef12")
+        self.assertTrue(login)
+        response = self.assertChanged(etag)
+        self.assertContains(response, "a private comment")
+
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response["ETag"], etag)
+        self.assertNotContains(response, "a private comment")
+
+    def test_vote_changes_etag_for_voter(self):
+        """once a user has voted, their vote button is disabled."""
+        login = self.client.login(username=self.user.username, password="Abcdef12")
+        self.assertTrue(login)
+        etag = self.client.get(self.url)["ETag"]
+        self.client.post(reverse("tickets:vote_ticket", kwargs={"pk": self.ticket.id}))
+        response = self.assertChanged(etag)
+        self.assertTrue(response.context["has_voted"])
+
+
 class EmptyTicketListTestCase(TestCase):
     """If there are not tickets in the ticket list query set, a usefull
     message should appear in the response.
@@ -565,6 +766,444 @@ class TicketListTestCase(TestCase):
         self.assertNotContains(response, self.ticket8.title)
 
 
+    def test_closed_ticket_list_with_q(self):
+        """the search should narrow the closed tickets, not be replaced
+        by them."""
+        url = reverse("tickets:closed_tickets")
+        response = self.client.get(url, {"q": "findme"})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertContains(response, self.ticket5.title)
+
+        self.assertNotContains(response, self.ticket1.title)
+        self.assertNotContains(response, self.ticket4.title)
+        self.assertNotContains(response, self.ticket6.title)
+        self.assertNotContains(response, self.ticket8.title)
+
+    def test_open_ticket_list_with_q(self):
+        url = reverse("tickets:open_tickets")
+        response = self.client.get(url, {"q": "findme"})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertContains(response, self.ticket1.title)
+        self.assertContains(response, self.ticket4.title)
+
+        self.assertNotContains(response, self.ticket2.title)
+        self.assertNotContains(response, self.ticket5.title)
+        self.assertNotContains(response, self.ticket8.title)
+
+    def test_feature_request_list_with_status(self):
+        """the url kwargs and TicketFilter parameters should combine."""
+        url = reverse("tickets:feature_requests")
+        response = self.client.get(url, {"status": "new"})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertContains(response, self.ticket1.title)
+        self.assertNotContains(response, self.ticket3.title)
+
+    def test_my_tickets_list_with_status(self):
+        url = reverse("tickets:my_ticket_list", kwargs={"username": self.user1.username})
+        response = self.client.get(url, {"status": "assigned"})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertContains(response, self.ticket3.title)
+        self.assertNotContains(response, self.ticket1.title)
+        self.assertNotContains(response, self.ticket2.title)
+
+    def test_open_ticket_list_with_q_and_type(self):
+        """the open tickets page and its search are narrowed by the
+        filters in the query string."""
+        url = reverse("tickets:open_tickets")
+        response = self.client.get(url, {"q": "findme", "ticket_type": "feature"})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertContains(response, self.ticket1.title)
+        self.assertNotContains(response, self.ticket4.title)
+        self.assertNotContains(response, self.ticket5.title)
+
+
+class TicketListQueryCountTestCase(TestCase):
+    """The ticket list pages should use a bounded number of queries,
+    regardless of the number of tickets, and should not fetch the
+    ticket descriptions."""
+
+    def setUp(self):
+        self.user = UserFactory(username="hsimpson")
+        self.add_tickets(3)
+
+    def add_tickets(self, n):
+        for i in range(n):
+            ticket = TicketFactory(submitted_by=self.user, assigned_to=UserFactory())
+            ticket.tags.add("red")
+
+    def get_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [x["sql"] for x in queries]
+
+    def assert_bounded(self, url):
+        expected = len(self.get_queries(url))
+        self.add_tickets(10)
+        queries = self.get_queries(url)
+        self.assertEqual(len(queries), expected)
+        for sql in queries:
+            self.assertNotIn('"tickets_ticket"."description"', sql)
+
+    def test_ticket_list_query_count(self):
+        self.assert_bounded(reverse("tickets:ticket_list"))
+
+    def test_my_ticket_list_query_count(self):
+        self.assert_bounded(
+            reverse("tickets:my_ticket_list", kwargs={"username": "hsimpson"})
+        )
+
+    def test_open_ticket_list_query_count(self):
+        self.assert_bounded(reverse("tickets:open_tickets"))
+
+    def test_closed_search_query_count(self):
+        self.assert_bounded(reverse("tickets:closed_tickets") + "?q=ticket")
+
+    def test_filtered_search_query_count(self):
+        url = reverse("tickets:bug_reports") + "?q=ticket&status=new&tags=red"
+        self.assert_bounded(url)
+
+    def test_tagged_ticket_list_query_count(self):
+        self.assert_bounded(
+            reverse("tickets:tickets_tagged_with", kwargs={"slug": "red"})
+        )
+
+
+class TicketListFragmentCacheTestCase(TestCase):
+    """The tag sidebar of the ticket lists and the navigation bar are
+    cached.  Verify that the cached tag sidebar saves its query and is
+    replaced when tags or tickets change, and that the navigation bar
+    isn't shared between users."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = UserFactory(username="hsimpson", first_name="Homer")
+        self.ticket = TicketFactory(submitted_by=self.user)
+        self.ticket.tags.add("red")
+        self.url = reverse("tickets:open_tickets")
+
+    def test_tag_sidebar_cached(self):
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(self.url)
+        self.assertLess(len(second), len(first))
+        self.assertNotIn("COUNT(", " ".join(x["sql"] for x in second))
+        self.assertContains(response, "red (1)")
+
+    def test_tag_sidebar_shared_by_pages(self):
+        """every page of a list shows the same sidebar, so it should be
+        cached once however the list is paged."""
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as paged:
+            self.client.get(self.url, {"page": 2})
+        self.assertNotIn("COUNT(", " ".join(x["sql"] for x in paged))
+
+        with CaptureQueriesContext(connection) as filtered:
+            self.client.get(self.url, {"q": "red"})
+        self.assertIn("COUNT(", " ".join(x["sql"] for x in filtered))
+
+    def test_tag_sidebar_tag_added(self):
+        self.client.get(self.url)
+        self.ticket.tags.add("blue")
+        response = self.client.get(self.url)
+        self.assertContains(response, "blue (1)")
+
+    def test_tag_sidebar_ticket_changed(self):
+        """closing a ticket removes it from the open tickets, and its
+        tags from the sidebar."""
+        response = self.client.get(self.url)
+        self.assertContains(response, "red (1)")
+        self.ticket.status = "closed"
+        self.ticket.save()
+        response = self.client.get(self.url)
+        self.assertNotContains(response, "red (1)")
+
+    def test_nav_depends_on_user(self):
+        my_tickets = reverse("tickets:my_ticket_list", kwargs={"username": "hsimpson"})
+
+        response = self.client.get(self.url)
+        self.assertContains(response, "Login")
+        self.assertNotContains(response, my_tickets)
+
+        login = self.client.login(username=self.user.username, password="Abcdef12")
+        self.assertTrue(login)
+        response = self.client.get(self.url)
+        self.assertContains(response, "Welcome")
+        self.assertContains(response, "Homer!")
+        self.assertContains(response, my_tickets)
+
+        other = UserFactory(username="bgumble", first_name="")
+        self.client.login(username=other.username, password="Abcdef12")
+        response = self.client.get(self.url)
+        self.assertContains(response, "bgumble!")
+        self.assertNotContains(response, my_tickets)
+
+
+class TicketListPaginationTestCase(TestCase):
+    """The ticket lists are paginated by cursor - verify that the next
+    and previous links walk through all of the tickets and that a bad
+    cursor returns a 404."""
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.tickets = [
+            TicketFactory(submitted_by=self.user, title="ticket {}".format(i))
+            for i in range(5)
+        ]
+
+    def test_cursor_links(self):
+        """With two tickets per page, the list should span three pages
+        linked by cursors and see every ticket once."""
+
+        url = reverse("tickets:ticket_list")
+        seen = []
+        pages = 0
+        params = {}
+        with mock.patch.object(TicketListView, "paginate_by", 2):
+            while True:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                page_obj = response.context["page_obj"]
+                seen.extend(x.pk for x in page_obj.object_list)
+                pages += 1
+                if not page_obj.has_next():
+                    break
+                self.assertContains(response, "cursor={}".format(page_obj.next_cursor))
+                params = {"cursor": page_obj.next_cursor}
+
+        self.assertEqual(pages, 3)
+        self.assertContains(response, "cursor={}".format(page_obj.previous_cursor))
+        self.assertEqual(seen, [x.pk for x in reversed(self.tickets)])
+
+    def test_invalid_cursor(self):
+        url = reverse("tickets:ticket_list")
+        response = self.client.get(url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+
+class TicketExportTestCase(TestCase):
+    """The csv and json exports should contain the same tickets as the
+    list they are exported from."""
+
+    def setUp(self):
+        self.user = UserFactory(username="hsimpson")
+        self.bug = TicketFactory(
+            submitted_by=self.user, ticket_type="bug", title="A bug, with a comma"
+        )
+        self.feature = TicketFactory(ticket_type="feature", title="A feature")
+        self.closed = TicketFactory(status="closed", title="Closed bug")
+        self.inactive = TicketFactory(active=False, title="Inactive")
+
+    def get_content(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_csv(self):
+        response = self.client.get(
+            reverse("tickets:export_ticket_list", kwargs={"fmt": "csv"})
+        )
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn("attachment", response["Content-Disposition"])
+        rows = list(csv.DictReader(io.StringIO(self.get_content(response))))
+        self.assertEqual(
+            [int(x["id"]) for x in rows],
+            [self.closed.id, self.feature.id, self.bug.id],
+        )
+        self.assertEqual(rows[2]["title"], "A bug, with a comma")
+        self.assertEqual(rows[2]["submitted_by"], "hsimpson")
+
+    def test_export_json_with_kwargs_and_filters(self):
+        """url kwargs and GET parameters should narrow the export."""
+        url = reverse("tickets:export_bug_reports", kwargs={"fmt": "json"})
+        rows = json.loads(self.get_content(self.client.get(url)))
+        self.assertEqual([x["id"] for x in rows], [self.closed.id, self.bug.id])
+
+        url = reverse("tickets:export_open_tickets", kwargs={"fmt": "json"})
+        url += "?ticket_type=bug"
+        rows = json.loads(self.get_content(self.client.get(url)))
+        self.assertEqual([x["id"] for x in rows], [self.bug.id])
+
+    def test_export_empty(self):
+        url = reverse(
+            "tickets:export_submitted_by", kwargs={"fmt": "json", "username": "x"}
+        )
+        self.assertEqual(json.loads(self.get_content(self.client.get(url))), [])
+
+    def test_unknown_format(self):
+        url = reverse("tickets:export_ticket_list", kwargs={"fmt": "xls"})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_export_links(self):
+        """the list pages should link to the export of the same list."""
+        url = reverse("tickets:bug_reports") + "?q=bug"
+        response = self.client.get(url)
+        export_url = reverse("tickets:export_bug_reports", kwargs={"fmt": "csv"})
+        self.assertContains(response, 'href="{}?q=bug"'.format(export_url))
+
+
+class UserAutocompleteTestCase(TestCase):
+    """The user autocomplete view returns the users matching the start
+    of a name as json, and is only available to admins."""
+
+    def setUp(self):
+        self.admin = UserFactory(username="hsimpson", first_name="Homer")
+        admin_group, created = Group.objects.get_or_create(name="admin")
+        self.admin.groups.add(admin_group)
+        self.staff = UserFactory(
+            username="bgumble", first_name="Barney", last_name="Gumble", is_staff=True
+        )
+        self.user = UserFactory(username="bsimpson", first_name="Bart")
+        self.url = reverse("tickets:user_autocomplete")
+
+    def test_autocomplete(self):
+        self.client.login(username=self.admin.username, password="Abcdef12")
+        response = self.client.get(self.url, {"q": "b"})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([x["id"] for x in results], [self.staff.pk, self.user.pk])
+        self.assertEqual(results[0]["text"], "Barney Gumble")
+
+        response = self.client.get(self.url, {"q": "b", "users": "staff"})
+        results = response.json()["results"]
+        self.assertEqual([x["id"] for x in results], [self.staff.pk])
+
+    def test_unknown_users(self):
+        self.client.login(username=self.admin.username, password="Abcdef12")
+        response = self.client.get(self.url, {"q": "b", "users": "everyone"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_admins_only(self):
+        response = self.client.get(self.url, {"q": "b"})
+        self.assertEqual(response.status_code, 403)
+        self.client.login(username=self.user.username, password="Abcdef12")
+        response = self.client.get(self.url, {"q": "b"})
+        self.assertEqual(response.status_code, 403)
+
+class BulkUpdateTestCase(TestCase):
+    """Admins can change every ticket in a ticket list at once.  Verify
+    that only the tickets in the list are changed, that each gets a
+    comment, and that the number of queries doesn't depend on the number
+    of tickets."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.admin = UserFactory(username="hsimpson")
+        admin_group, created = Group.objects.get_or_create(name="admin")
+        self.admin.groups.add(admin_group)
+        self.staff = UserFactory(username="bgumble", is_staff=True)
+        self.bugs = [TicketFactory(ticket_type="bug") for i in range(3)]
+        self.closed_bug = TicketFactory(ticket_type="bug", status="closed")
+        self.feature = TicketFactory(ticket_type="feature")
+        self.url = reverse("tickets:bulk_bug_reports")
+        self.client.login(username=self.admin.username, password="Abcdef12")
+
+    def post(self, **data):
+        data.setdefault("comment", "Cleaning up old bugs.")
+        return self.client.post(self.url, data)
+
+    def test_close(self):
+        response = self.post(action="close")
+        self.assertRedirects(
+            response, reverse("tickets:bug_reports"), fetch_redirect_response=False
+        )
+
+        for ticket in self.bugs:
+            ticket = Ticket.all_tickets.get(pk=ticket.pk)
+            self.assertEqual(ticket.status, "closed")
+            self.assertEqual(ticket.comment_count, 1)
+            comment = FollowUp.objects.get(ticket=ticket)
+            self.assertEqual(comment.action, "closed")
+            self.assertEqual(comment.submitted_by, self.admin)
+            self.assertIn("Cleaning up old bugs.", comment.comment_html)
+
+        # closed tickets and tickets outside the list are not changed
+        self.assertFalse(FollowUp.objects.filter(ticket=self.closed_bug).exists())
+        feature = Ticket.all_tickets.get(pk=self.feature.pk)
+        self.assertEqual(feature.status, self.feature.status)
+
+        response = self.client.get(response.url)
+        self.assertContains(response, "3 ticket(s) updated.")
+
+    def test_filtered_list(self):
+        """the GET parameters of the list select the tickets too."""
+        self.url = reverse("tickets:bulk_ticket_list") + "?ticket_type=feature"
+        response = self.post(action="priority", priority=1)
+        self.assertRedirects(
+            response, reverse("tickets:ticket_list") + "?ticket_type=feature"
+        )
+        self.assertEqual(Ticket.all_tickets.get(pk=self.feature.pk).priority, 1)
+        self.assertFalse(Ticket.all_tickets.filter(priority=1, ticket_type="bug"))
+
+    def test_assign(self):
+        self.post(action="assign", assigned_to=self.staff.pk)
+        for ticket in self.bugs:
+            ticket = Ticket.all_tickets.get(pk=ticket.pk)
+            self.assertEqual(ticket.status, "assigned")
+            self.assertEqual(ticket.assigned_to, self.staff)
+
+    def test_assign_requires_user(self):
+        response = self.post(action="assign")
+        self.assertRedirects(response, reverse("tickets:bug_reports"))
+        self.assertFalse(FollowUp.objects.exists())
+        self.assertFalse(Ticket.all_tickets.filter(status="assigned").exists())
+
+    def test_tag(self):
+        self.bugs[0].tags.add("triaged")
+        self.post(action="tag", tags="triaged, stale")
+        for ticket in self.bugs + [self.closed_bug]:
+            names = sorted(ticket.tags.names())
+            self.assertEqual(names, ["stale", "triaged"])
+        self.assertFalse(self.feature.tags.exists())
+
+    def test_admins_only(self):
+        self.client.login(username=self.staff.username, password="Abcdef12")
+        self.post(action="close")
+        self.assertEqual(Ticket.all_tickets.filter(status="closed").count(), 1)
+        self.assertFalse(FollowUp.objects.exists())
+
+    def test_atomic(self):
+        with mock.patch("tickets.bulk.index_tickets", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post(action="close")
+        self.assertFalse(FollowUp.objects.exists())
+        self.assertEqual(Ticket.all_tickets.filter(status="closed").count(), 1)
+
+    def test_detail_page_changes(self):
+        url = reverse("tickets:ticket_detail", kwargs={"pk": self.bugs[0].pk})
+        etag = self.client.get(url)["ETag"]
+        self.post(action="close")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Cleaning up old bugs.")
+
+    def test_query_count(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.post(action="close")
+            return len(queries)
+
+        # the first request also caches the admin group membership
+        self.post(action="priority", priority=1)
+        expected = count_queries()
+        for i in range(10):
+            TicketFactory(ticket_type="bug")
+        self.assertEqual(count_queries(), expected)
+
+    def test_bulk_form_shown_to_admins(self):
+        response = self.client.get(reverse("tickets:bug_reports") + "?page=2")
+        self.assertContains(response, 'action="{}"'.format(self.url))
+
+        self.client.logout()
+        response = self.client.get(reverse("tickets:bug_reports"))
+        self.assertNotContains(response, self.url)
+
 class VotingTestCase(TestCase):
     """ """
 
@@ -681,6 +1320,42 @@ class VotingTestCase(TestCase):
         self.assertContains(response, msg)
 
 
+    def test_vote_json_not_logged_in(self):
+        """anonymous users cannot vote through the json endpoint."""
+        url = reverse("tickets:vote_ticket", kwargs={"pk": self.ticket.id})
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 403)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.votes, 0)
+
+    def test_vote_json_logged_in(self):
+        """the json endpoint should return the new vote count, and
+        only count the first vote."""
+
+        login = self.client.login(username=self.user.username, password="abc")
+        self.assertTrue(login)
+
+        url = reverse("tickets:vote_ticket", kwargs={"pk": self.ticket.id})
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.json(), {"ticket": self.ticket.id, "votes": 1, "voted": True}
+        )
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {"ticket": self.ticket.id, "votes": 1, "voted": False}
+        )
+
+    def test_vote_json_requires_post(self):
+        login = self.client.login(username=self.user.username, password="abc")
+        self.assertTrue(login)
+        url = reverse("tickets:vote_ticket", kwargs={"pk": self.ticket.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 405)
+
+
 ##class TicketUpdateTestCase(TestCase):
 ##    '''
 ##    '''
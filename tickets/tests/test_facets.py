@@ -0,0 +1,122 @@
+from django.test import TestCase, override_settings
+
+from tickets.cache import get_cache
+from tickets.facets import get_tag_facets, get_ticket_filters
+from tickets.models import Ticket
+from tickets.tests.factories import ApplicationFactory, TicketFactory, UserFactory
+
+
+class TestTicketFilterCache(TestCase):
+    """The values used to build the filters on the ticket list pages
+    should be served from the cache until a ticket, application or
+    user changes."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.user1 = UserFactory(username="hsimpson")
+        self.user2 = UserFactory(username="bgumble")
+        self.app = ApplicationFactory(application="Springfield", slug="springfield")
+        self.ticket = TicketFactory(
+            submitted_by=self.user1, assigned_to=self.user2, application=self.app
+        )
+
+    def test_ticket_filters_values(self):
+        """The dynamic filters should contain the distinct applications,
+        submitters and assignees."""
+        filters = get_ticket_filters()
+        self.assertEqual(filters["application"], ["Springfield"])
+        self.assertEqual(filters["submitted_by"], ["hsimpson"])
+        self.assertEqual(filters["assigned_to"], ["bgumble"])
+
+    def test_ticket_filters_are_cached(self):
+        """The second call should not touch the database."""
+        get_ticket_filters()
+        with self.assertNumQueries(0):
+            get_ticket_filters()
+
+    def test_new_ticket_invalidates_filters(self):
+        """A ticket from a new user should appear in the filters."""
+        get_ticket_filters()
+        user3 = UserFactory(username="mflanders")
+        TicketFactory(submitted_by=user3, application=self.app)
+        self.assertIn("mflanders", get_ticket_filters()["submitted_by"])
+
+    def test_ticket_delete_invalidates_filters(self):
+        """Deleting the only ticket assigned to a user should remove
+        them from the filters."""
+        get_ticket_filters()
+        self.ticket.delete()
+        self.assertEqual(get_ticket_filters()["assigned_to"], [])
+
+    def test_application_rename_invalidates_filters(self):
+        """Renaming an application should be reflected in the filters."""
+        get_ticket_filters()
+        self.app.application = "Shelbyville"
+        self.app.save()
+        self.assertEqual(get_ticket_filters()["application"], ["Shelbyville"])
+
+    def test_username_change_invalidates_filters(self):
+        """Changing a username should be reflected in the filters."""
+        get_ticket_filters()
+        self.user1.username = "homer"
+        self.user1.save()
+        self.assertEqual(get_ticket_filters()["submitted_by"], ["homer"])
+
+    def test_login_does_not_invalidate_filters(self):
+        """Logging in saves last_login - it should not clear the cache."""
+        get_ticket_filters()
+        self.client.login(username="hsimpson", password="Abcdef12")
+        with self.assertNumQueries(0):
+            get_ticket_filters()
+
+
+class TestTagFacets(TestCase):
+    """The tags used by a list of tickets should be counted with a
+    single query, and optionally sampled and/or cached."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.ticket1 = TicketFactory(ticket_type="bug")
+        self.ticket2 = TicketFactory(ticket_type="bug")
+        self.ticket3 = TicketFactory(ticket_type="feature")
+        self.ticket1.tags.add("red", "blue")
+        self.ticket2.tags.add("red")
+        self.ticket3.tags.add("green")
+
+    def test_tag_facets(self):
+        tickets = Ticket.objects.filter(ticket_type="bug")
+        with self.assertNumQueries(1):
+            facets = get_tag_facets(tickets)
+        self.assertEqual(
+            facets,
+            [
+                {"name": "red", "slug": "red", "count": 2},
+                {"name": "blue", "slug": "blue", "count": 1},
+            ],
+        )
+
+    def test_tag_facets_ignore_inactive_tickets(self):
+        self.ticket2.active = False
+        self.ticket2.save()
+        facets = get_tag_facets(Ticket.objects.filter(ticket_type="bug"))
+        self.assertEqual([x["count"] for x in facets], [1, 1])
+
+    @override_settings(TICKETS_TAG_FACET_SAMPLE_SIZE=1)
+    def test_tag_facets_sampled(self):
+        """only the most recent ticket should be counted."""
+        tickets = Ticket.objects.order_by("-id")
+        self.assertEqual(
+            get_tag_facets(tickets), [{"name": "green", "slug": "green", "count": 1}]
+        )
+
+    @override_settings(TICKETS_TAG_FACET_CACHE_TIMEOUT=60)
+    def test_tag_facets_cached(self):
+        tickets = Ticket.objects.filter(ticket_type="feature")
+        get_tag_facets(tickets)
+        with self.assertNumQueries(0):
+            get_tag_facets(tickets)
+
+        # tagging a ticket should invalidate the cached counts
+        self.ticket3.tags.add("purple")
+        facets = get_tag_facets(tickets)
+        self.assertEqual([x["name"] for x in facets], ["green", "purple"])
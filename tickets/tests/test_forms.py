@@ -1,7 +1,17 @@
+from unittest import mock
+
 import pytest
 from django.contrib.auth.models import Group
+from django.db import connection
 from django.test import TestCase
-from tickets.forms import CloseTicketForm, SplitTicketForm, TicketForm
+from django.test.utils import CaptureQueriesContext, override_settings
+from tickets.cache import get_cache
+from tickets.forms import (
+    AssignTicketForm,
+    CloseTicketForm,
+    SplitTicketForm,
+    TicketForm,
+)
 from tickets.models import *
 from tickets.tests.factories import *
 
@@ -287,6 +297,57 @@ class TestCloseTicketForm(TestCase):
         )
         self.assertFalse(form.is_valid())
 
+    def close_as_duplicate(self):
+        initial = {
+            "comment": "A valid comment",
+            "duplicate": True,
+            "same_as_ticket": self.ticket2.id,
+        }
+        return CloseTicketForm(
+            data=initial, action="closed", ticket=self.ticket, user=self.user
+        )
+
+    def test_duplicate_query_count(self):
+        """clean() should look up the original once, and save() should
+        only write - the ticket and the original are not fetched again."""
+
+        form = self.close_as_duplicate()
+        with self.assertNumQueries(1):
+            self.assertTrue(form.is_valid())
+
+        with CaptureQueriesContext(connection) as queries:
+            form.save()
+        statements = [
+            x["sql"].split()[0]
+            for x in queries
+            if "SAVEPOINT" not in x["sql"] and "_fts" not in x["sql"]
+        ]
+        # the duplicate, the comment, its counter and the status
+        self.assertEqual(statements, ["INSERT", "INSERT", "UPDATE", "UPDATE"])
+
+        ticket = Ticket.all_tickets.get(pk=self.ticket.pk)
+        self.assertEqual(ticket.status, "duplicate")
+        self.assertEqual(ticket.comment_count, 1)
+        self.assertTrue(
+            TicketDuplicate.objects.filter(
+                ticket=self.ticket, original=self.ticket2
+            ).exists()
+        )
+
+    def test_duplicate_is_atomic(self):
+        """if the comment can't be saved, the duplicate should not be
+        recorded and the ticket should stay open."""
+
+        form = self.close_as_duplicate()
+        self.assertTrue(form.is_valid())
+        with mock.patch.object(FollowUp, "save", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                form.save()
+
+        self.assertFalse(TicketDuplicate.objects.filter(ticket=self.ticket).exists())
+        ticket = Ticket.all_tickets.get(pk=self.ticket.pk)
+        self.assertNotEqual(ticket.status, "duplicate")
+
     def tearDown(self):
         pass
 
@@ -448,3 +509,160 @@ class TestSplitForm(TestCase):
             data=initial, user=self.user, original_ticket=self.ticket
         )
         self.assertTrue(form.is_valid())
+
+    def split_data(self, **kwargs):
+        data = {
+            "status1": "new",
+            "title1": "first half",
+            "ticket_type1": "bug",
+            "priority1": 3,
+            "application1": self.app.id,
+            "description1": self.ticket.description,
+            "status2": "new",
+            "title2": "second half",
+            "ticket_type2": "task",
+            "priority2": 3,
+            "application2": self.app.id,
+            "description2": self.ticket.description,
+            "comment": "This is a test",
+        }
+        data.update(kwargs)
+        return data
+
+    def test_split_reuses_rendered_description(self):
+        """descriptions copied unchanged from the original should not be
+        rendered again."""
+
+        form = SplitTicketForm(
+            data=self.split_data(), user=self.user, original_ticket=self.ticket
+        )
+        self.assertTrue(form.is_valid())
+        with mock.patch(
+            "tickets.models.render_markdown", wraps=render_markdown
+        ) as render:
+            children = form.save()
+        # only the comment is rendered
+        self.assertNotIn(mock.call(self.ticket.description), render.call_args_list)
+
+        for child in Ticket.objects.filter(parent=self.ticket):
+            self.assertEqual(child.description_html, self.ticket.description_html)
+            self.assertEqual(child.description_hash, self.ticket.description_hash)
+        ids = Ticket.objects.filter(parent=self.ticket).values_list("pk", flat=True)
+        self.assertEqual(sorted(x.pk for x in children), sorted(ids))
+
+        original = Ticket.all_tickets.get(pk=self.ticket.pk)
+        self.assertEqual(original.status, "split")
+        self.assertEqual(original.comment_count, 1)
+
+    def test_split_renders_edited_description(self):
+        data = self.split_data(description2="Just the **second** half.")
+        form = SplitTicketForm(data=data, user=self.user, original_ticket=self.ticket)
+        self.assertTrue(form.is_valid())
+        form.save()
+
+        child = Ticket.objects.get(parent=self.ticket, title="second half")
+        self.assertIn("<strong>second</strong>", child.description_html)
+        child = Ticket.objects.get(parent=self.ticket, title="first half")
+        self.assertEqual(child.description_html, self.ticket.description_html)
+
+    def test_split_is_atomic(self):
+        """if any part of the split fails, the new tickets should not be
+        created and the original should not be closed."""
+
+        form = SplitTicketForm(
+            data=self.split_data(), user=self.user, original_ticket=self.ticket
+        )
+        self.assertTrue(form.is_valid())
+        with mock.patch.object(FollowUp, "save", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                form.save()
+
+        self.assertFalse(Ticket.all_tickets.filter(parent=self.ticket).exists())
+        original = Ticket.all_tickets.get(pk=self.ticket.pk)
+        self.assertNotEqual(original.status, "split")
+
+    def test_split_does_not_reuse_ids(self):
+        """the ids of deleted tickets should not be given to the new
+        tickets - they key the search index and cached versions."""
+        deleted = TicketFactory()
+        deleted_id = deleted.pk
+        deleted.delete()
+
+        form = SplitTicketForm(
+            data=self.split_data(), user=self.user, original_ticket=self.ticket
+        )
+        self.assertTrue(form.is_valid())
+        children = form.save()
+        self.assertTrue(all(x.pk > deleted_id for x in children))
+
+
+class TestCachedChoices(TestCase):
+    """The user and application choices are cached, so rendering a form
+    a second time shouldn't list the users or applications again.  The
+    cached choices are replaced when a user or application changes."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = UserFactory(
+            username="hsimpson", first_name="Homer", last_name="Simpson"
+        )
+        self.staff = UserFactory(username="bgumble", first_name="", is_staff=True)
+        self.app = ApplicationFactory(application="Tracker")
+        self.ticket = TicketFactory(application=self.app)
+
+    def render_split_form(self):
+        form = SplitTicketForm(user=self.user, original_ticket=self.ticket)
+        return form.as_p()
+
+    def test_choices_cached(self):
+        html = self.render_split_form()
+        self.assertIn("Homer Simpson", html)
+        self.assertIn("Tracker", html)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render_split_form(), html)
+
+    def test_user_changes(self):
+        self.render_split_form()
+        UserFactory(username="mszyslak", first_name="Moe")
+        self.assertIn("Moe", self.render_split_form())
+
+        self.user.first_name = "Max"
+        self.user.save()
+        self.assertIn("Max Simpson", self.render_split_form())
+
+    def test_login_does_not_invalidate(self):
+        self.render_split_form()
+        self.client.login(username=self.user.username, password="Abcdef12")
+        with self.assertNumQueries(0):
+            self.render_split_form()
+
+    def test_application_changes(self):
+        self.render_split_form()
+        ApplicationFactory(application="Other App")
+        self.assertIn("Other App", self.render_split_form())
+
+    def test_assign_form_only_staff(self):
+        form = AssignTicketForm(user=self.user, ticket=self.ticket)
+        html = str(form["assigned_to"])
+        self.assertIn("bgumble", html)
+        self.assertNotIn("Homer", html)
+
+    def test_cached_choices_still_validated(self):
+        """the submitted user must still exist."""
+        data = {"comment": "assigned", "assigned_to": self.staff.pk}
+        form = AssignTicketForm(data=data, user=self.user, ticket=self.ticket)
+        self.assertTrue(form.is_valid())
+
+        data["assigned_to"] = self.user.pk
+        form = AssignTicketForm(data=data, user=self.user, ticket=self.ticket)
+        self.assertFalse(form.is_valid())
+
+    @override_settings(TICKETS_USER_AUTOCOMPLETE=True)
+    def test_autocomplete_lists_selected_user_only(self):
+        self.ticket.assigned_to = self.staff
+        form = AssignTicketForm(user=self.user, ticket=self.ticket)
+        UserFactory(username="cwiggum", is_staff=True)
+        html = str(form["assigned_to"])
+        self.assertIn("data-autocomplete-url", html)
+        self.assertIn('value="{}" selected'.format(self.staff.pk), html)
+        self.assertNotIn("cwiggum", html)
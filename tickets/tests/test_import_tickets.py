@@ -0,0 +1,139 @@
+"""
+Tests for the import_tickets management command.
+"""
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from tickets.models import Application, FollowUp, Ticket
+from tickets.search import search_tickets
+from tickets.tests.factories import UserFactory
+
+
+class TestImportTickets(TestCase):
+    def setUp(self):
+        self.user = UserFactory(username="hsimpson")
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_jsonl(self, records):
+        path = os.path.join(self.tmpdir, "tickets.jsonl")
+        with open(path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        return path
+
+    def record(self, i, **kwargs):
+        record = {
+            "title": "Imported ticket {}".format(i),
+            "description": "The *importer* works - see ticket: {}".format(i),
+            "application": "Legacy App",
+            "submitted_by": "hsimpson",
+            "tags": ["imported", "legacy"],
+        }
+        record.update(kwargs)
+        return record
+
+    def import_tickets(self, path, **options):
+        options.setdefault("workers", 0)
+        out = StringIO()
+        call_command("import_tickets", path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import_jsonl(self):
+        """tickets, comments and tags should be created with rendered
+        html, counters and search index entries."""
+
+        records = [self.record(i) for i in range(5)]
+        records[0]["created_on"] = "2015-03-04T10:00:00"
+        records[0]["comments"] = [
+            {"comment": "first *comment*", "submitted_by": "hsimpson"},
+            {"comment": "secret", "submitted_by": "hsimpson", "private": True},
+        ]
+        self.import_tickets(self.write_jsonl(records), batch_size=2)
+
+        self.assertEqual(Ticket.all_tickets.count(), 5)
+        self.assertEqual(Application.objects.filter(slug="legacy-app").count(), 1)
+
+        ticket = Ticket.all_tickets.get(title="Imported ticket 0")
+        self.assertIn("<em>importer</em>", ticket.description_html)
+        self.assertEqual(ticket.created_on, datetime(2015, 3, 4, 10, 0))
+        self.assertEqual(ticket.comment_count, 1)
+        self.assertEqual(ticket.private_comment_count, 1)
+        self.assertEqual(
+            sorted(ticket.tags.values_list("name", flat=True)), ["imported", "legacy"]
+        )
+        comment = FollowUp.all_comments.get(ticket=ticket, private=False)
+        self.assertIn("<em>comment</em>", comment.comment_html)
+
+        found = search_tickets(Ticket.objects.all(), "importer")
+        self.assertEqual(found.count(), 5)
+
+    def test_import_csv_with_workers(self):
+        path = os.path.join(self.tmpdir, "tickets.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.record(0)))
+            writer.writeheader()
+            for i in range(3):
+                writer.writerow(self.record(i, tags="one, two"))
+
+        self.import_tickets(path, workers=2)
+        ticket = Ticket.all_tickets.get(title="Imported ticket 2")
+        self.assertIn("<em>importer</em>", ticket.description_html)
+        self.assertEqual(sorted(ticket.tags.names()), ["one", "two"])
+
+    def test_query_count(self):
+        """each batch is inserted with a fixed number of queries however
+        many tickets and comments it has."""
+
+        def count_queries(n):
+            comments = [{"comment": "a comment", "submitted_by": "hsimpson"}] * 2
+            records = [
+                self.record(i, title="Batch of {} {}".format(n, i), comments=comments)
+                for i in range(n)
+            ]
+            path = self.write_jsonl(records)
+            with CaptureQueriesContext(connection) as queries:
+                self.import_tickets(path, batch_size=n)
+            return len(queries)
+
+        # the first import creates the application and tags
+        count_queries(1)
+        self.assertEqual(count_queries(2), count_queries(6))
+
+    def test_resume(self):
+        """an import that fails part way through should continue from the
+        last committed batch when it is run again."""
+
+        records = [self.record(i) for i in range(5)]
+        records[3]["submitted_by"] = "nobody"
+        path = self.write_jsonl(records)
+
+        with self.assertRaises(CommandError):
+            self.import_tickets(path, batch_size=2)
+        self.assertEqual(Ticket.all_tickets.count(), 2)
+        self.assertTrue(os.path.exists(path + ".import-state"))
+
+        output = self.import_tickets(path, batch_size=2, default_user="hsimpson")
+        self.assertIn("Resuming after the first 2 records", output)
+        self.assertEqual(Ticket.all_tickets.count(), 5)
+        self.assertFalse(os.path.exists(path + ".import-state"))
+
+    def test_invalid_status(self):
+        path = self.write_jsonl([self.record(0, status="wontfix")])
+        with self.assertRaisesRegex(CommandError, "not a valid status"):
+            self.import_tickets(path)
+        self.assertEqual(Ticket.all_tickets.count(), 0)
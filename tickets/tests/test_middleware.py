@@ -0,0 +1,87 @@
+"""
+Tests for the request timing middleware.
+"""
+
+import re
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from tickets.models import render_markdown
+from tickets.tests.factories import TicketFactory, UserFactory
+from tickets.timing import RequestTimer, reset_timer, set_timer, timed
+
+
+@override_settings(TICKETS_TIMING_SAMPLE_RATE=1, TICKETS_TIMING_HEADER=True)
+class TestTimingMiddleware(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.ticket = TicketFactory(submitted_by=self.user)
+
+    def test_server_timing_header(self):
+        """sampled requests should report the queries and time spent in
+        the database and templates."""
+
+        with self.assertLogs("tickets.timing", level="INFO") as logs:
+            response = self.client.get(reverse("tickets:ticket_list"))
+        self.assertEqual(response.status_code, 200)
+
+        header = response["Server-Timing"]
+        for metric in ["db", "template", "markdown", "total"]:
+            self.assertRegex(header, r"\b{};desc=".format(metric))
+        queries = int(re.search(r"\((\d+) queries\)", header).group(1))
+        self.assertGreater(queries, 0)
+
+        self.assertEqual(len(logs.records), 1)
+        timing = logs.records[0].timing
+        self.assertEqual(timing["view"], "tickets:ticket_list")
+        self.assertEqual(timing["status"], 200)
+        self.assertEqual(timing["queries"], queries)
+        self.assertGreater(timing["template_ms"], 0)
+
+    @override_settings(TICKETS_TIMING_HEADER=False)
+    def test_no_header(self):
+        with self.assertLogs("tickets.timing", level="INFO"):
+            response = self.client.get(reverse("tickets:ticket_list"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_streamed_response(self):
+        """the queries run while an export is streamed should be logged
+        once its content has been read."""
+
+        url = reverse("tickets:export_ticket_list", kwargs={"fmt": "csv"})
+        with self.assertLogs("tickets.timing", level="INFO") as logs:
+            response = self.client.get(url)
+            self.assertEqual(logs.records, [])
+            content = b"".join(response.streaming_content)
+        self.assertIn(self.ticket.title.encode(), content)
+        self.assertFalse(response.has_header("Server-Timing"))
+
+        self.assertEqual(len(logs.records), 1)
+        timing = logs.records[0].timing
+        self.assertEqual(timing["view"], "tickets:export_ticket_list")
+        self.assertGreater(timing["queries"], 0)
+
+    @override_settings(TICKETS_TIMING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = self.client.get(reverse("tickets:ticket_list"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+
+def test_timed():
+    """timed() should add to the current timer, and do nothing if there
+    isn't one."""
+
+    with timed("markdown"):
+        render_markdown("# nothing to record")
+
+    timer = RequestTimer()
+    token = set_timer(timer)
+    try:
+        render_markdown("# heading")
+        with timed("other"):
+            pass
+    finally:
+        reset_timer(token)
+    assert timer.durations["markdown"] > 0
+    assert "other" in timer.durations
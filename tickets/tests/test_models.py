@@ -1,9 +1,13 @@
-from django.test import TestCase
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from tickets.models import *
 from tickets.tests.factories import *
 
 import pytest
+from unittest import mock
 
 
 class TestTicket(TestCase):
@@ -51,6 +55,45 @@ class TestTicket(TestCase):
         pass
 
 
+class TestTicketAddVote(TestCase):
+    """verify that add_vote only counts one vote per user and that the
+    vote log cannot contain duplicate votes."""
+
+    def setUp(self):
+        self.user1 = UserFactory()
+        self.user2 = UserFactory()
+        self.ticket = TicketFactory()
+
+    def test_add_vote(self):
+        """each user's first vote should be counted."""
+        self.assertTrue(self.ticket.add_vote(self.user1))
+        self.assertEqual(self.ticket.votes, 1)
+        self.assertTrue(self.ticket.add_vote(self.user2))
+        self.assertEqual(self.ticket.votes, 2)
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).votes, 2)
+
+    def test_add_vote_twice(self):
+        """a second vote from the same user should be ignored."""
+        self.assertTrue(self.ticket.add_vote(self.user1))
+        self.assertFalse(self.ticket.add_vote(self.user1))
+        self.assertEqual(self.ticket.votes, 1)
+        self.assertEqual(UserVoteLog.objects.filter(ticket=self.ticket).count(), 1)
+
+    def test_up_vote_uses_stale_instance(self):
+        """up_vote increments the value in the database, not the value
+        held by a (possibly stale) instance."""
+        other = Ticket.objects.get(pk=self.ticket.pk)
+        self.ticket.up_vote()
+        other.up_vote()
+        self.assertEqual(other.votes, 2)
+
+    def test_vote_log_is_unique(self):
+        """the database should reject a duplicate vote log entry."""
+        UserVoteLog.objects.create(user=self.user1, ticket=self.ticket)
+        with self.assertRaises(IntegrityError):
+            UserVoteLog.objects.create(user=self.user1, ticket=self.ticket)
+
+
 class TestTicketName(TestCase):
     """verify that the name returned by a ticket is no more than the
     first 40 characters of its discription.
@@ -368,3 +411,224 @@ def test_application_str():
 
     assert str(myapp) == "MyApp"
     assert str(myapp) != "Application object"
+
+
+class TestMarkdownRendering(TestCase):
+    """The markdown in tickets and comments should only be rendered when
+    it changes, and saves with update_fields should only touch the
+    columns they name."""
+
+    def setUp(self):
+        self.ticket = TicketFactory(description="# A heading")
+        self.comment = FollowUpFactory(ticket=self.ticket, comment="*emphasis*")
+
+    def test_unchanged_ticket_is_not_rendered(self):
+        with mock.patch("tickets.models.markdown") as markdown:
+            self.ticket.title = "A new title"
+            self.ticket.save()
+        markdown.assert_not_called()
+        self.assertIn("<h3>A heading</h3>", self.ticket.description_html)
+
+    def test_changed_ticket_is_rendered(self):
+        self.ticket.description = "# Another heading"
+        self.ticket.save()
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertIn("<h3>Another heading</h3>", ticket.description_html)
+        self.assertEqual(ticket.description_hash, text_hash("# Another heading"))
+
+    def test_update_fields_description_saves_html(self):
+        """the rendered html is saved along with the description even
+        though it is not listed in update_fields."""
+        self.ticket.description = "# Updated"
+        self.ticket.save(update_fields=["description"])
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertIn("<h3>Updated</h3>", ticket.description_html)
+
+    def test_update_fields_status_only(self):
+        """a status change should issue a single UPDATE of the columns
+        it names without rendering the description."""
+        self.ticket.status = "accepted"
+        with mock.patch("tickets.models.markdown") as markdown:
+            with self.assertNumQueries(1):
+                self.ticket.save(update_fields=["status", "updated_on"])
+        markdown.assert_not_called()
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).status, "accepted")
+
+    def test_unchanged_comment_is_not_rendered(self):
+        with mock.patch("tickets.models.markdown") as markdown:
+            self.comment.save()
+        markdown.assert_not_called()
+        self.assertIn("<em>emphasis</em>", self.comment.comment_html)
+
+    def test_changed_comment_is_rendered(self):
+        self.comment.comment = "**strong**"
+        self.comment.save()
+        comment = FollowUp.all_comments.get(pk=self.comment.pk)
+        self.assertIn("<strong>strong</strong>", comment.comment_html)
+
+
+@override_settings(TICKETS_ASYNC_RENDER_THRESHOLD=100, TICKETS_RENDER_WORKERS=0)
+class TestBackgroundRendering(TestCase):
+    """Descriptions and comments longer than
+    TICKETS_ASYNC_RENDER_THRESHOLD are saved as plain text and rendered
+    once the transaction commits."""
+
+    long_text = "# A <b>heading</b>\n\n" + "Some *long* text. " * 10
+
+    def setUp(self):
+        self.ticket = TicketFactory(description="# Short")
+
+    def test_short_description_is_rendered_immediately(self):
+        self.assertIn("<h3>Short</h3>", self.ticket.description_html)
+        self.assertFalse(self.ticket.description_pending)
+        self.assertFalse(RenderTask.objects.exists())
+
+    def test_long_description_is_pending(self):
+        self.ticket.description = self.long_text
+        self.ticket.save()
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertTrue(ticket.description_pending)
+        self.assertIn("&lt;b&gt;heading&lt;/b&gt;", ticket.description_html)
+        self.assertNotIn("<h3>", ticket.description_html)
+        task = RenderTask.objects.get()
+        self.assertEqual((task.kind, task.object_id), ("ticket", self.ticket.pk))
+
+    def test_long_description_is_rendered_after_commit(self):
+        self.ticket.description = self.long_text
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ticket.save()
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertFalse(ticket.description_pending)
+        self.assertIn("<em>long</em>", ticket.description_html)
+        self.assertFalse(RenderTask.objects.exists())
+
+    def test_changed_description_is_not_overwritten(self):
+        """a task queued for an old version of the description should
+        not replace the html of the new one."""
+        self.ticket.description = self.long_text
+        self.ticket.save()
+        self.ticket.description = "# Rewritten"
+        self.ticket.save()
+        self.assertEqual(RenderTask.objects.run_pending(), 1)
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertIn("<h3>Rewritten</h3>", ticket.description_html)
+        self.assertFalse(RenderTask.objects.exists())
+
+    def test_long_comment_is_rendered_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            comment = FollowUpFactory(ticket=self.ticket, comment=self.long_text)
+            self.assertTrue(comment.comment_pending)
+            self.assertNotIn("<em>", comment.comment_html)
+        self.assertEqual(len(callbacks), 1)
+        comment = FollowUp.all_comments.get(pk=comment.pk)
+        self.assertFalse(comment.comment_pending)
+        self.assertIn("<em>long</em>", comment.comment_html)
+        self.assertFalse(RenderTask.objects.exists())
+
+    def test_stale_claims_are_retried(self):
+        """tasks claimed by a worker that never finished are run again,
+        up to MAX_ATTEMPTS times."""
+        self.ticket.description = self.long_text
+        self.ticket.save()
+        old = timezone.now() - RenderTask.STALE_AFTER * 2
+        RenderTask.objects.update(claimed_on=old, attempts=1)
+        self.assertEqual(RenderTask.objects.run_pending(), 1)
+        self.assertFalse(Ticket.objects.get(pk=self.ticket.pk).description_pending)
+
+        self.ticket.description = self.long_text + "more"
+        self.ticket.save()
+        RenderTask.objects.update(claimed_on=old, attempts=RenderTask.MAX_ATTEMPTS)
+        self.assertEqual(RenderTask.objects.run_pending(), 0)
+
+
+class TestTicketCounters(TestCase):
+    """The comment counts and last_activity of a ticket are maintained
+    as its followups are added, changed and deleted."""
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.ticket = TicketFactory(submitted_by=self.user)
+
+    def counters(self):
+        ticket = Ticket.all_tickets.get(pk=self.ticket.pk)
+        return (
+            ticket.comment_count,
+            ticket.private_comment_count,
+            ticket.last_activity,
+        )
+
+    def test_new_ticket(self):
+        comments, private, last_activity = self.counters()
+        self.assertEqual((comments, private), (0, 0))
+        self.assertIsNotNone(last_activity)
+
+    def test_add_followups(self):
+        FollowUpFactory(ticket=self.ticket, submitted_by=self.user)
+        FollowUpFactory(ticket=self.ticket, submitted_by=self.user)
+        followup = FollowUpFactory(
+            ticket=self.ticket, submitted_by=self.user, private=True
+        )
+        comments, private, last_activity = self.counters()
+        self.assertEqual((comments, private), (2, 1))
+        self.assertEqual(last_activity, followup.created_on)
+
+    def test_make_comment_private(self):
+        followup = FollowUpFactory(ticket=self.ticket, submitted_by=self.user)
+        followup.private = True
+        followup.save(update_fields=["private"])
+        self.assertEqual(self.counters()[:2], (0, 1))
+
+    def test_delete_followup(self):
+        first = FollowUpFactory(ticket=self.ticket, submitted_by=self.user)
+        second = FollowUpFactory(ticket=self.ticket, submitted_by=self.user)
+        second.delete()
+        comments, private, last_activity = self.counters()
+        self.assertEqual((comments, private), (1, 0))
+        self.assertEqual(last_activity, first.created_on)
+
+        first.delete()
+        comments, private, last_activity = self.counters()
+        self.assertEqual((comments, private), (0, 0))
+        self.assertEqual(last_activity, self.ticket.created_on)
+
+    def test_delete_ticket(self):
+        """deleting a ticket should not recalculate its counters once for
+        each of its followups."""
+        for i in range(5):
+            FollowUpFactory(ticket=self.ticket, submitted_by=self.user)
+        pk = self.ticket.pk
+        with CaptureQueriesContext(connection) as queries:
+            self.ticket.delete()
+        updates = [
+            x["sql"]
+            for x in queries.captured_queries
+            if x["sql"].startswith('UPDATE "tickets_ticket"')
+        ]
+        self.assertEqual(updates, [])
+        self.assertFalse(FollowUp.all_comments.filter(ticket_id=pk).exists())
+
+        # later deletes of followups still update their ticket
+        ticket = TicketFactory(submitted_by=self.user)
+        FollowUpFactory(ticket=ticket, submitted_by=self.user).delete()
+        self.assertEqual(Ticket.all_tickets.get(pk=ticket.pk).comment_count, 0)
+
+    def test_failed_ticket_delete(self):
+        """if deleting a ticket fails, deleting its followups later should
+        still update its counters."""
+        first = FollowUpFactory(ticket=self.ticket, submitted_by=self.user)
+        FollowUpFactory(ticket=self.ticket, submitted_by=self.user)
+        with mock.patch(
+            "tickets.signals.remove_tickets", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Ticket.all_tickets.filter(pk=self.ticket.pk).delete()
+
+        first.delete()
+        self.assertEqual(self.counters()[:2], (1, 0))
+
+    def test_update_counters(self):
+        """update_counters() should repair counters that are out of sync."""
+        FollowUpFactory(ticket=self.ticket, submitted_by=self.user)
+        Ticket.all_tickets.update(comment_count=10, private_comment_count=3)
+        self.assertEqual(Ticket.all_tickets.update_counters(), 1)
+        self.assertEqual(self.counters()[:2], (1, 0))
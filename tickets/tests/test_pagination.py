@@ -0,0 +1,92 @@
+"""
+Tests for the keyset paginator used by the ticket lists.
+"""
+
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+
+from tickets.models import Ticket
+from tickets.pagination import (
+    KEYSET_ORDERING,
+    InvalidCursor,
+    KeysetPaginator,
+    decode_cursor,
+    encode_cursor,
+)
+from tickets.tests.factories import TicketFactory, UserFactory
+
+
+class TestKeysetPaginator(TestCase):
+    def setUp(self):
+        user = UserFactory()
+        self.tickets = [TicketFactory(submitted_by=user) for i in range(7)]
+
+        # give every ticket a distinct date except tickets 2, 3 and 4
+        # which share one - ties must be broken by id.
+        now = datetime(2020, 6, 1, 12, 0)
+        dates = [now - timedelta(days=x) for x in (0, 1, 2, 2, 2, 3, 4)]
+        for ticket, created_on in zip(self.tickets, dates):
+            Ticket.objects.filter(pk=ticket.pk).update(created_on=created_on)
+
+        self.queryset = Ticket.objects.order_by(*KEYSET_ORDERING)
+        self.expected = list(self.queryset.values_list("pk", flat=True))
+
+    def ids(self, page):
+        return [x.pk for x in page.object_list]
+
+    def test_page_forward(self):
+        """Following the next cursors should return every ticket exactly
+        once, in order."""
+
+        paginator = KeysetPaginator(self.queryset, 3)
+        page = paginator.page()
+        self.assertFalse(page.has_previous())
+        seen = self.ids(page)
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            self.assertTrue(page.has_previous())
+            seen.extend(self.ids(page))
+
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(page.object_list), 1)
+
+    def test_page_backward(self):
+        """The previous cursor should return the tickets on the page
+        before, in the same order they were shown going forward."""
+
+        paginator = KeysetPaginator(self.queryset, 3)
+        page1 = paginator.page()
+        page2 = paginator.page(page1.next_cursor)
+        page3 = paginator.page(page2.next_cursor)
+
+        page = paginator.page(page3.previous_cursor)
+        self.assertEqual(self.ids(page), self.ids(page2))
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.has_previous())
+
+        page = paginator.page(page.previous_cursor)
+        self.assertEqual(self.ids(page), self.ids(page1))
+        self.assertFalse(page.has_previous())
+        self.assertIsNone(page.previous_cursor)
+
+    def test_single_page(self):
+        """If everything fits on one page there are no other pages."""
+        page = KeysetPaginator(self.queryset, 10).page()
+        self.assertEqual(self.ids(page), self.expected)
+        self.assertFalse(page.has_other_pages())
+        self.assertIsNone(page.next_cursor)
+
+    def test_cursor_round_trip(self):
+        ticket = Ticket.objects.get(pk=self.tickets[0].pk)
+        direction, created_on, pk = decode_cursor(encode_cursor("n", ticket))
+        self.assertEqual(direction, "n")
+        self.assertEqual(created_on, ticket.created_on)
+        self.assertEqual(pk, ticket.pk)
+
+    def test_invalid_cursor(self):
+        """Mangled cursors should raise InvalidCursor."""
+        paginator = KeysetPaginator(self.queryset, 3)
+        for cursor in ["garbage", "eHx5fHo", encode_cursor("x", self.tickets[0])]:
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
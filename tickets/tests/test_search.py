@@ -0,0 +1,69 @@
+from django.test import TestCase
+
+from tickets.models import Ticket
+from tickets.search import fts_query, search_backend, search_tickets
+from tickets.tests.factories import FollowUpFactory, TicketFactory, UserFactory
+
+
+def test_fts_query():
+    """Each word should be quoted and used as a prefix, and punctuation
+    should be dropped so it can't break the FTS5 query syntax."""
+    assert fts_query("findme") == '"findme"*'
+    assert fts_query('broken "map" - again?') == '"broken"* "map"* "again"*'
+    assert fts_query("!!!") == ""
+
+
+class TestTicketSearch(TestCase):
+    """The quick search should use the search index, include public
+    comments, and rank title matches above description matches."""
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.ticket1 = TicketFactory(
+            title="Map does not render",
+            description="The basemap is blank when zoomed out.",
+        )
+        self.ticket2 = TicketFactory(
+            title="Export is slow",
+            description="Exporting the map takes several minutes.",
+        )
+        self.ticket3 = TicketFactory(
+            title="Typo on the home page", description="Spelling mistake."
+        )
+
+    def search(self, q):
+        return list(search_tickets(Ticket.objects.all(), q))
+
+    def test_search_uses_index(self):
+        """SQLite builds used for testing include FTS5."""
+        self.assertEqual(search_backend(), "sqlite")
+
+    def test_search_ranks_title_matches_first(self):
+        """Both tickets mention the map, but ticket1 has it in its title."""
+        self.assertEqual(self.search("map"), [self.ticket1, self.ticket2])
+
+    def test_search_all_words_must_match(self):
+        self.assertEqual(self.search("map slow"), [self.ticket2])
+
+    def test_search_includes_public_comments(self):
+        FollowUpFactory(ticket=self.ticket3, comment="Fixed the giraffe spelling.")
+        self.assertEqual(self.search("giraffe"), [self.ticket3])
+
+    def test_search_excludes_private_comments(self):
+        FollowUpFactory(ticket=self.ticket3, comment="Secret giraffe.", private=True)
+        self.assertEqual(self.search("giraffe"), [])
+
+    def test_search_reflects_edits(self):
+        self.ticket3.description = "The aardvark is misspelled."
+        self.ticket3.save()
+        self.assertEqual(self.search("aardvark"), [self.ticket3])
+        self.assertEqual(self.search("spelling"), [])
+
+    def test_deleted_comments_are_removed(self):
+        comment = FollowUpFactory(ticket=self.ticket3, comment="giraffe")
+        comment.delete()
+        self.assertEqual(self.search("giraffe"), [])
+
+    def test_punctuation_only_query(self):
+        """A query without any words falls back to icontains."""
+        self.assertEqual(self.search("!!!"), [])
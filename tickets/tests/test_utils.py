@@ -0,0 +1,158 @@
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.test import TestCase, override_settings
+
+from tickets.cache import get_cache
+from tickets.models import Ticket, render_markdown
+from tickets.tests.factories import ApplicationFactory, TicketFactory, UserFactory
+from tickets.utils import get_link_replacer, insert_all, is_admin, replace_links
+
+TICKET_LINK = {
+    "pattern": r"ticket:\s?(\d+)",
+    "url": r'<a href="/ticket/\1">ticket \1</a>',
+}
+ISSUE_LINK = {
+    "pattern": r"issue #(\d+)",
+    "url": r'<a href="https://github.com/x/y/issues/\1">issue #\1</a>',
+}
+
+
+def test_replace_links():
+    """the text matched by each pattern should become a link."""
+    html = "<p>see ticket: 23 and issue #4</p>"
+    assert replace_links(html, [TICKET_LINK, ISSUE_LINK]) == (
+        '<p>see <a href="/ticket/23">ticket 23</a> and '
+        '<a href="https://github.com/x/y/issues/4">issue #4</a></p>'
+    )
+
+
+def test_replace_links_no_patterns():
+    html = "<p>see ticket: 23</p>"
+    assert replace_links(html, None) == html
+    assert replace_links(html, []) == html
+
+
+def test_replace_links_skips_links_and_code():
+    """text inside existing links, code blocks and image attributes
+    should not be changed."""
+    html = (
+        '<p><a href="/x" title="ticket: 1">ticket: 2</a> '
+        "<code>ticket: 3</code> <pre>ticket: 4</pre> "
+        '<img alt="ticket: 5" src="x.png"> ticket: 6</p>'
+    )
+    expected = html.replace("ticket: 6", '<a href="/ticket/6">ticket 6</a>')
+    assert replace_links(html, [TICKET_LINK]) == expected
+
+
+def test_replace_links_callable_url():
+    """regular expression call backs are supported."""
+    pattern = {"pattern": r"ticket:\s?(\d+)", "url": lambda m: m.group(1) * 2}
+    assert replace_links("ticket: 12", [pattern]) == "1212"
+
+
+def test_link_replacer_is_cached():
+    """the patterns should only be compiled once."""
+    assert get_link_replacer([TICKET_LINK]) is get_link_replacer([TICKET_LINK])
+
+
+def test_link_patterns_setting_change():
+    """changes to the LINK_PATTERNS setting should take effect."""
+    with override_settings(LINK_PATTERNS=[ISSUE_LINK]):
+        html = render_markdown("see issue #7 and ticket: 3")
+    assert 'issues/7">issue #7</a>' in html
+    assert "ticket: 3" in html
+
+
+def test_replace_links_pattern_matches_separator():
+    """a pattern that could match across a skipped block should still
+    leave the skipped html alone."""
+    pattern = {"pattern": r"start.*?end", "url": "X"}
+    html = "start <code>end</code> start end"
+    assert replace_links(html, [pattern]) == "start <code>end</code> X"
+
+
+class TestIsAdmin(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = UserFactory()
+        self.admin_group, created = Group.objects.get_or_create(name="admin")
+
+    def fresh(self, user):
+        """a new instance of user, as loaded by the next request."""
+        return User.objects.get(pk=user.pk)
+
+    def test_anonymous_and_superuser(self):
+        self.assertFalse(is_admin(AnonymousUser()))
+        self.user.is_superuser = True
+        with self.assertNumQueries(0):
+            self.assertTrue(is_admin(self.user))
+
+    def test_is_admin_memoized(self):
+        """group membership is only queried once per user object, and
+        later requests get it from the cache."""
+
+        with self.assertNumQueries(1):
+            self.assertFalse(is_admin(self.user))
+            self.assertFalse(is_admin(self.user))
+
+        user = self.fresh(self.user)
+        with self.assertNumQueries(0):
+            self.assertFalse(is_admin(user))
+
+    def test_adding_user_to_group(self):
+        """changing the user's groups from either side should invalidate
+        the cached value."""
+
+        self.assertFalse(is_admin(self.user))
+        self.user.groups.add(self.admin_group)
+        self.assertTrue(is_admin(self.user))
+        self.assertTrue(is_admin(self.fresh(self.user)))
+
+        self.admin_group.user_set.remove(self.user)
+        self.assertFalse(is_admin(self.fresh(self.user)))
+
+        self.admin_group.user_set.add(self.user)
+        self.assertTrue(is_admin(self.fresh(self.user)))
+
+        self.admin_group.user_set.clear()
+        self.assertFalse(is_admin(self.fresh(self.user)))
+
+    def test_group_renamed_or_deleted(self):
+        self.user.groups.add(self.admin_group)
+        self.assertTrue(is_admin(self.fresh(self.user)))
+
+        self.admin_group.name = "former admins"
+        self.admin_group.save()
+        self.assertFalse(is_admin(self.fresh(self.user)))
+
+        self.admin_group.name = "admin"
+        self.admin_group.save()
+        self.assertTrue(is_admin(self.fresh(self.user)))
+
+        self.admin_group.delete()
+        self.assertFalse(is_admin(self.fresh(self.user)))
+
+
+class TestInsertAll(TestCase):
+    def test_insert_all_sets_ids(self):
+        """the objects get the ids of their rows without being saved one
+        at a time."""
+        user = UserFactory()
+        application = ApplicationFactory()
+        TicketFactory(application=application).delete()
+        tickets = [
+            Ticket(
+                title="Ticket {}".format(i),
+                description="Ticket {}".format(i),
+                priority=3,
+                application=application,
+                submitted_by=user,
+            )
+            for i in range(3)
+        ]
+        with mock.patch.object(Ticket, "save") as save:
+            insert_all(Ticket, tickets)
+        save.assert_not_called()
+        for ticket in tickets:
+            self.assertEqual(Ticket.all_tickets.get(pk=ticket.pk).title, ticket.title)
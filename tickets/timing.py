@@ -0,0 +1,100 @@
+"""
+Lightweight per-request timing of the database, templates and markdown
+rendering.
+
+A RequestTimer is installed by tickets.middleware.TimingMiddleware for
+the requests it samples.  Code that should be timed wraps itself in
+timed('name') - when the current request is not being sampled, timed()
+does nothing but look up a context variable, so it is safe to leave in
+production code paths.
+
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as DjangoTemplate
+
+_timer = ContextVar("tickets_request_timer", default=None)
+
+
+class RequestTimer(object):
+    """Accumulates the number of queries and the time spent in each
+    part of a request."""
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = 0
+        self.durations = {}
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return perf_counter() - self.start
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """A database execute wrapper (see connection.execute_wrapper)
+        that counts and times every query."""
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add("db", perf_counter() - start)
+
+
+def get_timer():
+    """Return the RequestTimer of the current request, or None if the
+    request isn't being timed."""
+    return _timer.get()
+
+
+def set_timer(timer):
+    """Install timer for the current request.  Returns a token that can
+    be passed to reset_timer()."""
+    return _timer.set(timer)
+
+
+def reset_timer(token):
+    _timer.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the with block to the current request's
+    timer under name."""
+    timer = _timer.get()
+    if timer is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, perf_counter() - start)
+
+
+class TimedTemplate(DjangoTemplate):
+    def render(self, context=None, request=None):
+        with timed("template"):
+            return super(TimedTemplate, self).render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The django template backend, with the time spent rendering each
+    template recorded by timed('template').  Included templates are
+    rendered by the engine directly and are part of their parent's
+    time.
+    """
+
+    def from_string(self, template_code):
+        template = super(TimedDjangoTemplates, self).from_string(template_code)
+        return TimedTemplate(template.template, self)
+
+    def get_template(self, template_name):
+        template = super(TimedDjangoTemplates, self).get_template(template_name)
+        return TimedTemplate(template.template, self)
@@ -1,15 +1,52 @@
 from django.conf.urls import url
 from django.urls import path
 
+from . import api
 from .views import *
 
 app_name = "tickets"
 
+# the ticket lists - (route, name, kwargs).  Each list is also exported
+# by export_tickets under "export/<fmt>/<route>" as "export_<name>" (see
+# ExportLinksMixin), and changed in bulk by bulk_update_tickets under
+# "bulk/<route>" as "bulk_<name>" (see BulkActionMixin).
+TICKET_LISTS = [
+    ("", "ticket_list", {}),
+    ("mytickets/<str:username>/", "my_ticket_list", {}),
+    ("assinged_to/<str:username>/", "assigned_to", {"what": "assigned_to"}),
+    ("submitted_by/<str:username>/", "submitted_by", {"what": "submitted_by"}),
+    ("open/", "open_tickets", {"status": "open"}),
+    ("closed/", "closed_tickets", {"status": "closed"}),
+    ("bugreports/", "bug_reports", {"type": "bug"}),
+    ("featurerequests/", "feature_requests", {"type": "feature"}),
+    ("tasks/", "tasks", {"type": "task"}),
+    ("tagged/<slug:slug>/", "tickets_tagged_with", {}),
+]
+
+
+def list_patterns(prefix, view, name_prefix="", views=None):
+    """Return a path() for each of the TICKET_LISTS under prefix, named
+    name_prefix + name.  Each is served by view, or by views[name] if
+    there is one."""
+    views = views or {}
+    return [
+        path(
+            prefix + route,
+            view=views.get(name, view),
+            name=name_prefix + name,
+            kwargs=kwargs,
+        )
+        for route, name, kwargs in TICKET_LISTS
+    ]
+
+
 urlpatterns = [
     path("<int:pk>/", view=TicketDetailView.as_view(), name="ticket_detail"),
     path("new/", view=TicketUpdateView, name="new_ticket"),
     path("update/<int:pk>/", view=TicketUpdateView, name="update_ticket"),
     path("upvote/<int:pk>/", view=upvote_ticket, name="upvote_ticket"),
+    path("vote/<int:pk>/", view=vote_ticket, name="vote_ticket"),
+    path("users/", view=user_autocomplete, name="user_autocomplete"),
     path(
         "close/<int:pk>/",
         view=TicketCommentView,
@@ -42,56 +79,18 @@ urlpatterns = [
     ),
     path("split/<int:pk>/", view=SplitTicketView, name="split_ticket"),
     # ===========
-    # Ticket Lists
-    path("", view=TicketListView.as_view(), name="ticket_list"),
-    path(
-        "mytickets/<str:username>/",
-        view=TicketListView.as_view(),
-        name="my_ticket_list",
-    ),
-    path(
-        "assinged_to/<str:username>/",
-        view=TicketListView.as_view(),
-        name="assigned_to",
-        kwargs={"what": "assigned_to"},
-    ),
-    path(
-        "submitted_by/<str:username>/",
-        view=TicketListView.as_view(),
-        name="submitted_by",
-        kwargs={"what": "submitted_by"},
-    ),
-    path(
-        "open/",
-        view=TicketListView.as_view(),
-        name="open_tickets",
-        kwargs={"status": "open"},
-    ),
-    path(
-        "closed/",
-        view=TicketListView.as_view(),
-        name="closed_tickets",
-        kwargs={"status": "closed"},
-    ),
-    path(
-        "bugreports/",
-        view=TicketListView.as_view(),
-        name="bug_reports",
-        kwargs={"type": "bug"},
-    ),
-    path(
-        "featurerequests/",
-        view=TicketListView.as_view(),
-        name="feature_requests",
-        kwargs={"type": "feature"},
-    ),
-    path(
-        "tasks/", view=TicketListView.as_view(), name="tasks", kwargs={"type": "task"}
-    ),
-    # project tags
-    # path('tag/<slug:slug>', TagIndexView.as_view(),
-    #     name='tagged'),
-    path(
-        "tagged/<slug:slug>/", view=TagIndexView.as_view(), name="tickets_tagged_with"
+    # Ticket Lists, and the csv and json exports of each of them
+    *list_patterns(
+        "",
+        TicketListView.as_view(),
+        views={"tickets_tagged_with": TagIndexView.as_view()},
     ),
+    *list_patterns("export/<str:fmt>/", export_tickets, "export_"),
+    # ===========
+    # bulk changes to each of the ticket lists
+    *list_patterns("bulk/", bulk_update_tickets, "bulk_"),
+    # ===========
+    # read-only json api
+    path("api/", view=api.ticket_list, name="api_ticket_list"),
+    path("api/<int:pk>/", view=api.ticket_detail, name="api_ticket_detail"),
 ]
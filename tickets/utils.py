@@ -1,12 +1,122 @@
+import re
+from functools import lru_cache
+
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+
+from .cache import ADMIN_KEY, get_cache, get_timeout
+
+# html that the link patterns are never applied to: existing links,
+# code and preformatted blocks, and images (so their attributes are
+# never rewritten).  The text between them is joined with SEPARATOR
+# while the patterns are applied.
+SEPARATOR = "\x00"
+SKIP_HTML = r"<a\b.*?</a\s*>|<code\b.*?</code\s*>|<pre\b.*?</pre\s*>|<img\b[^>]*>"
+
+
 def is_admin(user):
     """
     return true if the user belongs to the admin group, false otherwise
+
+    The result is remembered on the user object, so repeated checks
+    during a request are free, and group membership is cached between
+    requests (see tickets.signals for the invalidation).
     """
-    if user.groups.filter(name="admin").exists() or user.is_superuser:
+    if user.is_superuser:
         return True
-    else:
+    if not user.is_authenticated:
         return False
 
+    try:
+        return user._tickets_is_admin
+    except AttributeError:
+        pass
+
+    cache = get_cache()
+    key = ADMIN_KEY.format(user.pk)
+    admin = cache.get(key)
+    if admin is None:
+        admin = user.groups.filter(name="admin").exists()
+        cache.set(key, admin, get_timeout("TICKETS_ADMIN_CACHE_TIMEOUT", 3600))
+    user._tickets_is_admin = admin
+    return admin
+
+
+class LinkReplacer(object):
+    """
+    Replace the text matched by a list of link patterns with
+    hyperlinks.  The patterns are compiled once when the replacer is
+    created, and are only applied to the text between existing
+    links, code blocks and images.
+
+    link_patterns is a list of dictionaries with the keys 'pattern'
+    and 'url' (see replace_links()).
+
+    Note - the patterns are applied one after the other rather than as
+    a single alternation: each pattern keeps the literal prefix that
+    lets the regex engine skip ahead, which is much faster than
+    testing every alternative at every position.
+
+    """
+
+    skip = re.compile(SKIP_HTML, re.IGNORECASE | re.DOTALL)
+
+    def __init__(self, link_patterns):
+        self.patterns = [
+            (re.compile(x["pattern"], re.IGNORECASE), x["url"]) for x in link_patterns
+        ]
+
+    def replace(self, text):
+        if not self.patterns:
+            return text
+        skipped = self.skip.findall(text)
+        if not skipped:
+            return self.replace_text(text)
+
+        # run each pattern once over all of the text between the
+        # skipped blocks, joined with a separator the patterns are
+        # (almost certainly) unable to match.
+        segments = self.skip.split(text)
+        if SEPARATOR not in text:
+            replaced = self.replace_text(SEPARATOR.join(segments)).split(SEPARATOR)
+            if len(replaced) == len(segments):
+                segments = replaced
+            else:
+                segments = [self.replace_text(x) for x in segments]
+        else:
+            segments = [self.replace_text(x) for x in segments]
+
+        pieces = [segments[0]]
+        for html, segment in zip(skipped, segments[1:]):
+            pieces.append(html)
+            pieces.append(segment)
+        return "".join(pieces)
+
+    def replace_text(self, text):
+        for regex, url in self.patterns:
+            text = regex.sub(url, text)
+        return text
+
+
+@lru_cache(maxsize=32)
+def _link_replacer(patterns):
+    return LinkReplacer([{"pattern": x[0], "url": x[1]} for x in patterns])
+
+
+def get_link_replacer(link_patterns):
+    """Return a compiled LinkReplacer for link_patterns.  Replacers are
+    cached, so the patterns are only compiled the first time they are
+    used (or after the LINK_PATTERNS setting changes)."""
+    patterns = tuple((x["pattern"], x["url"]) for x in link_patterns or [])
+    return _link_replacer(patterns)
+
+
+@receiver(setting_changed)
+def clear_link_replacers(setting, **kwargs):
+    if setting == "LINK_PATTERNS":
+        _link_replacer.cache_clear()
+
 
 def replace_links(text, link_patterns):
     """
@@ -19,14 +129,34 @@ def replace_links(text, link_patterns):
     expression call backs are supported.  See the python documentation
     for re.sub for more details.
 
+    Text inside existing <a>, <code> and <pre> elements, and <img>
+    tags, is left unchanged.
+
     Note: The function does not make any attempt to validate the link or
     the regex pattern.
 
     """
 
-    import re
+    return get_link_replacer(link_patterns).replace(text)
+
+
+def insert_all(model, objects):
+    """Insert objects with a single bulk_create() and set their primary
+    keys.  Like bulk_create(), this doesn't call save() or send any
+    signals.
 
-    for pattern in link_patterns:
-        regex = re.compile(pattern.get("pattern"), re.IGNORECASE)
-        text = re.sub(regex, pattern["url"], text)
-    return text
+    sqlite (with django 3.2) can't return the ids of a bulk insert, but
+    it holds a write lock from the first insert until the transaction
+    ends and numbers new rows in the order they are inserted - so there
+    the new rows are the last len(objects) rows of the table."""
+    objects = list(objects)
+    manager = model._base_manager
+    if connection.features.can_return_rows_from_bulk_insert:
+        manager.bulk_create(objects)
+        return
+    with transaction.atomic():
+        manager.bulk_create(objects)
+        ids = manager.order_by("-pk").values_list("pk", flat=True)
+        ids = list(ids[: len(objects)])
+    for obj, pk in zip(objects, reversed(ids)):
+        obj.pk = pk
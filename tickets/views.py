@@ -1,49 +1,147 @@
-from collections import OrderedDict
+from functools import partial
 
 from django.contrib import messages
-from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
-from django.http import HttpResponseRedirect
+from django.http import (
+    Http404,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_POST
 from django.views.generic import DetailView
 from django.views.generic.list import ListView
 from taggit.models import Tag
 
-from .filters import TicketFilter
+from .cache import get_cache_alias, get_timeout
+from .choices import USER_CHOICES, find_users, user_label
+from .conditional import etag, ticket_state
+from .export import CONTENT_TYPES, STREAMS
+from .facets import get_tag_facets, get_ticket_filters
+from .filters import TicketFilter, filter_tickets
 from .forms import (
     AcceptTicketForm,
     AssignTicketForm,
+    BulkTicketForm,
     CloseTicketForm,
     CommentTicketForm,
     SplitTicketForm,
     TicketForm,
 )
-from .models import FollowUp, Ticket, UserVoteLog
+from .models import FollowUp, Ticket, TicketDuplicate, UserVoteLog
+from .pagination import KEYSET_ORDERING, KeysetPaginationMixin
 from .utils import is_admin
 
-User = get_user_model()
-
 
 class TagMixin(object):
     def get_context_data(self, **kwargs):
         context = super(TagMixin, self).get_context_data(**kwargs)
         tag_slug = self.kwargs.get("slug")
-        context["tag"] = Tag.objects.filter(slug=tag_slug).first()
-        context["tags"] = Tag.objects.all()
+        if tag_slug:
+            context["tag"] = Tag.objects.filter(slug=tag_slug).first()
+        return context
+
+
+def list_query(request):
+    """Return the GET parameters of a ticket list that select its
+    tickets (i.e. without the page or cursor) as a query string."""
+    query = request.GET.copy()
+    query.pop("page", None)
+    query.pop("cursor", None)
+    return "?" + query.urlencode() if query else ""
+
+
+class ExportLinksMixin(object):
+    """Add the urls of the csv and json exports of a ticket list to the
+    context as 'export_urls'.  Each list url has a matching export url
+    named 'export_<list url name>'."""
+
+    def get_context_data(self, **kwargs):
+        context = super(ExportLinksMixin, self).get_context_data(**kwargs)
+        match = self.request.resolver_match
+        export_name = "tickets:export_{}".format(match.url_name)
+        query = list_query(self.request)
+        context["export_urls"] = [
+            (fmt, reverse(export_name, kwargs=dict(match.kwargs, fmt=fmt)) + query)
+            for fmt in STREAMS
+        ]
+        return context
+
+
+class BulkActionMixin(object):
+    """Add a BulkTicketForm for the tickets in a ticket list, and the url
+    it is posted to, to the context of admins as 'bulk_form' and
+    'bulk_url'.  Each list url has a matching url named
+    'bulk_<list url name>'."""
+
+    def get_context_data(self, **kwargs):
+        context = super(BulkActionMixin, self).get_context_data(**kwargs)
+        if is_admin(self.request.user):
+            match = self.request.resolver_match
+            bulk_name = "tickets:bulk_{}".format(match.url_name)
+            context["bulk_form"] = BulkTicketForm(user=self.request.user)
+            url = reverse(bulk_name, kwargs=match.kwargs)
+            context["bulk_url"] = url + list_query(self.request)
         return context
 
 
-class TagIndexView(TagMixin, ListView):
+class TagIndexView(
+    BulkActionMixin, ExportLinksMixin, KeysetPaginationMixin, TagMixin, ListView
+):
     template_name = "tickets/ticket_list.html"
     model = Ticket
     paginate_by = 50  # RECORDS_PER_PAGE
 
     def get_queryset(self):
-        return Ticket.objects.filter(tags__slug=self.kwargs.get("slug"))
+        tickets = Ticket.objects.for_list().order_by(*KEYSET_ORDERING)
+        return filter_tickets(tickets, self.kwargs, self.request.GET)
+
+
+def detail_page_state(request, pk):
+    """Return the ticket_state() of ticket pk plus the parts of the
+    detail page that depend on the user - who they are, if they have
+    voted and any messages waiting to be shown.  None if the ticket
+    doesn't exist."""
+    state = ticket_state(request, pk)
+    if state is None:
+        return None
+    if "page_key" not in state:
+        user = request.user
+        if user.is_authenticated:
+            state["has_voted"] = UserVoteLog.objects.filter(
+                ticket_id=pk, user=user
+            ).exists()
+        else:
+            state["has_voted"] = False
+        state["page_key"] = etag(
+            state["key"],
+            user.pk,
+            user.is_staff,
+            state["has_voted"],
+            len(messages.get_messages(request)),
+        )
+    return state
+
 
+def detail_page_etag(request, pk):
+    state = detail_page_state(request, pk)
+    return state["page_key"] if state else None
 
+
+def detail_page_last_modified(request, pk):
+    state = ticket_state(request, pk)
+    return state["last_modified"] if state else None
+
+
+@method_decorator(
+    condition(
+        etag_func=detail_page_etag, last_modified_func=detail_page_last_modified
+    ),
+    name="dispatch",
+)
 class TicketDetailView(DetailView):
     """
     A view to render details of a single ticket.
@@ -57,6 +155,30 @@ class TicketDetailView(DetailView):
         a list of :model:`tickets.FollowUp` objects associated with this
         ticket.
 
+    ``has_voted``
+        True if the current user has already voted for this ticket.
+
+    ``originals``
+        :model:`tickets.TicketDuplicate` objects for the tickets this
+        ticket duplicates.
+
+    ``duplicates``
+        :model:`tickets.TicketDuplicate` objects for the tickets that
+        duplicate this ticket.
+
+    ``parent``
+        the :model:`tickets.Ticket` this ticket was split from, or None.
+
+    ``children``
+        the :model:`tickets.Ticket` objects split from this ticket.
+
+    ``render_key``, ``cache_alias``, ``cache_timeout``
+        used to cache the description, comments and related tickets
+        (see tickets.conditional).
+
+    The page is served with an ETag and Last-Modified header, and
+    conditional requests get a 304 if nothing has changed.
+
     **Template:**
 
     :template:`/tickets/ticket_detail.html`
@@ -65,40 +187,73 @@ class TicketDetailView(DetailView):
 
     model = Ticket
 
+    def get_queryset(self):
+        """Fetch the ticket along with the objects it refers to and its
+        tags, so rendering the page doesn't require a query for each of
+        them."""
+        return Ticket.all_tickets.select_related(
+            "application", "submitted_by", "assigned_to", "parent"
+        ).prefetch_related("tags")
+
     def get_context_data(self, **kwargs):
         """Get the comments associated with this ticket.  Only include
         the public comments unless  request.user is an admin or
-        created the ticket
+        created the ticket.  The related tickets (duplicates, originals,
+        parent and children) are added to the context as querysets
+        so the template only evaluates each of them once.
         """
 
         context = super(TicketDetailView, self).get_context_data(**kwargs)
         user = self.request.user
-        pk = context["ticket"].id
-        ticket = Ticket.objects.get(id=pk)
-        if is_admin(user) or user == ticket.submitted_by:
-            comments = FollowUp.all_comments.filter(ticket__pk=pk).order_by(
-                "-created_on"
-            )
-        else:
-            comments = FollowUp.objects.filter(ticket__pk=pk).order_by("-created_on")
-        context["comments"] = comments
+        ticket = self.object
 
-        if ticket and user:
-            voter_ids = [x[0] for x in ticket.uservotelog_set.values_list("user_id")]
-            has_voted = user.id in voter_ids
+        if user.is_authenticated and (user == ticket.submitted_by or is_admin(user)):
+            comments = FollowUp.all_comments.filter(ticket=ticket)
         else:
-            has_voted = False
+            comments = FollowUp.objects.filter(ticket=ticket)
+        context["comments"] = comments.select_related("submitted_by").order_by(
+            "-created_on"
+        )
+
+        state = detail_page_state(self.request, ticket.pk)
+        context["has_voted"] = state["has_voted"]
+
+        # the description, comments and related tickets are cached
+        # until anything about the ticket changes.
+        context["render_key"] = state["key"]
+        context["cache_alias"] = get_cache_alias()
+        context["cache_timeout"] = get_timeout("TICKETS_DETAIL_CACHE_TIMEOUT", 3600)
 
-        context["has_voted"] = has_voted
+        context["originals"] = TicketDuplicate.objects.filter(
+            ticket=ticket
+        ).select_related("original")
+        context["duplicates"] = TicketDuplicate.objects.filter(
+            original=ticket
+        ).select_related("ticket")
+
+        parent = ticket.parent
+        context["parent"] = parent if parent and parent.active else None
+        context["children"] = Ticket.objects.filter(parent=ticket)
 
         return context
 
 
-class TicketListViewBase(TagMixin, ListView):
-    """A base class for all ticket listviews."""
+class TicketListViewBase(
+    BulkActionMixin, ExportLinksMixin, KeysetPaginationMixin, TagMixin, ListView
+):
+    """A base class for all ticket listviews.  Tickets are paginated
+    with a cursor rather than a page number (see tickets.pagination),
+    except for search results which are ordered by relevance."""
 
     model = Ticket
     filterset_class = TicketFilter
+    paginate_by = 50  # RECORDS_PER_PAGE
+
+    def get_queryset(self):
+        """Narrow the tickets with each of the url kwargs and GET
+        parameters - see tickets.filters.filter_tickets()."""
+        tickets = Ticket.objects.for_list().order_by(*KEYSET_ORDERING)
+        return filter_tickets(tickets, self.kwargs, self.request.GET)
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
@@ -108,42 +263,68 @@ class TicketListViewBase(TagMixin, ListView):
         return context
 
 
-def get_ticket_filters():
-    """Return a dictionary that will be used to create the dynamic filters
-    on the fitler lists.  There will be one element for each filter
-    (status, application, ticket type, priority, submitted by, and
-    assigned to).
-
+def export_tickets(request, fmt, **kwargs):
     """
+    Stream the tickets in one of the ticket lists as csv or json.  The
+    url kwargs and GET parameters are the same as the corresponding
+    ticket list (see tickets.urls), so any list can be exported by
+    adding export/<fmt>/ to the front of its url.
 
-    values = Ticket.TICKET_STATUS_CHOICES
-    status = [x[0] for x in values]
-
-    values = sorted(Ticket.TICKET_PRIORITY_CHOICES, key=lambda x: x[0])
-    priority = [x[1] for x in values]
+    The rows are read in chunks and written as they are read (see
+    tickets.export), so large exports run in constant memory.
 
-    values = Ticket.TICKET_TYPE_CHOICES
-    ticket_types = [x[1] for x in values]
+    """
+    if fmt not in STREAMS:
+        raise Http404("Unknown export format.")
 
-    values = Ticket.objects.values_list("application__application").distinct()
-    applications = [x[0] for x in values]
+    tickets = Ticket.objects.order_by(*KEYSET_ORDERING)
+    tickets = filter_tickets(tickets, kwargs, request.GET)
 
-    values = Ticket.objects.values_list("submitted_by__username").distinct()
-    submitted_by = [x[0] for x in values]
+    response = StreamingHttpResponse(
+        STREAMS[fmt](tickets), content_type=CONTENT_TYPES[fmt]
+    )
+    response["Content-Disposition"] = 'attachment; filename="tickets.{}"'.format(fmt)
+    return response
 
-    values = Ticket.objects.values_list("assigned_to__username").distinct()
-    assigned_to = [x[0] for x in values]
 
-    ticket_filters = OrderedDict()
+@login_required
+@require_POST
+def bulk_update_tickets(request, **kwargs):
+    """
+    Close, assign, re-prioritize or tag all of the tickets in one of
+    the ticket lists (see BulkTicketForm).  The url kwargs and GET
+    parameters are the same as the corresponding ticket list (see
+    tickets.urls), and the user is redirected back to that list with a
+    message saying how many tickets were changed.  Only admins can
+    make bulk changes.
 
-    ticket_filters["status"] = status
-    ticket_filters["application"] = list(set(applications))
-    ticket_filters["priority"] = priority
-    ticket_filters["type"] = ticket_types
-    ticket_filters["submitted_by"] = list(set(submitted_by))
-    ticket_filters["assigned_to"] = list(set(assigned_to))
+    The tickets are changed with set-based queries in a single
+    transaction (see tickets.bulk), so the time taken barely depends
+    on the number of tickets.
 
-    return ticket_filters
+    """
+    match = request.resolver_match
+    list_name = "tickets:{}".format(match.url_name[len("bulk_") :])
+    next_url = reverse(list_name, kwargs=kwargs) + list_query(request)
+
+    if not is_admin(request.user):
+        msg = "Only admins can change more than one ticket at a time."
+        messages.add_message(request, messages.ERROR, msg)
+        return HttpResponseRedirect(next_url)
+
+    form = BulkTicketForm(request.POST, user=request.user)
+    if form.is_valid():
+        tickets = filter_tickets(Ticket.objects.all(), kwargs, request.GET)
+        ids = form.save(tickets)
+        msg = "{} ticket(s) updated.".format(len(ids))
+        messages.add_message(request, messages.SUCCESS, msg)
+    else:
+        errors = "; ".join(
+            "{}: {}".format(field, " ".join(x)) for field, x in form.errors.items()
+        )
+        msg = "The tickets were not updated ({}).".format(errors)
+        messages.add_message(request, messages.ERROR, msg)
+    return HttpResponseRedirect(next_url)
 
 
 class TicketListView(TicketListViewBase):
@@ -194,59 +375,14 @@ class TicketListView(TicketListViewBase):
         if what:
             context["what"] = what.replace("_", " ")
 
-        related_tags = (
-            Tag.objects.filter(ticket__id__in=self.object_list)
-            .annotate(count=Count("id"))
-            .order_by()
-        )
-        context["related_tags"] = related_tags
+        # the tag sidebar is cached - only count the tags if it is rendered.
+        # It is the same on every page of a list, so it is cached under
+        # the list's url without the page or cursor.
+        context["related_tags"] = partial(get_tag_facets, self.object_list)
+        context["tag_sidebar_key"] = self.request.path + list_query(self.request)
 
         return context
 
-    def get_queryset(self):
-        q = self.request.GET.get("q")
-        username = self.kwargs.get("username", None)
-        what = self.kwargs.get("what", None)
-        ticket_type = self.kwargs.get("type", None)
-        ticket_status = self.kwargs.get("status", None)
-
-        tickets = Ticket.objects.order_by("-created_on").prefetch_related(
-            "application", "submitted_by", "assigned_to"
-        )
-        if q:
-            tickets = tickets.filter(
-                Q(description__icontains=q) | Q(title__icontains=q)
-            )
-        if username:
-            if what == "submitted_by":
-                tickets = tickets.filter(submitted_by__username=username)
-            elif what == "assigned_to":
-                tickets = tickets.filter(assigned_to__username=username)
-            else:
-                tickets = tickets.filter(
-                    Q(submitted_by__username=username)
-                    | Q(assigned_to__username=username)
-                )
-
-        if ticket_type:
-            tickets = tickets.filter(ticket_type=ticket_type).order_by("-created_on")
-
-        if ticket_status:
-            closed_codes = ["closed", "split", "duplicate"]
-            if ticket_status == "closed":
-                tickets = Ticket.objects.filter(status__in=closed_codes).order_by(
-                    "-created_on"
-                )
-            else:
-                tickets = Ticket.objects.exclude(status__in=closed_codes).order_by(
-                    "-created_on"
-                )
-
-        # finally - django_filter
-        tickets_qs = TicketFilter(self.request.GET, queryset=tickets)
-
-        return tickets_qs.qs
-
 
 @login_required
 def TicketUpdateView(request, pk=None, template_name="tickets/ticket_form.html"):
@@ -439,20 +575,73 @@ def upvote_ticket(request, pk):
     re-directed back to the detail view for the ticket in question.
 
     """
-    ticket = Ticket.objects.get(pk=pk)
-    try:
-        user = User.objects.get(id=request.user.id)
-    except User.DoesNotExist:
-        user = None
-
-    if user:
-        item, created = UserVoteLog.objects.get_or_create(ticket=ticket, user=user)
-        if ticket and created:
-            ticket.up_vote()
-            msg = "Your vote was successfully registered!"
-            messages.add_message(request, messages.SUCCESS, msg)
-        if ticket and created is False:
-            msg = "It Looks like you already vote for this ticket!"
-            messages.add_message(request, messages.WARNING, msg)
+    ticket = get_object_or_404(Ticket, pk=pk)
+
+    if ticket.add_vote(request.user):
+        msg = "Your vote was successfully registered!"
+        messages.add_message(request, messages.SUCCESS, msg)
+    else:
+        msg = "It Looks like you already vote for this ticket!"
+        messages.add_message(request, messages.WARNING, msg)
 
     return HttpResponseRedirect(ticket.get_absolute_url())
+
+
+@require_POST
+def vote_ticket(request, pk):
+    """
+    Register a vote for a ticket and return the new vote count as
+    json.  Used by the vote button on the ticket detail page so that
+    voting does not require a redirect and a full re-render of the
+    ticket.
+
+    **Response:**
+
+    ``ticket``
+        the id of the ticket.
+
+    ``votes``
+        the number of votes for the ticket.
+
+    ``voted``
+        true if this request added a vote, false if the user had
+        already voted for the ticket.
+
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "You must be logged in to vote."}, status=403)
+
+    ticket = get_object_or_404(Ticket, pk=pk)
+    voted = ticket.add_vote(request.user)
+
+    return JsonResponse(
+        {"ticket": ticket.id, "votes": ticket.votes, "voted": voted},
+        status=201 if voted else 200,
+    )
+
+
+def user_autocomplete(request):
+    """
+    Return the users whose username, first or last name start with the
+    'q' GET parameter as json.  Used by the user fields of the assign
+    and split forms when TICKETS_USER_AUTOCOMPLETE is True, so the
+    forms don't have to list every user.  'users' selects the kind of
+    user (see tickets.choices.USER_CHOICES).  Only available to admins.
+
+    **Response:**
+
+    ``results``
+        a list of up to 20 users, each with an ``id`` and ``text``
+        (the label shown in the select).
+
+    """
+    if not is_admin(request.user):
+        return JsonResponse({"error": "Permission denied."}, status=403)
+
+    users = request.GET.get("users", "users")
+    if users not in USER_CHOICES:
+        return JsonResponse({"error": "Unknown users."}, status=400)
+
+    q = request.GET.get("q", "").strip()
+    results = [{"id": x.pk, "text": user_label(x)} for x in find_users(users, q)]
+    return JsonResponse({"results": results})